@@ -1,12 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from pymongo import MongoClient
-from bson import ObjectId
+from pymongo import MongoClient, DESCENDING
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 import random
 import requests
 import os
 from dotenv import load_dotenv
+from indexes import ensure_indexes
+from icons import ICON_KEYS
+import auth
+import habit_storage
+import habit_stats
+import feedback_outbox
+import http_client
+import request_metrics
+import mongo_config
+import rate_limit
+import search
+import bulk
+import user_stats
+from repositories import (
+    EntryRepository, HabitRepository, UserRepository, RevisionRepository, UserStatsRepository,
+    without_revision
+)
+from pagination import parse_limit, parse_entry_fields, encode_cursor, decode_cursor, ndjson_page
+import serialization
+import compression
+from metrics import render_value
+from news_cache import TTLCache, MemoryCacheBackend, MongoCacheBackend
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -25,27 +47,143 @@ if chat_id:
 print("=" * 50)
 
 app = Flask(__name__)
-CORS(app)
-
-# Подключение к MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['diary_db']
-entries_collection = db['entries']
-users_collection = db['users']
-habits_collection = db['habits']
-
-# Список иконок для случайного выбора (ключи)
-ICON_KEYS = [
-    'pen', 'book', 'heart', 'star', 'lightbulb', 
-    'feather', 'quote', 'bookOpen', 'scroll', 'clock',
-    'nature', 'sunny', 'night', 'cloud', 'flower',
-    'journal', 'iobook', 'create', 'pencil', 'bibookopen'
-]
+# Retry-After нужен клиенту при ответах 429 и 503
+CORS(app, expose_headers=['Retry-After'])
+serialization.init_app(app)
+# Хуки after_request выполняются в обратном порядке: метрики подключены
+# раньше сжатия, поэтому видят размер уже сжатого ответа
+request_metrics.init_app(app)
+compression.init_app(app)
 
+# Подключение к MongoDB и фоновые службы создаются в create_app(), а не при
+# импорте: каждый воркер gunicorn получает свой MongoClient уже после fork
+client = None
+db = None
+entries_collection = None
+users_collection = None
+habits_collection = None
+imports_collection = None
+revision_repo = None
+entry_repo = None
+habit_repo = None
+user_repo = None
+stats_repo = None
+router = None
+feedback_queue = None
+feedback_dispatcher = None
+news_cache = None
+search_engine = None
+auth_service = None
+admission = None
+habit_stats_cache = habit_stats.HabitStatsCache()
+
+def init_db(mongo_client=None):
+    global client, db, entries_collection, users_collection, habits_collection, imports_collection
+    global revision_repo, entry_repo, habit_repo, user_repo, stats_repo, router
+    client = mongo_client or MongoClient(
+        mongo_config.uri(),
+        event_listeners=request_metrics.mongo_listeners(),
+        **mongo_config.client_options(default_pool_size=20)
+    )
+    db = client[mongo_config.db_name()]
+    router = mongo_config.create_router()
+    entries_collection = db['entries']
+    users_collection = db['users']
+    habits_collection = db['habits']
+    imports_collection = db['imports']
+    revision_repo = RevisionRepository(
+        db['revisions'],
+        db['tombstones'],
+        tombstone_ttl=int(os.getenv('SYNC_TOMBSTONE_TTL', str(90 * 24 * 3600)))
+    )
+    stats_repo = UserStatsRepository(db['user_stats'])
+    entry_repo = EntryRepository(entries_collection, revision_repo, stats_repo)
+    habit_repo = HabitRepository(habits_collection, revision_repo)
+    user_repo = UserRepository(users_collection)
+
+def create_app(mongo_client=None):
+    """Подключает базу и запускает фоновые службы. Повторный вызов ничего не делает."""
+    global feedback_queue, feedback_dispatcher, news_cache, search_engine, auth_service, admission
+    if client is not None:
+        return app
+    
+    init_db(mongo_client)
+    
+    # Создаем индексы (если они уже есть, ничего не происходит)
+    _, failed_indexes = ensure_indexes(db)
+    for name, error in failed_indexes:
+        print(f"Не удалось создать индекс {name}: {error}")
+    
+    news_cache = create_news_cache()
+    search_engine = search.create_engine(entries_collection, revisions=revision_repo)
+    auth_service = auth.create_auth(user_repo)
+    
+    # Сброс нагрузки и ограничение частоты запросов (до обработчиков маршрутов)
+    admission = rate_limit.create_admission(db, request_metrics.pool_listener.recent_wait, rate_limit_key)
+    admission.init_app(app)
+    
+    # Очередь обратной связи и фоновая отправка в Telegram
+    feedback_queue = feedback_outbox.create_outbox(db)
+    if os.getenv('FEEDBACK_DISPATCHER', 'on') != 'off':
+        feedback_dispatcher = feedback_outbox.create_dispatcher(feedback_queue)
+        if feedback_dispatcher:
+            feedback_dispatcher.start()
+    
+    return app
+
+def shutdown(timeout=10):
+    """Останавливает фоновые службы и закрывает соединения с MongoDB."""
+    global client, feedback_dispatcher
+    if feedback_dispatcher:
+        feedback_dispatcher.stop(timeout)
+        feedback_dispatcher = None
+    if client is not None:
+        client.close()
+        client = None
+
+# Проверка токена перед обработчиком маршрута: user_id кладется в g.user_id
+login_required = auth.require_auth(lambda: auth_service)
+
+def rate_limit_key():
+    return rate_limit.client_key(auth_service, request.headers.get('Authorization'), request.remote_addr)
+
+# ===== РЕВИЗИИ И УСЛОВНЫЕ ЗАПРОСЫ =====
+
+def revision_etag(user_id, revision=None):
+    # Данные пользователя меняются только вместе с его ревизией, поэтому
+    # для одного адреса запроса ревизия однозначно задает ответ
+    revision = revision or revision_repo.state(user_id)
+    return f"{user_id}-{revision['rev']}"
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Браузер хранит ответ, но перед использованием переспрашивает сервер
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Authorization')
+    return response
+
+# Репозиторий с настройками чтения и записи текущего маршрута (mongo_config.Router).
+# Ревизия всегда читается с primary: по ней видно, менял ли пользователь данные
+# недавно, и тогда чтение тоже остается на primary
+def reader(target, revision):
+    return router.reader(target, request.endpoint, revision['changed_at'])
+
+def writer(target):
+    return router.writer(target, request.endpoint)
+
+def not_modified(etag):
+    """Ответ 304, если у клиента уже есть эта версия, иначе None."""
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+# Случайная иконка для новой записи
 def get_random_icon_key():
     return random.choice(ICON_KEYS)
 
-# Регистрация пользователя (простая, без хеширования - учебный пример)
+AUTH_BUSY_RESPONSE = {'error': 'Сервер перегружен, попробуйте войти через несколько секунд'}
+
+# Регистрация пользователя
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     try:
@@ -57,24 +195,30 @@ def register():
             return jsonify({'error': 'Имя пользователя и пароль обязательны'}), 400
         
         # Проверяем, существует ли пользователь
-        if users_collection.find_one({'username': username}):
+        if user_repo.find_by_username(username, {'_id': 1}):
             return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
         
-        # Создаем пользователя (пароль в открытом виде - учебный пример!)
+        # Создаем пользователя (хранится только хеш пароля)
         user = {
             'username': username,
-            'password': password,  # В реальном проекте нужно хешировать!
+            'password': auth_service.hasher.hash(password),
             'created_at': datetime.now().isoformat()
         }
         
-        result = users_collection.insert_one(user)
-        user_id = str(result.inserted_id)
+        try:
+            user_id = writer(user_repo).create(user)
+        except DuplicateKeyError:
+            # Пользователь с тем же именем успел зарегистрироваться параллельно
+            return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
         
         return jsonify({
             'message': 'Пользователь успешно создан',
             'user_id': user_id,
-            'username': username
+            'username': username,
+            'token': auth_service.issue_token(user_id)
         }), 201
+    except auth.AuthBusy:
+        return jsonify(AUTH_BUSY_RESPONSE), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -90,50 +234,114 @@ def login():
             return jsonify({'error': 'Имя пользователя и пароль обязательны'}), 400
         
         # Находим пользователя
-        user = users_collection.find_one({'username': username})
+        user = user_repo.find_by_username(username, {'password': 1})
         
         if not user:
             return jsonify({'error': 'Неверное имя пользователя или пароль'}), 401
         
-        # Проверяем пароль (простое сравнение - учебный пример!)
-        if user['password'] != password:
+        ok, needs_rehash = auth_service.hasher.verify(user.get('password'), password)
+        if not ok:
             return jsonify({'error': 'Неверное имя пользователя или пароль'}), 401
         
+        user_id = str(user['_id'])
+        # Пароль в открытом виде или со старым числом итераций пересчитываем
+        if needs_rehash:
+            user_repo.set_password(user_id, auth_service.hasher.hash(password))
+        
         return jsonify({
             'message': 'Вход выполнен успешно',
-            'user_id': str(user['_id']),
-            'username': username
+            'user_id': user_id,
+            'username': username,
+            'token': auth_service.issue_token(user_id)
         }), 200
+    except auth.AuthBusy:
+        return jsonify(AUTH_BUSY_RESPONSE), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Получить все записи текущего пользователя
+# Получить записи текущего пользователя
+#
+# Параметры:
+#   limit  - размер страницы (без него возвращается вся история, как раньше)
+#   after  - курсор следующей страницы из ответа предыдущего запроса
+#   fields - список полей через запятую, например fields=title,date,icon
+#   format - ndjson для потоковой выдачи по одной записи в строке
 @app.route('/api/entries', methods=['GET'])
+@login_required
 def get_entries():
     try:
-        # Получаем user_id из параметров запроса
-        user_id = request.args.get('user_id')
+        user_id = g.user_id
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            after = decode_cursor(request.args.get('after'))
+            projection = parse_entry_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        revision = revision_repo.state(user_id)
+        etag = revision_etag(user_id, revision)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        cursor = reader(entry_repo, revision).page(user_id, after, projection, limit)
+        
+        if request.args.get('format') == 'ndjson':
+            return with_etag(Response(
+                stream_with_context(ndjson_page(cursor, limit)),
+                mimetype='application/x-ndjson'
+            ), etag)
+        
+        entries = []
+        next_cursor = None
+        for entry in cursor:
+            if limit and len(entries) == limit:
+                next_cursor = encode_cursor(entries[-1])
+                break
+            entries.append(entry)
+        
+        if not limit:
+            return with_etag(jsonify(entries), etag), 200
+        
+        return with_etag(jsonify({'entries': entries, 'next_cursor': next_cursor}), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Поиск по заголовкам и тексту записей
+@app.route('/api/entries/search', methods=['GET'])
+@login_required
+def search_entries():
+    try:
+        user_id = g.user_id
+        
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'error': 'Требуется поисковый запрос'}), 400
         
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
+        try:
+            limit = parse_limit(request.args.get('limit')) or 20
+            after = search.decode_cursor(request.args.get('after'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        entries = list(entries_collection.find({'user_id': user_id}).sort('date', -1))
-        # Конвертируем ObjectId в строку для JSON
-        for entry in entries:
-            entry['_id'] = str(entry['_id'])
-        return jsonify(entries), 200
+        results, next_cursor = search_engine.search(user_id, query, limit, after)
+        
+        return jsonify({
+            'results': results,
+            'next_cursor': next_cursor,
+            'engine': search_engine.name
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Создать новую запись
 @app.route('/api/entries', methods=['POST'])
+@login_required
 def create_entry():
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
+        user_id = g.user_id
         
         new_entry = {
             'user_id': user_id,
@@ -143,68 +351,111 @@ def create_entry():
             'icon': get_random_icon_key()
         }
         
-        result = entries_collection.insert_one(new_entry)
-        new_entry['_id'] = str(result.inserted_id)
+        writer(entry_repo).create(new_entry)
+        search_engine.index_entry(new_entry)
         
-        return jsonify(new_entry), 201
+        return jsonify(without_revision(new_entry)), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Обновить запись
 @app.route('/api/entries/<entry_id>', methods=['PUT'])
+@login_required
 def update_entry(entry_id):
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
-        
-        # Проверяем, что запись принадлежит пользователю
-        entry = entries_collection.find_one({'_id': ObjectId(entry_id), 'user_id': user_id})
-        if not entry:
-            return jsonify({'error': 'Запись не найдена'}), 404
+        user_id = g.user_id
         
         update_data = {
             'title': data.get('title'),
             'content': data.get('content'),
         }
         
-        result = entries_collection.update_one(
-            {'_id': ObjectId(entry_id), 'user_id': user_id},
-            {'$set': update_data}
-        )
+        # Проверка владельца, изменение и чтение результата - один запрос
+        updated_entry = writer(entry_repo).update(user_id, entry_id, update_data)
+        if not updated_entry:
+            return jsonify({'error': 'Запись не найдена'}), 404
         
-        # Получаем обновленную запись
-        updated_entry = entries_collection.find_one({'_id': ObjectId(entry_id)})
-        updated_entry['_id'] = str(updated_entry['_id'])
+        search_engine.index_entry(updated_entry)
         
-        return jsonify(updated_entry), 200
+        return jsonify(without_revision(updated_entry)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Удалить запись
 @app.route('/api/entries/<entry_id>', methods=['DELETE'])
+@login_required
 def delete_entry(entry_id):
     try:
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
-        
-        result = entries_collection.delete_one({'_id': ObjectId(entry_id), 'user_id': user_id})
+        user_id = g.user_id
         
-        if result.deleted_count == 0:
+        if not writer(entry_repo).delete(user_id, entry_id):
             return jsonify({'error': 'Запись не найдена'}), 404
         
+        search_engine.remove_entry(user_id, entry_id)
+        
         return jsonify({'message': 'Запись успешно удалена'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Проверка здоровья сервера
+# Статистика записей: по неделям, часам, дням недели и иконкам
+# Параметры запроса:
+#   weeks - сколько последних недель вернуть (по умолчанию все)
+@app.route('/api/stats', methods=['GET'])
+@login_required
+def get_stats():
+    try:
+        user_id = g.user_id
+        
+        weeks = request.args.get('weeks')
+        if weeks is not None:
+            if not weeks.isdigit() or int(weeks) < 1:
+                return jsonify({'error': 'Параметр weeks должен быть положительным числом'}), 400
+            weeks = int(weeks)
+        
+        etag = f"{revision_etag(user_id)}-{weeks or 'all'}"
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Статистика хранится готовой: одно чтение по _id вместо обхода записей
+        stats = user_stats.public(stats_repo.get(user_id), weeks)
+        
+        return with_etag(jsonify(stats), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Проверка здоровья сервера и связи с MongoDB
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'message': 'Сервер работает'}), 200
+    started = datetime.now()
+    try:
+        client.admin.command('ping')
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Нет связи с MongoDB',
+            'error': str(e)
+        }), 503
+    ping_ms = (datetime.now() - started).total_seconds() * 1000
+    
+    return jsonify({
+        'status': 'ok',
+        'message': 'Сервер работает',
+        'mongo': {
+            'ping_ms': round(ping_ms, 2),
+            'pool_saturation': round(request_metrics.pool_listener.saturation(), 3),
+            'pools': request_metrics.pool_listener.stats()
+        }
+    }), 200
+
+# Метрики в формате Prometheus
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    extra = []
+    for key, value in news_cache.stats().items():
+        extra.extend(render_value(f"diary_news_cache_{key}", 'gauge', f"Кэш новостей: {key}", value))
+    return Response(request_metrics.render(extra), mimetype='text/plain; version=0.0.4')
 
 # Отправка обратной связи в Telegram
 @app.route('/api/feedback', methods=['POST'])
@@ -238,71 +489,71 @@ def send_feedback():
 ⏰ <b>Время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}
 """
         
-        # Отправляем сообщение в Telegram
-        telegram_url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
-        telegram_data = {
-            'chat_id': chat_id,
-            'text': telegram_message,
-            'parse_mode': 'HTML'
-        }
-        
-        response = requests.post(telegram_url, json=telegram_data, timeout=10)
-        
-        if response.status_code != 200:
-            print(f"Telegram API error: {response.text}")
-            return jsonify({'error': 'Не удалось отправить сообщение. Попробуйте позже.'}), 500
+        # Сообщение сохраняется в очередь и отправляется в Telegram фоновым
+        # потоком, поэтому медленный Telegram не задерживает ответ
+        feedback_queue.enqueue(telegram_message)
         
         return jsonify({
-            'message': 'Сообщение успешно отправлено',
+            'message': 'Сообщение принято и скоро будет доставлено',
             'success': True
         }), 200
         
-    except requests.exceptions.RequestException as e:
-        print(f"Network error: {str(e)}")
-        return jsonify({'error': 'Ошибка сети. Проверьте подключение к интернету.'}), 500
     except Exception as e:
         print(f"Error sending feedback: {str(e)}")
         return jsonify({'error': 'Произошла ошибка при отправке сообщения.'}), 500
 
+# Состояние очереди обратной связи
+@app.route('/api/feedback/status', methods=['GET'])
+def get_feedback_status():
+    try:
+        stats = feedback_queue.stats()
+        stats['dispatcher_running'] = bool(feedback_dispatcher and feedback_dispatcher.is_alive())
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ===== HABITS ENDPOINTS =====
 
 # Получить все привычки пользователя
 @app.route('/api/habits', methods=['GET'])
+@login_required
 def get_habits():
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
+        user_id = g.user_id
         
-        habits = list(habits_collection.find({'user_id': user_id}))
+        revision = revision_repo.state(user_id)
+        etag = revision_etag(user_id, revision)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        for habit in habits:
-            habit['_id'] = str(habit['_id'])
+        habits = [habit_storage.to_api(habit) for habit in reader(habit_repo, revision).list(user_id)]
         
-        return jsonify(habits), 200
+        return with_etag(jsonify(habits), etag), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Создать новую привычку
 @app.route('/api/habits', methods=['POST'])
+@login_required
 def create_habit():
     try:
         data = request.json
-        user_id = data.get('user_id')
+        user_id = g.user_id
         name = data.get('name')
         
-        if not user_id or not name:
+        if not name:
             return jsonify({'error': 'Требуется название привычки'}), 400
         
         new_habit = {
             'user_id': user_id,
             'name': name,
-            'completed_dates': [],
+            **habit_storage.empty_completions(),
             'created_at': datetime.utcnow().isoformat()
         }
         
-        result = habits_collection.insert_one(new_habit)
-        new_habit['_id'] = str(result.inserted_id)
+        writer(habit_repo).create(new_habit)
+        habit_storage.to_api(new_habit)
         
         return jsonify(new_habit), 201
     except Exception as e:
@@ -310,66 +561,379 @@ def create_habit():
 
 # Переключить выполнение привычки (добавить/удалить дату)
 @app.route('/api/habits/<habit_id>/toggle', methods=['POST'])
+@login_required
 def toggle_habit(habit_id):
     try:
         data = request.json
-        user_id = data.get('user_id')
+        user_id = g.user_id
         date = data.get('date')  # формат: YYYY-MM-DD
         
-        if not user_id or not date:
+        if not date:
             return jsonify({'error': 'Требуется дата'}), 400
         
-        habit = habits_collection.find_one({
-            '_id': ObjectId(habit_id),
-            'user_id': user_id
-        })
-        
-        if not habit:
-            return jsonify({'error': 'Привычка не найдена'}), 404
-        
-        completed_dates = habit.get('completed_dates', [])
+        try:
+            habit_storage.date_to_day(date)
+        except ValueError:
+            return jsonify({'error': 'Дата должна быть в формате YYYY-MM-DD'}), 400
         
-        if date in completed_dates:
-            # Удаляем дату (снимаем галочку)
-            completed_dates.remove(date)
-        else:
-            # Добавляем дату (ставим галочку)
-            completed_dates.append(date)
+        # Проверка наличия даты и изменение списка выполняются сервером
+        # за один запрос, поэтому параллельные переключения не теряются
+        updated_habit = writer(habit_repo).toggle(user_id, habit_id, date)
         
-        habits_collection.update_one(
-            {'_id': ObjectId(habit_id)},
-            {'$set': {'completed_dates': completed_dates}}
-        )
+        if not updated_habit:
+            return jsonify({'error': 'Привычка не найдена'}), 404
         
-        updated_habit = habits_collection.find_one({'_id': ObjectId(habit_id)})
-        updated_habit['_id'] = str(updated_habit['_id'])
+        habit_stats_cache.invalidate(habit_id)
+        habit_storage.to_api(updated_habit)
         
         return jsonify(updated_habit), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Статистика привычек: серии, доля выполнения, тепловая карта за год
+@app.route('/api/habits/stats', methods=['GET'])
+@login_required
+def get_habits_stats():
+    try:
+        user_id = g.user_id
+        
+        today = datetime.now().date()
+        try:
+            year = int(request.args.get('year', today.year))
+        except ValueError:
+            return jsonify({'error': 'Параметр year должен быть числом'}), 400
+        if not 1970 <= year <= 9998:
+            return jsonify({'error': 'Некорректный год'}), 400
+        
+        # Сначала только ревизии: отметки загружаются для привычек, статистики
+        # которых нет в кэше (ревизия читается вместе с отметками, чтобы
+        # запомнить результат под той версией, по которой он посчитан)
+        habits = list(habit_repo.list(user_id, {'name': 1, '_rev': 1}))
+        cached = {habit['_id']: habit_stats_cache.get(habit['_id'], habit.get('_rev'), today, year)
+                  for habit in habits}
+        missing = [habit_id for habit_id, result in cached.items() if result is None]
+        if missing:
+            for habit in habit_repo.completions(user_id, missing):
+                cached[habit['_id']] = habit_stats_cache.compute(habit, today, year)
+        
+        stats = []
+        for habit in habits:
+            if cached.get(habit['_id']) is None:
+                # Привычку удалили между запросами
+                continue
+            stats.append({
+                '_id': habit['_id'],
+                'name': habit.get('name'),
+                **cached[habit['_id']]
+            })
+        
+        return jsonify({
+            'today': today.isoformat(),
+            'year': year,
+            'habits': stats
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Удалить привычку
 @app.route('/api/habits/<habit_id>', methods=['DELETE'])
+@login_required
 def delete_habit(habit_id):
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
-        
-        result = habits_collection.delete_one({
-            '_id': ObjectId(habit_id),
-            'user_id': user_id
-        })
+        user_id = g.user_id
         
-        if result.deleted_count == 0:
+        if not writer(habit_repo).delete(user_id, habit_id):
             return jsonify({'error': 'Привычка не найдена'}), 404
         
+        habit_stats_cache.invalidate(habit_id)
+        
         return jsonify({'message': 'Привычка успешно удалена'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ===== IMPORT / EXPORT ENDPOINTS =====
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+
+def run_import(kind, collection, validate, on_batch=None):
+    user_id = g.user_id
+    
+    importer = bulk.Importer(writer(collection), imports_collection, validate, IMPORT_BATCH_SIZE)
+    try:
+        job = importer.start(user_id, kind, request.args.get('import_id'))
+    except bulk.ImportConflict:
+        return jsonify({'error': 'Импорт с таким import_id уже запущен'}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if job['kind'] != kind:
+        return jsonify({'error': 'Импорт с таким import_id относится к другим данным'}), 400
+    if job['status'] == bulk.DONE:
+        return jsonify(bulk.public_job(job)), 200
+    
+    gzipped = (request.headers.get('Content-Encoding') == 'gzip'
+               or request.mimetype in ('application/gzip', 'application/x-gzip'))
+    try:
+        job = importer.run(
+            job,
+            bulk.read_lines(request.stream, gzipped),
+            on_batch,
+            after_batch=lambda docs: revision_repo.stamp(user_id, collection, [doc['_id'] for doc in docs])
+        )
+    except Exception as e:
+        job = imports_collection.find_one({'_id': job['_id']})
+        result = bulk.public_job(job)
+        result['error'] = f"Импорт прерван: {str(e)}"
+        return jsonify(result), 500
+    
+    return jsonify(bulk.public_job(job)), 200
+
+def export_response(cursor, filename, prepare=None):
+    lines = bulk.export_ndjson(cursor, prepare)
+    if request.args.get('gzip') == '1':
+        return Response(
+            stream_with_context(bulk.gzip_stream(lines)),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename={filename}.ndjson.gz'}
+        )
+    return Response(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}.ndjson'}
+    )
+
+# Импорт записей из NDJSON (одна запись в строке, можно сжать gzip)
+@app.route('/api/entries/import', methods=['POST'])
+@login_required
+def import_entries():
+    def on_batch(docs):
+        user_id = docs[0]['user_id']
+        # Индекс поиска пользователя перестроится при следующем запросе
+        search_engine.invalidate(user_id)
+        stats_repo.apply(user_id, user_stats.total(docs))
+    
+    return run_import('entries', entries_collection, bulk.entry_validator(ICON_KEYS), on_batch)
+
+# Импорт привычек из NDJSON
+@app.route('/api/habits/import', methods=['POST'])
+@login_required
+def import_habits():
+    return run_import('habits', habits_collection, bulk.validate_habit)
+
+# Состояние импорта
+@app.route('/api/imports/<import_id>', methods=['GET'])
+@login_required
+def get_import(import_id):
+    user_id = g.user_id
+    
+    job = imports_collection.find_one({'_id': bulk.job_key(user_id, import_id), 'user_id': user_id})
+    if not job:
+        return jsonify({'error': 'Импорт не найден'}), 404
+    return jsonify(bulk.public_job(job)), 200
+
+# Экспорт всех записей пользователя в NDJSON
+@app.route('/api/entries/export', methods=['GET'])
+@login_required
+def export_entries():
+    user_id = g.user_id
+    
+    cursor = entries_collection.find({'user_id': user_id}, {'user_id': 0, '_rev': 0}).sort(
+        [('date', DESCENDING), ('_id', DESCENDING)]
+    ).batch_size(500)
+    return export_response(cursor, 'diary-entries')
+
+# Экспорт всех привычек пользователя в NDJSON
+@app.route('/api/habits/export', methods=['GET'])
+@login_required
+def export_habits():
+    user_id = g.user_id
+    
+    cursor = habits_collection.find({'user_id': user_id}, {'user_id': 0, '_rev': 0}).batch_size(500)
+    return export_response(cursor, 'diary-habits', habit_storage.to_api)
+
+# ===== SYNC ENDPOINTS =====
+
+# Изменения записей и привычек после ревизии since
+#
+# since=0 (или ревизия больше текущей, например после очистки базы) - полная
+# выдача с full: true. Удаления хранятся SYNC_TOMBSTONE_TTL секунд: клиент,
+# который не синхронизировался дольше, должен запросить since=0.
+@app.route('/api/sync', methods=['GET'])
+@login_required
+def sync():
+    try:
+        user_id = g.user_id
+        
+        try:
+            since = int(request.args.get('since', '0'))
+        except ValueError:
+            return jsonify({'error': 'Параметр since должен быть числом'}), 400
+        if since < 0:
+            return jsonify({'error': 'Параметр since не может быть отрицательным'}), 400
+        
+        # Ревизия читается до изменений: то, что запишется во время запроса,
+        # придет еще раз в следующей синхронизации
+        revision = revision_repo.current(user_id)
+        full = since == 0 or since > revision
+        result = {
+            'revision': revision,
+            'full': full,
+            'entries': [],
+            'habits': [],
+            'deleted': {'entries': [], 'habits': []}
+        }
+        # since=0 - всегда полная выдача: у пользователя с данными до появления
+        # ревизий документа в revisions нет и ревизия тоже равна 0
+        if not full and since == revision:
+            return jsonify(result), 200
+        
+        since = None if full else since
+        result['entries'] = list(entry_repo.changed_since(user_id, since))
+        result['habits'] = [habit_storage.to_api(habit) for habit in habit_repo.changed_since(user_id, since)]
+        if not full:
+            for tombstone in revision_repo.deleted_since(user_id, since):
+                result['deleted'][tombstone['kind']].append(tombstone['doc_id'])
+        
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ===== CALENDAR ENDPOINTS =====
+
+def parse_month(value):
+    # YYYY-MM -> границы месяца в формате дат, которые хранятся в базе
+    try:
+        month_start = datetime.strptime(value, '%Y-%m')
+    except (TypeError, ValueError):
+        raise ValueError('Параметр month должен быть в формате YYYY-MM')
+    if month_start.month == 12:
+        month_end = month_start.replace(year=month_start.year + 1, month=1)
+    else:
+        month_end = month_start.replace(month=month_start.month + 1)
+    return month_start.strftime('%Y-%m-%d'), month_end.strftime('%Y-%m-%d')
+
+# Сводка по дням месяца: записи и выполнение привычек
+@app.route('/api/calendar', methods=['GET'])
+@login_required
+def get_calendar():
+    try:
+        user_id = g.user_id
+        
+        try:
+            start, end = parse_month(request.args.get('month'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Ответ зависит от месяца, поэтому он входит в ETag
+        etag = f"{revision_etag(user_id)}-{start[:7]}"
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Даты записей хранятся строками ISO, поэтому диапазон месяца -
+        # это диапазон строк, который обслуживает индекс (user_id, date)
+        entries_by_day = entries_collection.aggregate([
+            {'$match': {'user_id': user_id, 'date': {'$gte': start, '$lt': end}}},
+            {'$sort': {'date': 1}},
+            {'$group': {
+                '_id': {'$substrCP': ['$date', 0, 10]},
+                'count': {'$sum': 1},
+                'entries': {'$push': {
+                    '_id': {'$toString': '$_id'},
+                    'title': '$title',
+                    'icon': '$icon'
+                }}
+            }}
+        ])
+        
+        habits_by_day = habits_collection.aggregate([
+            {'$match': {'user_id': user_id}},
+            {'$project': {'dates': habit_storage.month_dates_expr(start, end)}},
+            {'$unwind': '$dates'},
+            {'$group': {
+                '_id': '$dates',
+                'completed': {'$sum': 1},
+                'habit_ids': {'$push': {'$toString': '$_id'}}
+            }}
+        ])
+        habits_total = habit_repo.count(user_id)
+        
+        days = {}
+        
+        def day(date):
+            if date not in days:
+                days[date] = {
+                    'entries_count': 0,
+                    'entries': [],
+                    'habits_completed': 0,
+                    'habits_total': habits_total,
+                    'habit_ids': [],
+                    'habit_ratio': 0
+                }
+            return days[date]
+        
+        for group in entries_by_day:
+            item = day(group['_id'])
+            item['entries_count'] = group['count']
+            item['entries'] = group['entries']
+        
+        for group in habits_by_day:
+            item = day(group['_id'])
+            item['habits_completed'] = group['completed']
+            item['habit_ids'] = group['habit_ids']
+            if habits_total:
+                item['habit_ratio'] = round(group['completed'] / habits_total, 3)
+        
+        return with_etag(jsonify({
+            'month': start[:7],
+            'habits_total': habits_total,
+            'days': days
+        }), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ===== NEWS ENDPOINTS =====
 
+NEWS_API_URL = os.getenv('NEWS_API_URL', 'https://newsapi.org/v2/everything')
+
+# Для русского языка используем эндпоинт 'everything' с поисковым запросом
+NEWS_CATEGORY_KEYWORDS = {
+    'technology': 'технологии OR гаджеты OR IT',
+    'business': 'бизнес OR экономика OR финансы',
+    'science': 'наука OR исследования',
+    'health': 'здоровье OR медицина',
+    'sports': 'спорт OR футбол OR хоккей',
+    'entertainment': 'развлечения OR кино OR музыка',
+    'general': 'новости OR события'
+}
+
+class NewsAPIError(Exception):
+    pass
+
+def create_news_cache():
+    ttl = int(os.getenv('NEWS_CACHE_TTL', '300'))
+    stale_ttl = int(os.getenv('NEWS_CACHE_STALE_TTL', '600'))
+    if os.getenv('NEWS_CACHE_BACKEND', 'memory') == 'mongo':
+        backend = MongoCacheBackend(db['news_cache'], max_age=ttl + stale_ttl)
+    else:
+        backend = MemoryCacheBackend(max_size=int(os.getenv('NEWS_CACHE_SIZE', '64')))
+    return TTLCache(backend, ttl=ttl, stale_ttl=stale_ttl)
+
+def fetch_news(keyword, news_api_key):
+    params = {
+        'apiKey': news_api_key,
+        'q': keyword,
+        'language': 'ru',
+        'sortBy': 'publishedAt',
+        'pageSize': 12
+    }
+    
+    response = http_client.get_client('newsapi').get(NEWS_API_URL, params=params)
+    
+    if response.status_code != 200:
+        raise NewsAPIError(response.text)
+    
+    return response.json().get('articles', [])
+
 # Получить новости по категории
 @app.route('/api/news', methods=['GET'])
 def get_news():
@@ -396,41 +960,19 @@ def get_news():
                 ]
             }), 200
         
-        # Формируем запрос к NewsAPI
-        # Для русского языка используем эндпоинт 'everything' с поисковым запросом
-        category_keywords = {
-            'technology': 'технологии OR гаджеты OR IT',
-            'business': 'бизнес OR экономика OR финансы',
-            'science': 'наука OR исследования',
-            'health': 'здоровье OR медицина',
-            'sports': 'спорт OR футбол OR хоккей',
-            'entertainment': 'развлечения OR кино OR музыка',
-            'general': 'новости OR события'
-        }
-        
-        keyword = category_keywords.get(category, 'новости')
-        
-        news_url = 'https://newsapi.org/v2/everything'
-        params = {
-            'apiKey': news_api_key,
-            'q': keyword,
-            'language': 'ru',
-            'sortBy': 'publishedAt',
-            'pageSize': 12
-        }
-        
-        response = requests.get(news_url, params=params, timeout=10)
-        
-        if response.status_code != 200:
-            print(f"NewsAPI error: {response.text}")
-            return jsonify({'error': 'Не удалось загрузить новости'}), 500
+        keyword = NEWS_CATEGORY_KEYWORDS.get(category, 'новости')
         
-        data = response.json()
+        # Ответ зависит только от ключевых слов категории, поэтому все
+        # пользователи делят один кэшированный запрос к NewsAPI
+        articles = news_cache.get(keyword, lambda: fetch_news(keyword, news_api_key))
         
         return jsonify({
-            'articles': data.get('articles', [])
+            'articles': articles
         }), 200
         
+    except NewsAPIError as e:
+        print(f"NewsAPI error: {str(e)}")
+        return jsonify({'error': 'Не удалось загрузить новости'}), 500
     except requests.exceptions.RequestException as e:
         print(f"Network error: {str(e)}")
         return jsonify({'error': 'Ошибка подключения к сервису новостей'}), 500
@@ -438,24 +980,31 @@ def get_news():
         print(f"Error fetching news: {str(e)}")
         return jsonify({'error': 'Произошла ошибка при загрузке новостей'}), 500
 
+# Статистика кэша новостей
+@app.route('/api/news/cache', methods=['GET'])
+def get_news_cache_stats():
+    return jsonify(news_cache.stats()), 200
+
+# Состояние внешних сервисов: предохранитель, задержки и ошибки
+@app.route('/api/upstreams', methods=['GET'])
+def get_upstreams():
+    return jsonify(http_client.all_stats()), 200
+
 # Получить предпочтения пользователя
 @app.route('/api/user/preferences', methods=['GET'])
+@login_required
 def get_user_preferences():
     try:
-        user_id = request.args.get('user_id')
+        user_id = g.user_id
         
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
+        def load():
+            return reader(user_repo, revision_repo.state(user_id)).get_preferences(user_id)
         
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
+        preferences = auth_service.get_preferences(user_id, load)
         
-        if not user:
+        if preferences is None:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
-        preferences = {
-            'news_category': user.get('news_category', 'technology')
-        }
-        
         return jsonify(preferences), 200
         
     except Exception as e:
@@ -464,19 +1013,17 @@ def get_user_preferences():
 
 # Сохранить предпочтения пользователя
 @app.route('/api/user/preferences', methods=['POST'])
+@login_required
 def save_user_preferences():
     try:
         data = request.json
-        user_id = data.get('user_id')
+        user_id = g.user_id
         news_category = data.get('news_category')
         
-        if not user_id:
-            return jsonify({'error': 'Требуется авторизация'}), 401
-        
-        users_collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': {'news_category': news_category}}
-        )
+        writer(user_repo).set_preferences(user_id, {'news_category': news_category})
+        # Новая ревизия: следующее чтение настроек пойдет на primary
+        revision_repo.bump(user_id)
+        auth_service.preferences.delete(user_id)
         
         return jsonify({
             'message': 'Предпочтения сохранены',
@@ -488,7 +1035,10 @@ def save_user_preferences():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # Сервер разработки. Для продакшена: gunicorn -c gunicorn.conf.py wsgi:app
+    # (Linux/Mac) или python serve.py (Windows)
     print("Starting Flask server...")
-    print("MongoDB connected to: diary_db")
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    create_app()
+    print(f"MongoDB connected to: {db.name}")
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', port=int(os.getenv('PORT', '5000')), host='0.0.0.0')
 
@@ -0,0 +1,554 @@
+"""Асинхронный сервер основных маршрутов: Quart + Motor.
+
+Обслуживает вход, записи, статистику, привычки и настройки с теми же адресами и ответами,
+что и app.py, но обработчики не блокируют поток на время запросов к MongoDB:
+один процесс держит тысячи одновременных соединений.
+
+Остальные маршруты (поиск, импорт, календарь, новости, обратная связь)
+по-прежнему обслуживает app.py. Его кэши в памяти (индекс поиска, статистика
+привычек) сверяются с ревизией пользователя и ревизией привычки, поэтому
+изменения, сделанные через этот сервер, видят без отдельного уведомления.
+
+Перед обработчиками работают те же сброс нагрузки и лимиты частоты
+(rate_limit.Admission) с теми же переменными окружения, метрики запросов
+отдаются на /api/metrics. Ответы общих маршрутов сравниваются с app.py
+в tests/test_asgi.py.
+
+Запуск:
+    pip install -r requirements-async.txt
+    hypercorn asgi:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+from functools import wraps
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from quart import Quart, Response, g, jsonify, request
+    from quart.wrappers.response import DataBody
+except ImportError as e:
+    raise ImportError('Для асинхронного сервера установите зависимости: '
+                      'pip install -r requirements-async.txt') from e
+
+import auth
+import compression
+import habit_storage
+import mongo_config
+import rate_limit
+import request_metrics
+from icons import ICON_KEYS
+from pagination import decode_cursor, encode_cursor, ndjson_page, parse_entry_fields, parse_limit
+import serialization
+import user_stats
+from repositories import (
+    AsyncEntryRepository, AsyncHabitRepository, AsyncRevisionRepository, AsyncUserRepository,
+    AsyncUserStatsRepository, without_revision
+)
+
+load_dotenv()
+
+app = Quart(__name__)
+serialization.init_app(app)
+compression_options = compression.settings()
+
+client = None
+revision_repo = None
+entry_repo = None
+habit_repo = None
+stats_repo = None
+user_repo = None
+router = None
+auth_service = None
+admission = None
+admission_client = None
+
+
+def init_db(mongo_client=None):
+    global client, revision_repo, entry_repo, habit_repo, user_repo, stats_repo, auth_service, router
+    # Ожидание соединения из пула нужно для сброса нагрузки (rate_limit.py)
+    client = mongo_client or AsyncIOMotorClient(
+        mongo_config.uri(),
+        event_listeners=[request_metrics.pool_listener],
+        **mongo_config.client_options(default_pool_size=100)
+    )
+    db = client[mongo_config.db_name()]
+    router = mongo_config.create_router()
+    revision_repo = AsyncRevisionRepository(
+        db['revisions'],
+        db['tombstones'],
+        tombstone_ttl=int(os.getenv('SYNC_TOMBSTONE_TTL', str(90 * 24 * 3600)))
+    )
+    stats_repo = AsyncUserStatsRepository(db['user_stats'])
+    entry_repo = AsyncEntryRepository(db['entries'], revision_repo, stats_repo)
+    habit_repo = AsyncHabitRepository(db['habits'], revision_repo)
+    user_repo = AsyncUserRepository(db['users'])
+    auth_service = auth.create_auth(user_repo)
+    init_admission()
+
+
+def init_admission():
+    """Сброс нагрузки и ограничение частоты с теми же настройками, что и в app.py."""
+    global admission, admission_client
+    db = None
+    if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+        # Хранилище лимитов работает через PyMongo, проверка идет в отдельном потоке
+        admission_client = MongoClient(mongo_config.uri(), **mongo_config.client_options(default_pool_size=10))
+        db = admission_client[mongo_config.db_name()]
+    admission = rate_limit.create_admission(db, request_metrics.pool_listener.recent_wait, rate_limit_key)
+
+
+@app.before_serving
+async def startup():
+    # Клиент Motor привязан к циклу событий, поэтому создается при старте сервера
+    if client is None:
+        init_db()
+
+
+@app.after_serving
+async def shutdown():
+    global client, admission_client
+    if client is not None:
+        client.close()
+        client = None
+    if admission_client is not None:
+        admission_client.close()
+        admission_client = None
+
+
+def rate_limit_key():
+    return rate_limit.client_key(auth_service, request.headers.get('Authorization'), request.remote_addr)
+
+
+@app.before_request
+async def start_metrics():
+    g.metrics_started = time.perf_counter()
+
+
+@app.before_request
+async def admit_request():
+    rule = request.url_rule.rule if request.url_rule else None
+    args = (request.endpoint, rule, request.method, admission.client_key)
+    if admission_client is not None:
+        # asyncio.to_thread копирует контекст, поэтому request доступен и в потоке
+        admitted, rejection = await asyncio.to_thread(admission.check, *args)
+    else:
+        admitted, rejection = admission.check(*args)
+    g.admitted = admitted
+    if rejection:
+        body, status, headers = rejection
+        return jsonify(body), status, headers
+    return None
+
+
+@app.teardown_request
+async def release_request(exc):
+    if g.pop('admitted', False):
+        admission.release()
+
+
+@app.after_request
+async def add_cors_headers(response):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+    # Retry-After нужен клиенту при ответах 429 и 503
+    response.headers['Access-Control-Expose-Headers'] = 'Retry-After'
+    return response
+
+
+# Хуки after_request выполняются в обратном порядке: метрики видят уже сжатый ответ
+@app.after_request
+async def record_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    size = response.content_length if isinstance(response.response, DataBody) else None
+    request_metrics.observe_request(route, request.method, response.status_code,
+                                    time.perf_counter() - started, size=size)
+    return response
+
+
+@app.after_request
+async def compress_response(response):
+    # Потоковые ответы не сжимаем, как и в app.py (compression.init_app)
+    if not isinstance(response.response, DataBody):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+    data = await response.get_data()
+    if not compression.should_compress(response, len(data), compression_options['min_size']):
+        return response
+    response.set_data(compression.compress(data, encoding, compression_options))
+    compression.mark_compressed(response, encoding)
+    return response
+
+
+async def run_blocking(fn, *args):
+    # Хеширование паролей уходит в пул auth, цикл событий не ждет его
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def current_user_id():
+    claimed = request.args.get('user_id')
+    if claimed is None and request.is_json:
+        claimed = auth.claimed_user_id(await request.get_json(silent=True))
+    token = auth.bearer_token(request.headers.get('Authorization'))
+    user_id = None
+    if token:
+        user_id = auth_service.principals.get(token)
+        if user_id is None:
+            user_id = auth_service.decode_token(token)
+            if user_id and await user_repo.exists(user_id):
+                auth_service.principals.set(token, user_id)
+            else:
+                user_id = None
+    return auth_service.resolve(token, claimed, user_id)
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        user_id, error = await current_user_id()
+        if error == 403:
+            return jsonify({'error': 'Доступ запрещен'}), 403
+        if error:
+            return jsonify({'error': 'Требуется авторизация'}), 401
+        g.user_id = user_id
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+async def revision_etag(user_id, revision=None):
+    revision = revision or await revision_repo.state(user_id)
+    return f"{user_id}-{revision['rev']}"
+
+
+def reader(target, revision):
+    return router.reader(target, request.endpoint, revision['changed_at'])
+
+
+def writer(target):
+    return router.writer(target, request.endpoint)
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Authorization')
+    return response
+
+
+def not_modified(etag):
+    if request.if_none_match.contains_weak(etag):
+        response = Response('', status=304)
+        # Как у Flask: у ответа 304 нет тела, значит нет и его типа
+        del response.headers['Content-Type']
+        return with_etag(response, etag)
+    return None
+
+
+AUTH_BUSY_RESPONSE = {'error': 'Сервер перегружен, попробуйте войти через несколько секунд'}
+
+# ===== AUTH =====
+
+@app.route('/api/auth/register', methods=['POST'])
+async def register():
+    try:
+        data = await request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return jsonify({'error': 'Имя пользователя и пароль обязательны'}), 400
+
+        if await user_repo.find_by_username(username, {'_id': 1}):
+            return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
+
+        user = {
+            'username': username,
+            'password': await run_blocking(auth_service.hasher.hash, password),
+            'created_at': datetime.now().isoformat()
+        }
+        try:
+            user_id = await writer(user_repo).create(user)
+        except DuplicateKeyError:
+            return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
+
+        return jsonify({
+            'message': 'Пользователь успешно создан',
+            'user_id': user_id,
+            'username': username,
+            'token': auth_service.issue_token(user_id)
+        }), 201
+    except auth.AuthBusy:
+        return jsonify(AUTH_BUSY_RESPONSE), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/auth/login', methods=['POST'])
+async def login():
+    try:
+        data = await request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return jsonify({'error': 'Имя пользователя и пароль обязательны'}), 400
+
+        user = await user_repo.find_by_username(username, {'password': 1})
+        if not user:
+            return jsonify({'error': 'Неверное имя пользователя или пароль'}), 401
+
+        ok, needs_rehash = await run_blocking(auth_service.hasher.verify, user.get('password'), password)
+        if not ok:
+            return jsonify({'error': 'Неверное имя пользователя или пароль'}), 401
+
+        user_id = str(user['_id'])
+        if needs_rehash:
+            await user_repo.set_password(user_id, await run_blocking(auth_service.hasher.hash, password))
+
+        return jsonify({
+            'message': 'Вход выполнен успешно',
+            'user_id': user_id,
+            'username': username,
+            'token': auth_service.issue_token(user_id)
+        }), 200
+    except auth.AuthBusy:
+        return jsonify(AUTH_BUSY_RESPONSE), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ===== ENTRIES =====
+
+@app.route('/api/entries', methods=['GET'])
+@login_required
+async def get_entries():
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            after = decode_cursor(request.args.get('after'))
+            projection = parse_entry_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        revision = await revision_repo.state(g.user_id)
+        etag = await revision_etag(g.user_id, revision)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        page = await reader(entry_repo, revision).page(g.user_id, after, projection, limit)
+        if request.args.get('format') == 'ndjson':
+            return with_etag(Response(ndjson_page(page, limit), mimetype='application/x-ndjson'), etag)
+        if not limit:
+            return with_etag(jsonify(page), etag), 200
+
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return with_etag(jsonify({'entries': page[:limit], 'next_cursor': next_cursor}), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/entries', methods=['POST'])
+@login_required
+async def create_entry():
+    try:
+        data = await request.get_json()
+        new_entry = await writer(entry_repo).create({
+            'user_id': g.user_id,
+            'title': data.get('title'),
+            'content': data.get('content'),
+            'date': datetime.now().isoformat(),
+            'icon': random.choice(ICON_KEYS)
+        })
+        return jsonify(without_revision(new_entry)), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/entries/<entry_id>', methods=['PUT'])
+@login_required
+async def update_entry(entry_id):
+    try:
+        data = await request.get_json()
+        updated_entry = await writer(entry_repo).update(g.user_id, entry_id, {
+            'title': data.get('title'),
+            'content': data.get('content'),
+        })
+        if not updated_entry:
+            return jsonify({'error': 'Запись не найдена'}), 404
+        return jsonify(without_revision(updated_entry)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/entries/<entry_id>', methods=['DELETE'])
+@login_required
+async def delete_entry(entry_id):
+    try:
+        if not await writer(entry_repo).delete(g.user_id, entry_id):
+            return jsonify({'error': 'Запись не найдена'}), 404
+        return jsonify({'message': 'Запись успешно удалена'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/stats', methods=['GET'])
+@login_required
+async def get_stats():
+    try:
+        weeks = request.args.get('weeks')
+        if weeks is not None:
+            if not weeks.isdigit() or int(weeks) < 1:
+                return jsonify({'error': 'Параметр weeks должен быть положительным числом'}), 400
+            weeks = int(weeks)
+
+        etag = f"{await revision_etag(g.user_id)}-{weeks or 'all'}"
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        stats = user_stats.public(await stats_repo.get(g.user_id), weeks)
+        return with_etag(jsonify(stats), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ===== HABITS =====
+
+@app.route('/api/habits', methods=['GET'])
+@login_required
+async def get_habits():
+    try:
+        revision = await revision_repo.state(g.user_id)
+        etag = await revision_etag(g.user_id, revision)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        habits = [habit_storage.to_api(habit) for habit in await reader(habit_repo, revision).list(g.user_id)]
+        return with_etag(jsonify(habits), etag), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/habits', methods=['POST'])
+@login_required
+async def create_habit():
+    try:
+        data = await request.get_json()
+        name = data.get('name')
+        if not name:
+            return jsonify({'error': 'Требуется название привычки'}), 400
+
+        new_habit = await writer(habit_repo).create({
+            'user_id': g.user_id,
+            'name': name,
+            **habit_storage.empty_completions(),
+            'created_at': datetime.utcnow().isoformat()
+        })
+        habit_storage.to_api(new_habit)
+        return jsonify(new_habit), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/habits/<habit_id>/toggle', methods=['POST'])
+@login_required
+async def toggle_habit(habit_id):
+    try:
+        data = await request.get_json()
+        date = data.get('date')
+        if not date:
+            return jsonify({'error': 'Требуется дата'}), 400
+        try:
+            habit_storage.date_to_day(date)
+        except ValueError:
+            return jsonify({'error': 'Дата должна быть в формате YYYY-MM-DD'}), 400
+
+        updated_habit = await writer(habit_repo).toggle(g.user_id, habit_id, date)
+        if not updated_habit:
+            return jsonify({'error': 'Привычка не найдена'}), 404
+
+        habit_storage.to_api(updated_habit)
+        return jsonify(updated_habit), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/habits/<habit_id>', methods=['DELETE'])
+@login_required
+async def delete_habit(habit_id):
+    try:
+        if not await writer(habit_repo).delete(g.user_id, habit_id):
+            return jsonify({'error': 'Привычка не найдена'}), 404
+        return jsonify({'message': 'Привычка успешно удалена'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ===== USER =====
+
+@app.route('/api/user/preferences', methods=['GET'])
+@login_required
+async def get_user_preferences():
+    try:
+        preferences = auth_service.preferences.get(g.user_id)
+        if preferences is None:
+            revision = await revision_repo.state(g.user_id)
+            preferences = await reader(user_repo, revision).get_preferences(g.user_id)
+            if preferences is None:
+                return jsonify({'error': 'Пользователь не найден'}), 404
+            auth_service.preferences.set(g.user_id, preferences)
+        return jsonify(preferences), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/user/preferences', methods=['POST'])
+@login_required
+async def save_user_preferences():
+    try:
+        data = await request.get_json()
+        news_category = data.get('news_category')
+        await writer(user_repo).set_preferences(g.user_id, {'news_category': news_category})
+        await revision_repo.bump(g.user_id)
+        auth_service.preferences.delete(g.user_id)
+        return jsonify({
+            'message': 'Предпочтения сохранены',
+            'news_category': news_category
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    started = datetime.now()
+    try:
+        await client.admin.command('ping')
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Нет связи с MongoDB',
+            'error': str(e)
+        }), 503
+    return jsonify({
+        'status': 'ok',
+        'message': 'Сервер работает',
+        'mongo': {'ping_ms': round((datetime.now() - started).total_seconds() * 1000, 2)}
+    }), 200
@@ -0,0 +1,255 @@
+"""Авторизация: хеширование паролей, подписанные токены и кэш пользователей.
+
+Пароли хранятся в виде pbkdf2_sha256$<итерации>$<соль>$<хеш>. Хеширование
+выполняется в отдельном ограниченном пуле потоков: hashlib освобождает GIL,
+поэтому всплеск входов не занимает потоки, обслуживающие остальные маршруты,
+а при переполнении очереди вход сразу получает отказ (AuthBusy). Вход ждет
+хеш в своем потоке сервера, поэтому очередь всегда меньше числа потоков
+(SERVER_THREADS задают gunicorn.conf.py и serve.py).
+
+Токен - подписанный itsdangerous идентификатор пользователя. Проверенные
+токены и настройки пользователей кэшируются в памяти процесса (LRU с TTL),
+поэтому большинство запросов проверяется без обращения к MongoDB.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import g, jsonify, request
+from itsdangerous import BadData, URLSafeTimedSerializer
+
+ALGORITHM = 'pbkdf2_sha256'
+
+
+class AuthBusy(Exception):
+    """Очередь хеширования переполнена."""
+
+
+class TTLLRUCache:
+    """LRU-кэш, записи которого живут не дольше ttl секунд."""
+
+    def __init__(self, max_size=10000, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= self.clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, self.clock() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class PasswordHasher:
+
+    def __init__(self, iterations=200000, workers=2, max_pending=32, timeout=30):
+        self.iterations = iterations
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy()
+        try:
+            return self._pool.submit(fn, *args).result(self.timeout)
+        finally:
+            self._slots.release()
+
+    def _hash(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+    def _make(self, password):
+        salt = secrets.token_bytes(16)
+        digest = self._hash(password, salt, self.iterations)
+        return '$'.join([
+            ALGORITHM,
+            str(self.iterations),
+            base64.b64encode(salt).decode('ascii'),
+            base64.b64encode(digest).decode('ascii')
+        ])
+
+    def _check(self, stored, password):
+        try:
+            algorithm, iterations, salt, expected = stored.split('$')
+            iterations = int(iterations)
+        except ValueError:
+            algorithm = None
+        if algorithm != ALGORITHM:
+            # Пароли, сохраненные до появления хеширования, лежат открытым текстом
+            return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8')), True
+        digest = self._hash(password, base64.b64decode(salt), iterations)
+        ok = hmac.compare_digest(digest, base64.b64decode(expected))
+        return ok, iterations != self.iterations
+
+    def hash(self, password):
+        return self._submit(self._make, password)
+
+    def verify(self, stored, password):
+        """Возвращает (совпал ли пароль, нужно ли пересчитать хеш)."""
+        return self._submit(self._check, stored or '', password)
+
+
+class Auth:
+
+    def __init__(self, users, secret_key, token_ttl, allow_user_id,
+                 hasher, principals, preferences):
+        self.users = users
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='diary-auth')
+        self.token_ttl = token_ttl
+        self.allow_user_id = allow_user_id
+        self.hasher = hasher
+        self.principals = principals
+        self.preferences = preferences
+
+    def issue_token(self, user_id):
+        return self.serializer.dumps(str(user_id))
+
+    def decode_token(self, token):
+        """user_id из подписи токена без обращения к базе или None."""
+        try:
+            return self.serializer.loads(token, max_age=self.token_ttl)
+        except BadData:
+            return None
+
+    def user_from_token(self, token):
+        user_id = self.principals.get(token)
+        if user_id is not None:
+            return user_id
+        user_id = self.decode_token(token)
+        # Пользователь мог быть удален - проверяем один раз на время жизни кэша
+        if not user_id or not self.users.exists(user_id):
+            return None
+        self.principals.set(token, user_id)
+        return user_id
+
+    def resolve(self, token, claimed, user_id):
+        """Итог проверки: (user_id, код ошибки или None).
+
+        token и claimed - токен и user_id из запроса, user_id - пользователь,
+        которому принадлежит токен.
+        """
+        if token:
+            if not user_id:
+                return None, 401
+            if claimed and claimed != user_id:
+                return None, 403
+            return user_id, None
+        if self.allow_user_id and claimed:
+            return claimed, None
+        return None, 401
+
+    def current_user_id(self):
+        """user_id из токена, а в режиме совместимости - из параметров запроса."""
+        claimed = request.args.get('user_id')
+        if claimed is None and request.is_json:
+            claimed = claimed_user_id(request.get_json(silent=True))
+        token = bearer_token(request.headers.get('Authorization'))
+        return self.resolve(token, claimed, token and self.user_from_token(token))
+
+    def get_preferences(self, user_id, load):
+        preferences = self.preferences.get(user_id)
+        if preferences is None:
+            preferences = load()
+            if preferences is not None:
+                self.preferences.set(user_id, preferences)
+        return preferences
+
+
+def bearer_token(header):
+    if header and header.startswith('Bearer '):
+        return header[len('Bearer '):].strip() or None
+    return None
+
+
+def claimed_user_id(body):
+    return body.get('user_id') if isinstance(body, dict) else None
+
+
+def max_pending_hashes(server_threads, configured=None):
+    """Размер очереди хеширования.
+
+    Без явного AUTH_HASH_MAX_PENDING - половина потоков сервера, и в любом
+    случае хотя бы один поток остается для остальных маршрутов. Если число
+    потоков неизвестно (dev-сервер, ASGI), очередь - 32.
+    """
+    if not server_threads:
+        return configured or 32
+    limit = max(1, server_threads - 1)
+    return min(configured or max(1, server_threads // 2), limit)
+
+
+def create_auth(users):
+    secret_key = os.getenv('SECRET_KEY')
+    if not secret_key:
+        # Без общего ключа токены действительны только в этом процессе
+        print("SECRET_KEY не задан: токены будут сброшены при перезапуске")
+        secret_key = secrets.token_hex(32)
+    hasher = PasswordHasher(
+        iterations=int(os.getenv('AUTH_PBKDF2_ITERATIONS', '200000')),
+        workers=int(os.getenv('AUTH_HASH_WORKERS', '2')),
+        max_pending=max_pending_hashes(
+            int(os.getenv('SERVER_THREADS', '0')),
+            int(os.getenv('AUTH_HASH_MAX_PENDING', '0'))
+        )
+    )
+    allow_user_id = os.getenv('AUTH_ALLOW_USER_ID', '0') == '1'
+    if allow_user_id:
+        print("ВНИМАНИЕ: AUTH_ALLOW_USER_ID=1 - запросы без токена принимаются по user_id "
+              "без проверки. Режим устарел и будет удален, фронтенд уже отправляет токен")
+    cache_ttl = int(os.getenv('AUTH_CACHE_TTL', '300'))
+    cache_size = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+    return Auth(
+        users,
+        secret_key=secret_key,
+        token_ttl=int(os.getenv('AUTH_TOKEN_TTL', str(30 * 24 * 3600))),
+        allow_user_id=allow_user_id,
+        hasher=hasher,
+        principals=TTLLRUCache(cache_size, cache_ttl),
+        preferences=TTLLRUCache(cache_size, cache_ttl)
+    )
+
+
+def require_auth(get_auth):
+    """Декоратор маршрута: кладет user_id в g.user_id или отвечает 401/403.
+
+    get_auth - функция, возвращающая объект Auth приложения.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id, error = get_auth().current_user_id()
+            if error == 403:
+                return jsonify({'error': 'Доступ запрещен'}), 403
+            if error:
+                return jsonify({'error': 'Требуется авторизация'}), 401
+            g.user_id = user_id
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,9 @@
+"""Нагрузочные тесты и микробенчмарки API дневника.
+
+    python -m benchmarks.seed --scale small          - заполнить базу тестовыми данными
+    python -m benchmarks.run --mode client           - прогнать маршруты через test client
+    python -m benchmarks.run --mode http --url ...   - нагрузка по HTTP на запущенный сервер
+    python -m benchmarks.compare result.json baseline.json
+
+Запускать из каталога backend.
+"""
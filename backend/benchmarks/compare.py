@@ -0,0 +1,56 @@
+"""Сравнение результатов бенчмарка с сохраненной базовой линией.
+
+    python -m benchmarks.compare result.json baseline.json --threshold 0.2
+
+Возвращает код 1, если какой-либо маршрут стал медленнее порога.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(current, baseline, threshold=0.2):
+    """Список ухудшений: (маршрут, метрика, было, стало)."""
+    regressions = []
+    for name, result in current['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if not base:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions.append((name, metric, base[metric], result[metric]))
+        if base['throughput'] and result['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append((name, 'throughput', base['throughput'], result['throughput']))
+        if result['errors'] > base['errors']:
+            regressions.append((name, 'errors', base['errors'], result['errors']))
+    return regressions
+
+
+def print_report(regressions):
+    if not regressions:
+        print('Ухудшений не найдено')
+        return
+    print('Ухудшения:')
+    for name, metric, before, after in regressions:
+        print(f"  {name}: {metric} {before} -> {after}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение результатов бенчмарка')
+    parser.add_argument('current')
+    parser.add_argument('baseline')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.threshold)
+    print_report(regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Замер пропускной способности, задержек и памяти по маршрутам.
+
+    python -m benchmarks.run --mode client --requests 200 --output result.json
+    python -m benchmarks.run --mode http --url http://localhost:5000 --concurrency 32
+
+В режиме client запросы идут через Flask test client в том же процессе,
+можно включить замер памяти (--memory). В режиме http нагрузка подается
+по сети на уже запущенный сервер, который должен смотреть в ту же базу.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.compare import compare, print_report
+from benchmarks.scenarios import SCENARIOS, Context
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Отказы лимита частоты и сброса нагрузки (rate_limit.py): задержка таких
+# ответов не говорит о стоимости маршрута
+REJECTED_STATUSES = (429, 503)
+
+
+def summarize(latencies, errors, elapsed, peak_memory=None, rejected=0):
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rejected': rejected,
+        'throughput': round(count / elapsed, 2) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_memory_kb': round(peak_memory / 1024, 1) if peak_memory is not None else None
+    }
+
+
+def run_client(app, ctx, scenario, requests_count, measure_memory):
+    """Последовательные запросы через test client."""
+    test_client = app.test_client()
+    latencies = []
+    errors = 0
+    rejected = 0
+    if measure_memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    prepare_time = 0.0
+    for _ in range(requests_count):
+        prepare_started = time.perf_counter()
+        method, path, body, headers = scenario(ctx)
+        request_started = time.perf_counter()
+        prepare_time += request_started - prepare_started
+        response = test_client.open(path, method=method, json=body, headers=headers)
+        # Читаем тело целиком, чтобы потоковые ответы тоже вошли в замер
+        response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            errors += 1
+        if response.status_code in REJECTED_STATUSES:
+            rejected += 1
+    elapsed = time.perf_counter() - started - prepare_time
+
+    peak = None
+    if measure_memory:
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    return summarize(latencies, errors, elapsed, peak, rejected)
+
+
+def run_http(base_url, ctx, scenario, requests_count, concurrency):
+    """Параллельная нагрузка по HTTP, у каждого потока свое keep-alive соединение."""
+    import requests
+
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    rejected = [0]
+    # Подготовка выполняется заранее, чтобы не занимать время нагрузки
+    prepared = [scenario(ctx) for _ in range(requests_count)]
+
+    def send(item):
+        method, path, body, headers = item
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        request_started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, headers=headers, timeout=60)
+            failed = response.status_code >= 400
+            refused = response.status_code in REJECTED_STATUSES
+        except requests.exceptions.RequestException:
+            failed = True
+            refused = False
+        elapsed = time.perf_counter() - request_started
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors[0] += 1
+            if refused:
+                rejected[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, prepared))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors[0], elapsed, rejected=rejected[0])
+
+
+def client_login(app):
+    """Вход через test client: токен для заголовка Authorization."""
+    test_client = app.test_client()
+
+    def login(username, password):
+        response = test_client.post('/api/auth/login', json={'username': username, 'password': password})
+        if response.status_code != 200:
+            raise RuntimeError(f"Не удалось войти как {username}: {response.status_code}")
+        return response.get_json()['token']
+    return login
+
+
+def http_login(base_url):
+    """Вход на запущенный сервер: токен для заголовка Authorization."""
+    import requests
+
+    def login(username, password):
+        response = requests.post(base_url + '/api/auth/login',
+                                 json={'username': username, 'password': password}, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(f"Не удалось войти как {username}: {response.status_code}")
+        return response.json()['token']
+    return login
+
+
+def create_bench_app(args):
+    # Бенчмарк не должен отправлять сообщения в Telegram
+    # (сообщения только попадают в очередь тестовой базы)
+    os.environ['FEEDBACK_DISPATCHER'] = 'off'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench')
+    os.environ.setdefault('TELEGRAM_CHAT_ID', 'bench')
+    os.environ['MONGO_DB'] = args.db
+    # Замеряется стоимость маршрутов, поэтому лимиты частоты отключены
+    import rate_limit
+    for endpoint in rate_limit.DEFAULT_LIMITS:
+        os.environ.setdefault(f'RATE_LIMIT_{endpoint.upper()}', '0')
+    import app as app_module
+
+    mongo_client = None
+    if args.mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('Для --mongomock установите пакет mongomock')
+        mongo_client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        mongo_client = MongoClient(args.uri)
+    return app_module.create_app(mongo_client), app_module.db
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк маршрутов API')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default=os.getenv('BENCH_MONGO_DB', 'diary_bench'))
+    parser.add_argument('--mongomock', action='store_true',
+                        help='база в памяти (только client), данные заполняются автоматически')
+    parser.add_argument('--scale', default='tiny', help='объем данных для --mongomock')
+    parser.add_argument('--routes', help='маршруты через запятую (по умолчанию все)')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на маршрут')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--memory', action='store_true', help='замер памяти (client)')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--baseline', help='файл с базовыми результатами для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимое ухудшение p95 и пропускной способности (доля)')
+    args = parser.parse_args()
+
+    if args.mongomock and args.mode == 'http':
+        sys.exit('--mongomock работает только в режиме client')
+
+    routes = args.routes.split(',') if args.routes else list(SCENARIOS)
+    unknown = [name for name in routes if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Неизвестные маршруты: {', '.join(unknown)}")
+
+    app, db = create_bench_app(args)
+    if args.mongomock:
+        from benchmarks.seed import seed
+        seed(db, args.scale)
+    ctx = Context(db, client_login(app) if args.mode == 'client' else http_login(args.url))
+
+    if args.memory and args.mode == 'client':
+        tracemalloc.start()
+
+    results = {}
+    for name in routes:
+        scenario = SCENARIOS[name]
+        if args.mode == 'client':
+            run_client(app, ctx, scenario, args.warmup, False)
+            results[name] = run_client(app, ctx, scenario, args.requests, args.memory)
+        else:
+            run_http(args.url, ctx, scenario, args.warmup, args.concurrency)
+            results[name] = run_http(args.url, ctx, scenario, args.requests, args.concurrency)
+        item = results[name]
+        print(f"{name:20} {item['throughput']:>9.1f} req/s  p50 {item['p50_ms']:>8.2f} ms  "
+              f"p95 {item['p95_ms']:>8.2f} ms  p99 {item['p99_ms']:>8.2f} ms  errors {item['errors']}")
+        if item['rejected']:
+            print(f"{'':20} ответов 429/503: {item['rejected']} - сервер ограничил частоту или "
+                  f"сбросил нагрузку, цифры маршрута недостоверны (см. RATE_LIMIT_* в README)")
+
+    report = {
+        'meta': {
+            'mode': args.mode,
+            'requests': args.requests,
+            'concurrency': args.concurrency if args.mode == 'http' else 1,
+            'mongomock': args.mongomock,
+            'python': platform.python_version(),
+            'created_at': datetime.now().isoformat()
+        },
+        'routes': results
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print_report(regressions)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Сценарии запросов к маршрутам app.py.
+
+Каждый сценарий - функция prepare(ctx), которая возвращает
+(method, path, json_body, headers). Подготовка (например, создание записи,
+которую затем удалит запрос) выполняется напрямую в базе и в замер
+не входит. Запросы от имени пользователя идут с токеном: каждый
+пользователь входит один раз при первом запросе (ctx.auth), дальше
+токен берется из памяти.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+
+
+class Context:
+    """Данные, на которых строятся запросы: пользователи, их записи и привычки."""
+
+    PASSWORD = 'bench'
+
+    def __init__(self, db, login, sample_users=50, seed=1):
+        """login(username, password) возвращает токен из /api/auth/login."""
+        self.db = db
+        self.login = login
+        self.tokens = {}
+        self.rng = random.Random(seed)
+        self.user_ids = [
+            str(user['_id']) for user in db['users'].find({}, {'_id': 1}).limit(sample_users)
+        ]
+        if not self.user_ids:
+            raise RuntimeError('База пуста - сначала выполните python -m benchmarks.seed')
+        self.usernames = {
+            str(user['_id']): user['username']
+            for user in db['users'].find({}, {'username': 1}).limit(sample_users)
+        }
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def auth(self, user_id):
+        """Заголовки запроса от имени пользователя."""
+        if user_id not in self.tokens:
+            self.tokens[user_id] = self.login(self.usernames[user_id], self.PASSWORD)
+        return {'Authorization': f"Bearer {self.tokens[user_id]}"}
+
+    def entry(self, user_id):
+        entry = self.db['entries'].find_one({'user_id': user_id}, {'_id': 1})
+        return str(entry['_id']) if entry else None
+
+    def habit(self, user_id):
+        habit = self.db['habits'].find_one({'user_id': user_id}, {'_id': 1})
+        return str(habit['_id']) if habit else None
+
+    def random_day(self):
+        return (date.today() - timedelta(days=self.rng.randint(0, 365))).isoformat()
+
+
+def health(ctx):
+    return 'GET', '/api/health', None, None
+
+
+def login(ctx):
+    user_id = ctx.user()
+    return 'POST', '/api/auth/login', {'username': ctx.usernames[user_id], 'password': ctx.PASSWORD}, None
+
+
+def register(ctx):
+    return 'POST', '/api/auth/register', {'username': f"bench_new_{ObjectId()}", 'password': 'bench'}, None
+
+
+def get_entries(ctx):
+    return 'GET', '/api/entries', None, ctx.auth(ctx.user())
+
+
+def get_entries_page(ctx):
+    return 'GET', '/api/entries?limit=20&fields=title,date,icon', None, ctx.auth(ctx.user())
+
+
+def get_entries_ndjson(ctx):
+    return 'GET', '/api/entries?format=ndjson', None, ctx.auth(ctx.user())
+
+
+def create_entry(ctx):
+    return 'POST', '/api/entries', {
+        'title': 'Запись бенчмарка',
+        'content': 'Текст записи бенчмарка ' * 20
+    }, ctx.auth(ctx.user())
+
+
+def update_entry(ctx):
+    user_id = ctx.user()
+    return 'PUT', f"/api/entries/{ctx.entry(user_id)}", {
+        'title': 'Обновленная запись',
+        'content': 'Новый текст ' * 20
+    }, ctx.auth(user_id)
+
+
+def delete_entry(ctx):
+    user_id = ctx.user()
+    result = ctx.db['entries'].insert_one({
+        'user_id': user_id,
+        'title': 'Удаляемая запись',
+        'content': '',
+        'date': datetime.now().isoformat(),
+        'icon': 'pen'
+    })
+    return 'DELETE', f"/api/entries/{result.inserted_id}", None, ctx.auth(user_id)
+
+
+def get_calendar(ctx):
+    month = date.today().strftime('%Y-%m')
+    return 'GET', f"/api/calendar?month={month}", None, ctx.auth(ctx.user())
+
+
+def get_habits(ctx):
+    return 'GET', '/api/habits', None, ctx.auth(ctx.user())
+
+
+def create_habit(ctx):
+    return 'POST', '/api/habits', {'name': 'Привычка бенчмарка'}, ctx.auth(ctx.user())
+
+
+def toggle_habit(ctx):
+    user_id = ctx.user()
+    return 'POST', f"/api/habits/{ctx.habit(user_id)}/toggle", {'date': ctx.random_day()}, ctx.auth(user_id)
+
+
+def delete_habit(ctx):
+    user_id = ctx.user()
+    result = ctx.db['habits'].insert_one({
+        'user_id': user_id,
+        'name': 'Удаляемая привычка',
+        'completed_dates': [],
+        'created_at': datetime.utcnow().isoformat()
+    })
+    return 'DELETE', f"/api/habits/{result.inserted_id}", None, ctx.auth(user_id)
+
+
+def get_preferences(ctx):
+    return 'GET', '/api/user/preferences', None, ctx.auth(ctx.user())
+
+
+def save_preferences(ctx):
+    return 'POST', '/api/user/preferences', {'news_category': 'science'}, ctx.auth(ctx.user())
+
+
+def get_news(ctx):
+    return 'GET', '/api/news?category=technology', None, None
+
+
+def send_feedback(ctx):
+    return 'POST', '/api/feedback', {'name': 'Бенчмарк', 'message': 'Сообщение бенчмарка'}, None
+
+
+SCENARIOS = {
+    'health': health,
+    'login': login,
+    'register': register,
+    'get_entries': get_entries,
+    'get_entries_page': get_entries_page,
+    'get_entries_ndjson': get_entries_ndjson,
+    'create_entry': create_entry,
+    'update_entry': update_entry,
+    'delete_entry': delete_entry,
+    'get_calendar': get_calendar,
+    'get_habits': get_habits,
+    'create_habit': create_habit,
+    'toggle_habit': toggle_habit,
+    'delete_habit': delete_habit,
+    'get_preferences': get_preferences,
+    'save_preferences': save_preferences,
+    'get_news': get_news,
+    'send_feedback': send_feedback,
+}
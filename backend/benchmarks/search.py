@@ -0,0 +1,103 @@
+"""Сравнение движков поиска на одном пользователе с большим числом записей.
+
+    python -m benchmarks.search --entries 20000 --queries 200
+    python -m benchmarks.search --mongomock   # только движок memory
+
+Записи создаются в базе diary_bench для отдельного пользователя.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.run import percentile
+from benchmarks.seed import WORDS, random_text
+from indexes import ensure_indexes
+import search
+
+BENCH_USER = 'bench_search_user'
+
+
+def seed_user(db, entries_count, rng):
+    collection = db['entries']
+    collection.delete_many({'user_id': BENCH_USER})
+    batch = []
+    for i in range(entries_count):
+        batch.append({
+            'user_id': BENCH_USER,
+            'title': random_text(rng, 2, 6),
+            'content': random_text(rng, 30, 400),
+            'date': f"2024-01-01T00:00:{i % 60:02d}.{i:06d}",
+            'icon': 'pen'
+        })
+        if len(batch) >= 5000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def measure(engine, queries, limit):
+    latencies = []
+    # Первый запрос строит индекс в памяти - замеряем его отдельно
+    started = time.perf_counter()
+    engine.search(BENCH_USER, queries[0], limit)
+    first = time.perf_counter() - started
+    for query in queries:
+        started = time.perf_counter()
+        engine.search(BENCH_USER, query, limit)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'first_query_ms': round(first * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска по записям')
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default=os.getenv('BENCH_MONGO_DB', 'diary_bench'))
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        db = mongomock.MongoClient()[args.db]
+    else:
+        from pymongo import MongoClient
+        db = MongoClient(args.uri)[args.db]
+        for name, error in ensure_indexes(db)[1]:
+            print(f"Не удалось создать индекс {name}: {error}")
+
+    rng = random.Random(7)
+    seed_user(db, args.entries, rng)
+    queries = [' '.join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(args.queries)]
+
+    engines = [search.MemorySearchEngine(db['entries'])]
+    if not args.mongomock:
+        engines.insert(0, search.MongoTextSearchEngine(db['entries']))
+
+    results = {}
+    for engine in engines:
+        results[engine.name] = measure(engine, queries, args.limit)
+        item = results[engine.name]
+        print(f"{engine.name:8} first {item['first_query_ms']:>9.2f} ms  p50 {item['p50_ms']:>8.2f} ms  "
+              f"p95 {item['p95_ms']:>8.2f} ms  p99 {item['p99_ms']:>8.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'entries': args.entries, 'engines': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Заполнение базы реалистичными объемами данных."""
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from pymongo import MongoClient
+
+import habit_storage
+from icons import ICON_KEYS
+
+# Объемы данных: пользователи, записей на пользователя, привычек на пользователя,
+# лет истории привычек
+SCALES = {
+    'tiny': (20, 50, 3, 1),
+    'small': (200, 100, 5, 2),
+    'medium': (2000, 100, 5, 3),
+    'full': (10000, 100, 5, 3),
+}
+
+WORDS = (
+    'сегодня утром день вечер работа дом друзья прогулка книга кино погода '
+    'солнце дождь снег настроение мысли планы мечты семья встреча город парк '
+    'кофе чай музыка спорт тренировка учеба проект задача отдых путешествие'
+).split()
+
+BATCH_SIZE = 5000
+
+
+def random_text(rng, min_words, max_words):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize()
+
+
+def random_completions(rng, years, today, fmt):
+    days_total = years * 365
+    # Каждую привычку выполняют с разной регулярностью
+    ratio = rng.uniform(0.2, 0.9)
+    dates = [
+        (today - timedelta(days=offset)).isoformat()
+        for offset in range(days_total) if rng.random() < ratio
+    ]
+    if fmt == habit_storage.DAYS:
+        return {'completed_days': sorted(habit_storage.date_to_day(value) for value in dates)}
+    return {'completed_dates': dates}
+
+
+def _flush(collection, batch):
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    return []
+
+
+def seed(db, scale='small', seed_value=42, fmt=None, drop=True):
+    """Заполняет базу и возвращает список user_id."""
+    users_count, entries_per_user, habits_per_user, years = SCALES[scale]
+    rng = random.Random(seed_value)
+    fmt = fmt or habit_storage.storage_format()
+    today = date.today()
+    start = datetime.now() - timedelta(days=years * 365)
+
+    if drop:
+        for name in ('users', 'entries', 'habits'):
+            db[name].drop()
+
+    users = [
+        {'username': f"bench_user_{i}", 'password': 'bench', 'created_at': start.isoformat()}
+        for i in range(users_count)
+    ]
+    user_ids = []
+    for i in range(0, len(users), BATCH_SIZE):
+        result = db['users'].insert_many(users[i:i + BATCH_SIZE])
+        user_ids.extend(str(inserted_id) for inserted_id in result.inserted_ids)
+
+    entries = []
+    habits = []
+    for user_id in user_ids:
+        for _ in range(entries_per_user):
+            created = start + timedelta(seconds=rng.randint(0, years * 365 * 86400))
+            entries.append({
+                'user_id': user_id,
+                'title': random_text(rng, 2, 6),
+                'content': random_text(rng, 30, 400),
+                'date': created.isoformat(),
+                'icon': rng.choice(ICON_KEYS)
+            })
+            if len(entries) >= BATCH_SIZE:
+                entries = _flush(db['entries'], entries)
+        for index in range(habits_per_user):
+            habits.append({
+                'user_id': user_id,
+                'name': f"Привычка {index + 1}",
+                **random_completions(rng, years, today, fmt),
+                'created_at': start.isoformat()
+            })
+            if len(habits) >= BATCH_SIZE // 10:
+                habits = _flush(db['habits'], habits)
+    _flush(db['entries'], entries)
+    _flush(db['habits'], habits)
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнение базы тестовыми данными')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default=os.getenv('BENCH_MONGO_DB', 'diary_bench'))
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    user_ids = seed(db, args.scale, args.seed)
+    print(f"База {args.db}: пользователей {len(user_ids)}, "
+          f"записей {db['entries'].estimated_document_count()}, "
+          f"привычек {db['habits'].estimated_document_count()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Стоимость сериализации ответа /api/entries и размер тела на проводе.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --entries 1000 10000 --repeat 20
+
+Сравниваются два пути для одного и того же списка документов MongoDB:
+    stdlib - цикл str(_id) и jsonify стандартного провайдера Flask (как было)
+    fast   - serialization.FastJSONProvider без подготовки документов
+и размер тела без сжатия, с gzip и brotli (если установлен пакет brotli).
+База не нужна: документы генерируются в памяти, замеряется только CPU.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import compression
+import serialization
+from benchmarks.seed import random_text
+from icons import ICON_KEYS
+
+
+def make_entries(count, rng):
+    return [{
+        '_id': ObjectId(),
+        'user_id': 'bench_user',
+        'title': random_text(rng, 2, 6),
+        'content': random_text(rng, 30, 400),
+        'date': f"2024-01-01T00:00:{i % 60:02d}.{i:06d}",
+        'icon': rng.choice(ICON_KEYS),
+        '_rev': i + 1
+    } for i in range(count)]
+
+
+def stdlib_body(provider, entries):
+    # Как маршрут работал раньше: копия документа с str(_id) и jsonify
+    prepared = []
+    for entry in entries:
+        entry = dict(entry)
+        entry['_id'] = str(entry['_id'])
+        prepared.append(entry)
+    return provider.response(prepared).get_data()
+
+
+def fast_body(provider, entries):
+    return provider.response(entries).get_data()
+
+
+def cpu_ms(fn, repeat):
+    """Медиана процессорного времени одного вызова, мс."""
+    times = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        times.append(time.process_time() - started)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def measure(count, repeat, rng):
+    app = Flask(__name__)
+    entries = make_entries(count, rng)
+    options = compression.settings()
+    result = {}
+    with app.app_context():
+        paths = {
+            'stdlib': (DefaultJSONProvider(app), stdlib_body),
+            'fast': (serialization.FastJSONProvider(app), fast_body)
+        }
+        for name, (provider, body) in paths.items():
+            data = body(provider, entries)
+            result[name] = {
+                'serialize_ms': round(cpu_ms(lambda: body(provider, entries), repeat), 2),
+                'bytes': len(data)
+            }
+
+        data = fast_body(paths['fast'][0], entries)
+        for encoding in compression.available_encodings():
+            compressed = compression.compress(data, encoding, options)
+            result[encoding] = {
+                'compress_ms': round(cpu_ms(lambda: compression.compress(data, encoding, options), repeat), 2),
+                'bytes': len(compressed)
+            }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сериализации и сжатия ответов')
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    print(f"Кодировщик: {serialization.ENCODER}, сжатие: {', '.join(compression.available_encodings())}")
+    rng = random.Random(7)
+    results = {}
+    for count in args.entries:
+        item = measure(count, args.repeat, rng)
+        results[count] = item
+        print(f"\n{count} записей")
+        for name in ('stdlib', 'fast'):
+            print(f"  {name:8} {item[name]['serialize_ms']:>9.2f} ms CPU  {item[name]['bytes']:>10} байт")
+        for encoding in compression.available_encodings():
+            ratio = item[encoding]['bytes'] / item['fast']['bytes']
+            print(f"  {encoding:8} {item[encoding]['compress_ms']:>9.2f} ms CPU  {item[encoding]['bytes']:>10} байт"
+                  f"  ({ratio:.1%} от исходного)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
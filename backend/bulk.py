@@ -0,0 +1,291 @@
+"""Массовый импорт и экспорт записей и привычек в формате NDJSON.
+
+Импорт читает тело запроса построчно (в том числе сжатое gzip), проверяет
+каждую запись и вставляет их пачками insert_many(ordered=False). Ход импорта
+сохраняется в коллекции imports после каждой пачки: по нему можно следить
+за прогрессом и продолжить прерванный импорт с последней сохраненной строки.
+Записи с _id из экспорта при повторном импорте не дублируются. Записи без _id
+получают постоянный _id по import_id и номеру строки, поэтому продолжение
+после сбоя не вставляет их второй раз.
+
+Экспорт отдает документы прямо из курсора MongoDB, не собирая их в список.
+"""
+import calendar
+import gzip
+import hashlib
+import json
+import random
+import struct
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import habit_storage
+import serialization
+
+DUPLICATE_KEY = 11000
+MAX_REPORTED_ERRORS = 20
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def read_lines(stream, gzipped=False):
+    """Строки NDJSON из потока тела запроса."""
+    if gzipped:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    for line in stream:
+        yield line
+
+
+def _object_id(value):
+    if value is None:
+        return None
+    try:
+        return ObjectId(value)
+    except Exception:
+        raise ValueError('Некорректный _id')
+
+
+def _string(record, field, required=False):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise ValueError(f"Поле {field} обязательно")
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"Поле {field} должно быть строкой")
+    return value
+
+
+def _iso_datetime(value, field):
+    if value is None:
+        return datetime.now().isoformat()
+    if not isinstance(value, str):
+        raise ValueError(f"Поле {field} должно быть строкой")
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Поле {field} должно быть датой ISO 8601")
+    return value
+
+
+def entry_validator(icon_keys):
+    def validate(record, user_id):
+        doc = {
+            'user_id': user_id,
+            'title': _string(record, 'title'),
+            'content': _string(record, 'content'),
+            'date': _iso_datetime(record.get('date'), 'date'),
+            'icon': record.get('icon') if record.get('icon') in icon_keys else random.choice(icon_keys)
+        }
+        entry_id = _object_id(record.get('_id'))
+        if entry_id:
+            doc['_id'] = entry_id
+        return doc
+    return validate
+
+
+def validate_habit(record, user_id):
+    dates = record.get('completed_dates') or []
+    if not isinstance(dates, list):
+        raise ValueError('Поле completed_dates должно быть списком')
+    try:
+        days = sorted({habit_storage.date_to_day(value) for value in dates})
+    except (TypeError, ValueError):
+        raise ValueError('Даты в completed_dates должны быть в формате YYYY-MM-DD')
+
+    if habit_storage.storage_format() == habit_storage.DAYS:
+        completions = {'completed_days': days}
+    else:
+        completions = {'completed_dates': [habit_storage.day_to_date(day) for day in days]}
+
+    doc = {
+        'user_id': user_id,
+        'name': _string(record, 'name', required=True),
+        **completions,
+        'created_at': _iso_datetime(record.get('created_at'), 'created_at')
+    }
+    habit_id = _object_id(record.get('_id'))
+    if habit_id:
+        doc['_id'] = habit_id
+    return doc
+
+
+class ImportConflict(Exception):
+    """Импорт с таким import_id одновременно запускается в другом запросе."""
+
+
+def job_key(user_id, import_id):
+    """_id задачи в imports: import_id задает клиент, поэтому он уникален только у пользователя."""
+    return f"{user_id}:{import_id}"
+
+
+def line_id(job, line_number):
+    """_id для строки импорта без _id: один и тот же при каждом запуске.
+
+    Первые 4 байта - время начала импорта, как у обычного ObjectId, остальные -
+    хеш пользователя, import_id и номера строки.
+    """
+    timestamp = calendar.timegm(job['started_at'].utctimetuple())
+    key = f"{job['user_id']}:{job['_id']}:{line_number}".encode('utf-8')
+    return ObjectId(struct.pack('>I', timestamp) + hashlib.sha1(key).digest()[:8])
+
+
+class Importer:
+    """Импорт NDJSON в коллекцию с сохранением хода в коллекции imports."""
+
+    def __init__(self, collection, imports_collection, validate, batch_size=1000):
+        self.collection = collection
+        self.imports = imports_collection
+        self.validate = validate
+        self.batch_size = batch_size
+
+    def start(self, user_id, kind, import_id=None):
+        """Создает задачу импорта или возвращает существующую для продолжения."""
+        import_id = import_id or str(ObjectId())
+        job = self.imports.find_one({'_id': job_key(user_id, import_id), 'user_id': user_id})
+        if job:
+            return job
+        job = {
+            '_id': job_key(user_id, import_id),
+            'import_id': import_id,
+            'user_id': user_id,
+            'kind': kind,
+            'status': RUNNING,
+            'committed_line': 0,
+            'inserted': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'errors': [],
+            'started_at': datetime.utcnow()
+        }
+        try:
+            self.imports.insert_one(job)
+        except DuplicateKeyError:
+            raise ImportConflict(import_id)
+        return job
+
+    def run(self, job, lines, on_batch=None, after_batch=None):
+        """Импортирует строки, пропуская уже сохраненные в прошлых запусках.
+
+        after_batch(docs) вызывается после записи пачки со всеми ее документами
+        (включая дубликаты), on_batch(docs) - только с записанными в ней документами.
+        С after_batch документы записываются с _rev = null (см. repositories.py).
+        """
+        user_id = job['user_id']
+        skip = job['committed_line']
+        counters = {'inserted': 0, 'duplicates': 0, 'invalid': 0}
+        errors = []
+        batch = []
+        line_number = 0
+
+        def report(line, message):
+            counters['invalid'] += 1
+            if len(job['errors']) + len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line, 'error': message})
+
+        try:
+            for line_number, raw in enumerate(lines, start=1):
+                if line_number <= skip:
+                    continue
+                raw = raw.strip()
+                if not raw:
+                    continue
+                try:
+                    record = json.loads(raw)
+                    if not isinstance(record, dict):
+                        raise ValueError('Строка должна быть JSON-объектом')
+                    doc = self.validate(record, user_id)
+                    doc.setdefault('_id', line_id(job, line_number))
+                    if after_batch:
+                        # Документ ждет ревизию, которую после записи проставит after_batch
+                        doc['_rev'] = None
+                    batch.append(doc)
+                except ValueError as e:
+                    report(line_number, str(e))
+
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, counters, on_batch, after_batch)
+                    self._checkpoint(job, line_number, counters, errors)
+                    batch, counters, errors = [], dict.fromkeys(counters, 0), []
+
+            self._flush(batch, counters, on_batch, after_batch)
+            self._checkpoint(job, line_number, counters, errors, status=DONE)
+        except Exception as e:
+            # Сохраненная строка остается прежней - с нее импорт и продолжится
+            self.imports.update_one(
+                {'_id': job['_id']},
+                {'$set': {'status': FAILED, 'last_error': str(e)}}
+            )
+            raise
+        return self.imports.find_one({'_id': job['_id']})
+
+    def _flush(self, batch, counters, on_batch, after_batch=None):
+        if not batch:
+            return
+        failed = set()
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            counters['inserted'] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            counters['inserted'] += details.get('nInserted', 0)
+            for error in details.get('writeErrors', []):
+                if error.get('code') == DUPLICATE_KEY:
+                    counters['duplicates'] += 1
+                    failed.add(error['index'])
+                else:
+                    raise
+        if after_batch:
+            after_batch(batch)
+        # В on_batch попадают только записанные документы: дубликаты повторного
+        # импорта уже учтены (например, в статистике пользователя)
+        inserted = [doc for index, doc in enumerate(batch) if index not in failed]
+        if on_batch and inserted:
+            on_batch(inserted)
+
+    def _checkpoint(self, job, line_number, counters, errors, status=RUNNING):
+        update = {
+            '$set': {'committed_line': max(line_number, job['committed_line']), 'status': status,
+                     'updated_at': datetime.utcnow()},
+            '$inc': counters
+        }
+        if errors:
+            update['$push'] = {'errors': {'$each': errors}}
+        self.imports.update_one({'_id': job['_id']}, update)
+
+
+def public_job(job):
+    return {
+        'import_id': job.get('import_id', job['_id']),
+        'kind': job['kind'],
+        'status': job['status'],
+        'committed_line': job['committed_line'],
+        'inserted': job['inserted'],
+        'duplicates': job['duplicates'],
+        'invalid': job['invalid'],
+        'errors': job.get('errors', []),
+        'last_error': job.get('last_error')
+    }
+
+
+def export_ndjson(cursor, prepare=None):
+    """Генератор строк NDJSON по курсору."""
+    for doc in cursor:
+        if prepare:
+            doc = prepare(doc)
+        yield serialization.dumps_line(doc)
+
+
+def gzip_stream(chunks, level=6):
+    """Сжимает поток строк в gzip по мере генерации."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
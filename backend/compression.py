@@ -0,0 +1,84 @@
+"""Сжатие ответов gzip или brotli по заголовку Accept-Encoding.
+
+Сжимаются только ответы с текстовыми типами длиннее COMPRESS_MIN_SIZE байт.
+Потоковые ответы (NDJSON-выдача, экспорт) не трогаются: их тело
+формируется по частям, а экспорт умеет сжиматься сам (gzip=1).
+brotli используется, если установлен пакет brotli.
+
+    compression.init_app(app)   - подключает сжатие к приложению Flask
+"""
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/html')
+
+
+def settings():
+    return {
+        'min_size': int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+        'gzip_level': int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+        # Качество 4 в несколько раз быстрее gzip -6 при близкой степени сжатия
+        'brotli_quality': int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+    }
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_encoding(accept_encodings):
+    """Лучшая поддерживаемая кодировка из Accept-Encoding или None."""
+    return accept_encodings.best_match(available_encodings())
+
+
+def should_compress(response, size, min_size):
+    return (
+        200 <= response.status_code < 300
+        and response.status_code != 204
+        and 'Content-Encoding' not in response.headers
+        and response.mimetype in COMPRESSIBLE_TYPES
+        and size >= min_size
+    )
+
+
+def compress(data, encoding, options):
+    if encoding == 'br':
+        return brotli.compress(data, quality=options['brotli_quality'])
+    return gzip.compress(data, compresslevel=options['gzip_level'])
+
+
+def mark_compressed(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Сжатое тело отличается побайтно, поэтому ETag становится слабым
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+
+
+def init_app(app, options=None):
+    options = options or settings()
+
+    @app.after_request
+    def compress_response(response):
+        if response.is_streamed or response.direct_passthrough:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if not encoding:
+            return response
+        data = response.get_data()
+        if not should_compress(response, len(data), options['min_size']):
+            return response
+        response.set_data(compress(data, encoding, options))
+        mark_compressed(response, encoding)
+        return response
+
+    return app
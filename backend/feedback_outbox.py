@@ -0,0 +1,309 @@
+"""Очередь отправки обратной связи в Telegram.
+
+Маршрут /api/feedback только сохраняет сообщение в коллекцию feedback_outbox
+и сразу отвечает клиенту. Фоновый поток FeedbackDispatcher забирает сообщения
+пачками, отправляет их через общий клиент http_client, повторяет неудачные
+попытки с экспоненциальной задержкой и соблюдает ограничения Telegram
+(не чаще одного сообщения в TELEGRAM_MIN_INTERVAL секунд, retry_after из
+ответа 429).
+
+Интервал соблюдается внутри одного процесса, поэтому диспетчер должен быть
+один на развертывание. Сервер разработки и waitress запускают его в своем
+процессе, а под gunicorn (несколько воркеров) он выключен в воркерах и
+запускается отдельным процессом командой run.
+
+Запуск:
+    python feedback_outbox.py run     - диспетчер отдельным процессом (до SIGTERM / Ctrl+C)
+    python feedback_outbox.py status  - размер очереди и время доставки
+    python feedback_outbox.py drain   - отправить все, что есть в очереди, и выйти
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, ReturnDocument
+
+import http_client
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB_NAME = 'diary_db'
+
+
+class FeedbackOutbox:
+    """Хранилище исходящих сообщений в MongoDB."""
+
+    def __init__(self, collection, max_attempts=8, backoff_base=2.0, backoff_max=600.0, lease=60.0):
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+
+    def enqueue(self, text):
+        now = datetime.utcnow()
+        result = self.collection.insert_one({
+            'text': text,
+            'status': PENDING,
+            'attempts': 0,
+            'created_at': now,
+            'next_attempt_at': now
+        })
+        return result.inserted_id
+
+    def claim(self, limit):
+        """Забирает до limit сообщений, готовых к отправке.
+
+        Сообщение помечается как отправляемое до lease_until, поэтому
+        несколько диспетчеров не отправят его дважды, а сообщение упавшего
+        диспетчера вернется в работу после истечения аренды.
+        """
+        claimed = []
+        for _ in range(limit):
+            now = datetime.utcnow()
+            doc = self.collection.find_one_and_update(
+                {'$or': [
+                    {'status': PENDING, 'next_attempt_at': {'$lte': now}},
+                    {'status': SENDING, 'lease_until': {'$lte': now}}
+                ]},
+                {
+                    '$set': {'status': SENDING, 'lease_until': now + timedelta(seconds=self.lease)},
+                    '$inc': {'attempts': 1}
+                },
+                sort=[('next_attempt_at', ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not doc:
+                break
+            claimed.append(doc)
+        return claimed
+
+    def mark_sent(self, doc):
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'_id': doc['_id']},
+            {
+                '$set': {
+                    'status': SENT,
+                    'sent_at': now,
+                    'latency': (now - doc['created_at']).total_seconds()
+                },
+                '$unset': {'lease_until': '', 'text': ''}
+            }
+        )
+
+    def mark_failed(self, doc, error, retry_after=None):
+        attempts = doc.get('attempts', 1)
+        if attempts >= self.max_attempts:
+            update = {'$set': {'status': FAILED, 'last_error': error}, '$unset': {'lease_until': ''}}
+        else:
+            delay = retry_after
+            if delay is None:
+                delay = min(self.backoff_base ** attempts, self.backoff_max)
+            update = {
+                '$set': {
+                    'status': PENDING,
+                    'last_error': error,
+                    'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)
+                },
+                '$unset': {'lease_until': ''}
+            }
+        self.collection.update_one({'_id': doc['_id']}, update)
+
+    def defer(self, doc, delay):
+        # Возвращает сообщение в очередь, не засчитывая попытку
+        self.collection.update_one(
+            {'_id': doc['_id']},
+            {
+                '$set': {
+                    'status': PENDING,
+                    'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)
+                },
+                '$inc': {'attempts': -1},
+                '$unset': {'lease_until': ''}
+            }
+        )
+
+    def stats(self, latency_window=100):
+        # Подсчет по индексу (status, ...), без чтения документов; отправленные
+        # сообщения хранятся только FEEDBACK_SENT_TTL (см. indexes.py)
+        counts = {status: self.collection.count_documents({'status': status})
+                  for status in (PENDING, SENDING, SENT, FAILED)}
+
+        oldest = self.collection.find_one(
+            {'status': {'$in': [PENDING, SENDING]}},
+            {'created_at': 1},
+            sort=[('created_at', ASCENDING)]
+        )
+        recent = [
+            doc['latency'] for doc in self.collection.find(
+                {'status': SENT}, {'latency': 1}
+            ).sort('sent_at', -1).limit(latency_window)
+        ]
+
+        return {
+            'queue_depth': counts[PENDING] + counts[SENDING],
+            'counts': counts,
+            'oldest_pending_age': (datetime.utcnow() - oldest['created_at']).total_seconds() if oldest else 0,
+            'delivery_latency_avg': round(sum(recent) / len(recent), 3) if recent else 0,
+            'delivery_latency_max': round(max(recent), 3) if recent else 0
+        }
+
+
+class TelegramSender:
+    """Отправка сообщений в Telegram через переиспользуемые соединения."""
+
+    def __init__(self, bot_token, chat_id, api_url=None, min_interval=1.0, client=None):
+        self.url = f"{api_url or 'https://api.telegram.org'}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.client = client or http_client.get_client('telegram')
+        self._last_sent = 0.0
+
+    def send(self, text):
+        """Возвращает (ok, retry_after, error)."""
+        wait = self._last_sent + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_sent = time.monotonic()
+
+        try:
+            response = self.client.post(self.url, json={
+                'chat_id': self.chat_id,
+                'text': text,
+                'parse_mode': 'HTML'
+            })
+        except requests.exceptions.RequestException as e:
+            return False, None, f"Network error: {str(e)}"
+
+        if response.status_code == 200:
+            return True, None, None
+
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after')
+            except ValueError:
+                pass
+        return False, retry_after, f"Telegram API error: {response.text}"
+
+
+class FeedbackDispatcher(threading.Thread):
+    """Фоновый поток, который разбирает очередь обратной связи."""
+
+    def __init__(self, outbox, sender, batch_size=10, poll_interval=1.0):
+        super().__init__(name='feedback-dispatcher', daemon=True)
+        self.outbox = outbox
+        self.sender = sender
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                sent = self.dispatch_once()
+            except Exception as e:
+                print(f"Feedback dispatcher error: {str(e)}")
+                sent = 0
+            if not sent:
+                self._stop_event.wait(self.poll_interval)
+
+    def dispatch_once(self):
+        """Отправляет одну пачку. Возвращает число обработанных сообщений."""
+        batch = self.outbox.claim(self.batch_size)
+        for index, doc in enumerate(batch):
+            ok, retry_after, error = self.sender.send(doc['text'])
+            if ok:
+                self.outbox.mark_sent(doc)
+                continue
+
+            print(error)
+            self.outbox.mark_failed(doc, error, retry_after)
+            if retry_after:
+                # Telegram просит подождать - возвращаем остаток пачки в очередь
+                for rest in batch[index + 1:]:
+                    self.outbox.defer(rest, retry_after)
+                self._stop_event.wait(retry_after)
+                break
+        return len(batch)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def create_outbox(db):
+    return FeedbackOutbox(
+        db['feedback_outbox'],
+        max_attempts=int(os.getenv('FEEDBACK_MAX_ATTEMPTS', '8'))
+    )
+
+
+def create_dispatcher(outbox):
+    """Создает диспетчер, если бот настроен, иначе возвращает None."""
+    bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
+    chat_id = os.getenv('TELEGRAM_CHAT_ID')
+    if not bot_token or not chat_id:
+        return None
+    sender = TelegramSender(
+        bot_token,
+        chat_id,
+        api_url=os.getenv('TELEGRAM_API_URL'),
+        min_interval=float(os.getenv('TELEGRAM_MIN_INTERVAL', '1.0'))
+    )
+    return FeedbackDispatcher(
+        outbox,
+        sender,
+        batch_size=int(os.getenv('FEEDBACK_BATCH_SIZE', '10'))
+    )
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Очередь обратной связи')
+    parser.add_argument('command', choices=['run', 'status', 'drain'])
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', DEFAULT_DB_NAME))
+    args = parser.parse_args()
+
+    outbox = create_outbox(MongoClient(args.uri)[args.db])
+
+    if args.command in ('run', 'drain'):
+        dispatcher = create_dispatcher(outbox)
+        if dispatcher is None:
+            print("Telegram бот не настроен")
+            return 1
+
+    if args.command == 'run':
+        # Поток не запускается: цикл диспетчера выполняется в основном потоке
+        signal.signal(signal.SIGTERM, lambda signum, frame: dispatcher.stop())
+        print("Диспетчер обратной связи запущен")
+        try:
+            dispatcher.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'drain':
+        while dispatcher.dispatch_once():
+            pass
+
+    for key, value in outbox.stats().items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
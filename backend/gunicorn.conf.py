@@ -0,0 +1,48 @@
+"""Настройки gunicorn для продакшена (Linux/Mac).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Все значения можно переопределить переменными окружения.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Процессы и потоки в каждом: маршруты в основном ждут MongoDB и внешние API,
+# поэтому потоки (gthread) дешевле, чем дополнительные процессы
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+
+# Воркеры наследуют окружение: по числу потоков auth ограничивает очередь хеширования
+os.environ['SERVER_THREADS'] = str(threads)
+
+# Отправка обратной связи в Telegram: TELEGRAM_MIN_INTERVAL соблюдается внутри
+# процесса, поэтому диспетчер в каждом воркере превысил бы лимит Telegram.
+# В воркерах он выключен, запустите его одним отдельным процессом:
+#     python feedback_outbox.py run
+os.environ['FEEDBACK_DISPATCHER'] = 'off'
+
+# Приложение загружается в каждом воркере после fork, поэтому у каждого
+# воркера свой MongoClient. Размер его пула задает MONGO_MAX_POOL_SIZE,
+# разумно держать его не меньше числа потоков
+preload_app = False
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Перезапуск воркеров через случайное число запросов защищает от утечек памяти
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    # Воркер завершается (в том числе по SIGTERM после обработки текущих
+    # запросов) - останавливаем отправку обратной связи и закрываем пул MongoDB
+    import app
+    app.shutdown(timeout=graceful_timeout)
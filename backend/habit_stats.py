@@ -0,0 +1,164 @@
+"""Статистика привычек: серии, доля выполнения, тепловая карта за год.
+
+Отметки привычки переводятся в битовую маску (бит i - день base + i),
+после чего серии и счетчики считаются операциями над целым числом Python
+без перебора дат по одной. Результаты запоминаются по привычке и ее
+ревизии (_rev), поэтому отметки загружаются только для изменившихся привычек.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import habit_storage
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+def to_bitset(days):
+    """Отсортированные номера дней -> (base, маска)."""
+    if not days:
+        return 0, 0
+    base = days[0]
+    data = bytearray((days[-1] - base) // 8 + 1)
+    for day in days:
+        offset = day - base
+        data[offset >> 3] |= 1 << (offset & 7)
+    return base, int.from_bytes(data, 'little')
+
+
+def _range_mask(base, start, end):
+    """Маска дней [start, end) в координатах маски с началом base."""
+    start = max(start - base, 0)
+    end = end - base
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def count_in_range(base, bits, start, end):
+    return _popcount(bits & _range_mask(base, start, end))
+
+
+def longest_run(bits):
+    """Длина самой длинной серии единиц: каждая итерация укорачивает все серии на 1."""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def run_ending_at(base, bits, day):
+    """Длина серии единиц, которая заканчивается днем day."""
+    offset = day - base
+    if offset < 0 or not (bits >> offset) & 1:
+        return 0
+    # Биты до day включительно, инвертированные: первая единица сверху - конец серии
+    window = bits & ((1 << (offset + 1)) - 1)
+    inverted = ~window & ((1 << (offset + 1)) - 1)
+    if not inverted:
+        return offset + 1
+    return offset - inverted.bit_length() + 1
+
+
+def _month_start(day_date, months_back):
+    month = day_date.month - 1 - months_back
+    return date(day_date.year + month // 12, month % 12 + 1, 1)
+
+
+def compute(days, today, year, weeks=12, months=12):
+    base, bits = to_bitset(days)
+    today_day = (today - habit_storage.EPOCH).days
+
+    # Серия не прерывается, пока сегодняшняя отметка еще не поставлена
+    current = run_ending_at(base, bits, today_day) or run_ending_at(base, bits, today_day - 1)
+
+    weekly = []
+    week_start = today - timedelta(days=today.weekday())
+    for index in range(weeks - 1, -1, -1):
+        start = week_start - timedelta(weeks=index)
+        start_day = (start - habit_storage.EPOCH).days
+        end_day = min(start_day + 7, today_day + 1)
+        completed = count_in_range(base, bits, start_day, end_day)
+        iso_year, iso_week, _ = start.isocalendar()
+        weekly.append({
+            'week': f"{iso_year}-W{iso_week:02d}",
+            'completed': completed,
+            'rate': round(completed / (end_day - start_day), 3)
+        })
+
+    monthly = []
+    for index in range(months - 1, -1, -1):
+        start = _month_start(today, index)
+        end = _month_start(today, index - 1)
+        start_day = (start - habit_storage.EPOCH).days
+        end_day = min((end - habit_storage.EPOCH).days, today_day + 1)
+        completed = count_in_range(base, bits, start_day, end_day)
+        monthly.append({
+            'month': start.strftime('%Y-%m'),
+            'completed': completed,
+            'rate': round(completed / (end_day - start_day), 3)
+        })
+
+    year_start = (date(year, 1, 1) - habit_storage.EPOCH).days
+    year_end = (date(year + 1, 1, 1) - habit_storage.EPOCH).days
+    shift = year_start - base
+    year_bits = (bits >> shift if shift >= 0 else bits << -shift) & ((1 << (year_end - year_start)) - 1)
+    heatmap = format(year_bits, 'b').zfill(year_end - year_start)[::-1] if year_bits else '0' * (year_end - year_start)
+
+    return {
+        'total': len(days),
+        'current_streak': current,
+        'longest_streak': longest_run(bits),
+        'last_7_days': round(count_in_range(base, bits, today_day - 6, today_day + 1) / 7, 3),
+        'last_30_days': round(count_in_range(base, bits, today_day - 29, today_day + 1) / 30, 3),
+        'weekly': weekly,
+        'monthly': monthly,
+        # Символ i - день year-01-01 + i: '1' выполнено, '0' нет
+        'heatmap': {'year': year, 'days': heatmap}
+    }
+
+
+class HabitStatsCache:
+    """Запомненная статистика по привычкам (LRU).
+
+    Ключ - ревизия привычки (_rev), дата и год. Любое изменение отметок, в том
+    числе из других процессов, меняет ревизию, поэтому проверить кэш можно до
+    загрузки отметок. Привычки без ревизии (запись еще не завершена) не
+    запоминаются; invalidate() освобождает запись удаленной привычки.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, habit_id, rev, today, year):
+        """Запомненная статистика или None."""
+        if rev is None:
+            return None
+        habit_id = str(habit_id)
+        with self._lock:
+            item = self._items.get(habit_id)
+            if item is None or item[0] != (rev, today, year):
+                return None
+            self._items.move_to_end(habit_id)
+            return item[1]
+
+    def compute(self, habit, today, year):
+        """Считает статистику по документу с отметками и запоминает ее по его _rev."""
+        stats = compute(habit_storage.completed_days(habit), today, year)
+        if habit.get('_rev') is not None:
+            habit_id = str(habit['_id'])
+            with self._lock:
+                self._items[habit_id] = ((habit['_rev'], today, year), stats)
+                self._items.move_to_end(habit_id)
+                while len(self._items) > self.max_size:
+                    self._items.popitem(last=False)
+        return stats
+
+    def invalidate(self, habit_id):
+        with self._lock:
+            self._items.pop(str(habit_id), None)
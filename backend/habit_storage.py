@@ -0,0 +1,194 @@
+"""Форматы хранения отметок выполнения привычек.
+
+Поддерживаются два формата:
+    dates - список строк YYYY-MM-DD в поле completed_dates (исходный формат)
+    days  - список целых чисел в поле completed_days: номер дня от 1970-01-01
+
+Формат для новых привычек и переключений задается переменной HABIT_STORAGE.
+Документ в другом формате переводится в текущий при первом переключении
+(например, после возврата с days на dates), а всю коллекцию можно перевести
+сразу командой:
+
+    python habit_storage.py migrate --to days
+"""
+import argparse
+import os
+import sys
+from datetime import date as date_type, datetime, timedelta
+
+from pymongo import MongoClient, UpdateOne
+
+DATES = 'dates'
+DAYS = 'days'
+STORAGE_FORMATS = (DATES, DAYS)
+
+EPOCH = date_type(1970, 1, 1)
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB_NAME = 'diary_db'
+
+
+def storage_format():
+    value = os.getenv('HABIT_STORAGE', DATES)
+    return value if value in STORAGE_FORMATS else DATES
+
+
+def date_to_day(value):
+    """'2024-01-05' -> номер дня от 1970-01-01."""
+    return (datetime.strptime(value, '%Y-%m-%d').date() - EPOCH).days
+
+
+def day_to_date(day):
+    """Номер дня от 1970-01-01 -> '2024-01-05'."""
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+def empty_completions(fmt=None):
+    fmt = fmt or storage_format()
+    return {'completed_days': []} if fmt == DAYS else {'completed_dates': []}
+
+
+def completed_days(habit):
+    """Отсортированные номера дней выполнения для документа в любом формате."""
+    days = set(habit.get('completed_days') or [])
+    days.update(date_to_day(value) for value in habit.get('completed_dates') or [])
+    return sorted(days)
+
+
+def to_api(habit):
+    """Приводит документ к виду, который ожидает фронтенд (completed_dates)."""
+    if 'completed_days' in habit:
+        habit['completed_dates'] = [day_to_date(day) for day in completed_days(habit)]
+        del habit['completed_days']
+    habit.pop('_rev', None)
+    return habit
+
+
+def _toggle_value(field, value):
+    current = {'$ifNull': ['$' + field, []]}
+    return {'$cond': [
+        {'$in': [value, current]},
+        {'$filter': {'input': current, 'cond': {'$ne': ['$$this', value]}}},
+        {'$concatArrays': [current, [value]]}
+    ]}
+
+
+def _dates_as_days():
+    # completed_dates -> номера дней на стороне сервера
+    return {'$map': {
+        'input': {'$ifNull': ['$completed_dates', []]},
+        'in': {'$toInt': {'$divide': [
+            {'$toLong': {'$dateFromString': {'dateString': '$$this', 'format': '%Y-%m-%d'}}},
+            MS_PER_DAY
+        ]}}
+    }}
+
+
+def _days_as_dates(days):
+    # Выражение с номерами дней -> строки YYYY-MM-DD на стороне сервера
+    return {'$map': {
+        'input': days,
+        'in': {'$dateToString': {
+            'format': '%Y-%m-%d',
+            'date': {'$toDate': {'$multiply': [{'$toLong': '$$this'}, MS_PER_DAY]}}
+        }}
+    }}
+
+
+def toggle_pipeline(date, fmt=None):
+    """Pipeline-обновление, которое атомарно ставит или снимает отметку за дату.
+
+    Используется с find_one_and_update: проверка наличия даты и изменение
+    списка выполняются сервером в одной операции, поэтому параллельные
+    переключения не затирают друг друга.
+    """
+    fmt = fmt or storage_format()
+    if fmt == DATES:
+        return [
+            # Ленивый перевод документа из формата days; без completed_days
+            # список дат остается как есть
+            {'$set': {'completed_dates': {'$cond': [
+                {'$gt': [{'$size': {'$ifNull': ['$completed_days', []]}}, 0]},
+                {'$setUnion': [
+                    {'$ifNull': ['$completed_dates', []]},
+                    _days_as_dates('$completed_days')
+                ]},
+                {'$ifNull': ['$completed_dates', []]}
+            ]}}},
+            {'$project': {'completed_days': 0}},
+            {'$set': {'completed_dates': _toggle_value('completed_dates', date)}}
+        ]
+
+    return [
+        # Ленивый перевод документа из старого формата
+        {'$set': {'completed_days': {'$setUnion': [
+            {'$ifNull': ['$completed_days', []]},
+            _dates_as_days()
+        ]}}},
+        {'$project': {'completed_dates': 0}},
+        {'$set': {'completed_days': _toggle_value('completed_days', date_to_day(date))}}
+    ]
+
+
+def month_dates_expr(start, end):
+    """Выражение агрегации: даты выполнения в диапазоне [start, end) строками.
+
+    Учитывает оба формата, чтобы сводка работала и во время миграции.
+    """
+    start_day = date_to_day(start)
+    end_day = date_to_day(end)
+    from_dates = {'$filter': {
+        'input': {'$ifNull': ['$completed_dates', []]},
+        'cond': {'$and': [{'$gte': ['$$this', start]}, {'$lt': ['$$this', end]}]}
+    }}
+    from_days = _days_as_dates({'$filter': {
+        'input': {'$ifNull': ['$completed_days', []]},
+        'cond': {'$and': [{'$gte': ['$$this', start_day]}, {'$lt': ['$$this', end_day]}]}
+    }})
+    return {'$setUnion': [from_dates, from_days]}
+
+
+def migrate(collection, to=DAYS, batch_size=1000):
+    """Переводит все привычки в указанный формат пачками bulk_write."""
+    source_field = 'completed_dates' if to == DAYS else 'completed_days'
+    cursor = collection.find({source_field: {'$exists': True}},
+                             {'completed_dates': 1, 'completed_days': 1})
+    batch = []
+    migrated = 0
+    for habit in cursor:
+        days = completed_days(habit)
+        if to == DAYS:
+            update = {'$set': {'completed_days': days}, '$unset': {'completed_dates': ''}}
+        else:
+            update = {'$set': {'completed_dates': [day_to_date(day) for day in days]},
+                      '$unset': {'completed_days': ''}}
+        batch.append(UpdateOne({'_id': habit['_id']}, update))
+        if len(batch) >= batch_size:
+            collection.bulk_write(batch, ordered=False)
+            migrated += len(batch)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+        migrated += len(batch)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Формат хранения отметок привычек')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='перевести привычки в другой формат')
+    migrate_parser.add_argument('--to', choices=STORAGE_FORMATS, default=DAYS)
+    migrate_parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', DEFAULT_DB_NAME))
+    args = parser.parse_args()
+
+    collection = MongoClient(args.uri)[args.db]['habits']
+    count = migrate(collection, to=args.to, batch_size=args.batch_size)
+    print(f"Обновлено привычек: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Общий клиент для исходящих HTTP-запросов к внешним API.
+
+Для каждого внешнего сервиса (newsapi, telegram) создается свой UpstreamClient:
+    - requests.Session с пулом keep-alive соединений, чтобы не открывать
+      TCP+TLS соединение на каждый запрос
+    - таймауты по умолчанию для сервиса
+    - предохранитель (circuit breaker): после серии ошибок запросы сразу
+      завершаются CircuitOpenError, пока сервис не восстановится
+    - гистограмма задержек и счетчики ошибок
+
+Настройки сервиса читаются из переменных окружения с префиксом
+UPSTREAM_<ИМЯ>_, например UPSTREAM_NEWSAPI_TIMEOUT=5.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Histogram
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Сервис недоступен, запрос не выполнялся."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                # Пропускаем один пробный запрос
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+
+class UpstreamClient:
+
+    def __init__(self, name, timeout=10.0, connect_timeout=3.05, pool_size=10,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.timeout = (connect_timeout, timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = Histogram()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._rejected = 0
+
+    def request(self, method, url, **kwargs):
+        if not self.breaker.allow():
+            with self._lock:
+                self._rejected += 1
+            raise CircuitOpenError(f"{self.name}: сервис временно недоступен")
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self._record(started, failed=True)
+            raise
+
+        # Ответы 5xx означают проблемы сервиса, остальные коды - нормальная работа
+        self._record(started, failed=response.status_code >= 500)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, started, failed):
+        self.latency.observe(time.perf_counter() - started)
+        with self._lock:
+            self._requests += 1
+            if failed:
+                self._errors += 1
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            requests_count, errors, rejected = self._requests, self._errors, self._rejected
+        return {
+            'circuit': self.breaker.state,
+            'requests': requests_count,
+            'errors': errors,
+            'rejected': rejected,
+            'error_rate': round(errors / requests_count, 3) if requests_count else 0,
+            'latency': self.latency.summary()
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _setting(name, key, default):
+    return float(os.getenv(f"UPSTREAM_{name.upper()}_{key}", default))
+
+
+def get_client(name):
+    """Возвращает общий клиент сервиса, создавая его при первом обращении."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = UpstreamClient(
+                name,
+                timeout=_setting(name, 'TIMEOUT', 10),
+                connect_timeout=_setting(name, 'CONNECT_TIMEOUT', 3.05),
+                pool_size=int(_setting(name, 'POOL_SIZE', 10)),
+                failure_threshold=int(_setting(name, 'FAILURE_THRESHOLD', 5)),
+                reset_timeout=_setting(name, 'RESET_TIMEOUT', 30)
+            )
+            _clients[name] = client
+        return client
+
+
+def all_clients():
+    with _clients_lock:
+        return list(_clients.values())
+
+
+def all_stats():
+    return {client.name: client.stats() for client in all_clients()}
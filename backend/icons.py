@@ -0,0 +1,7 @@
+# Ключи иконок записей (совпадают с src/utils/icons.js на фронтенде)
+ICON_KEYS = [
+    'pen', 'book', 'heart', 'star', 'lightbulb', 
+    'feather', 'quote', 'bookOpen', 'scroll', 'clock',
+    'nature', 'sunny', 'night', 'cloud', 'flower',
+    'journal', 'iobook', 'create', 'pencil', 'bibookopen'
+]
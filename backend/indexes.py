@@ -0,0 +1,230 @@
+"""Управление индексами MongoDB и проверка планов запросов.
+
+Запуск:
+    python indexes.py           - создать недостающие индексы
+    python indexes.py --check   - создать индексы и проверить планы всех запросов
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, MongoClient
+from pymongo.errors import PyMongoError
+
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB_NAME = 'diary_db'
+# Сколько секунд хранить доставленную обратную связь (feedback_outbox.SENT)
+FEEDBACK_SENT_TTL = int(os.getenv('FEEDBACK_SENT_TTL', str(7 * 24 * 3600)))
+
+# Индексы по коллекциям: (ключи, параметры create_index)
+INDEXES = {
+    'entries': [
+        # Список записей пользователя, отсортированный по дате,
+        # и курсорная пагинация по (date, _id)
+        ([('user_id', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'user_id_date_id'}),
+        # Полнотекстовый поиск по записям пользователя (search.py)
+        ([('user_id', ASCENDING), ('title', TEXT), ('content', TEXT)],
+         {'name': 'user_id_text', 'default_language': 'russian', 'weights': {'title': 3, 'content': 1}}),
+        # Изменения после ревизии для /api/sync
+        ([('user_id', ASCENDING), ('_rev', ASCENDING)], {'name': 'user_id_rev'}),
+    ],
+    'users': [
+        ([('username', ASCENDING)], {'name': 'username_unique', 'unique': True}),
+    ],
+    'habits': [
+        ([('user_id', ASCENDING)], {'name': 'user_id'}),
+        ([('user_id', ASCENDING), ('_rev', ASCENDING)], {'name': 'user_id_rev'}),
+    ],
+    'tombstones': [
+        # Удаления после ревизии для /api/sync
+        ([('user_id', ASCENDING), ('rev', ASCENDING)], {'name': 'user_id_rev'}),
+        # Надгробия MongoDB удаляет сама после expires_at
+        ([('expires_at', ASCENDING)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    ],
+    'feedback_outbox': [
+        # Выбор следующих сообщений для отправки
+        ([('status', ASCENDING), ('next_attempt_at', ASCENDING)], {'name': 'status_next_attempt_at'}),
+        # Время доставки последних отправленных сообщений (FeedbackOutbox.stats)
+        ([('status', ASCENDING), ('sent_at', ASCENDING)], {'name': 'status_sent_at'}),
+        # Отправленные сообщения MongoDB удаляет сама через FEEDBACK_SENT_TTL,
+        # ожидающие и неотправленные остаются
+        ([('sent_at', ASCENDING)], {'name': 'sent_at_ttl', 'expireAfterSeconds': FEEDBACK_SENT_TTL,
+                                    'partialFilterExpression': {'status': 'sent'}}),
+    ],
+}
+
+# Стадии плана, которых не должно быть в горячих запросах
+FORBIDDEN_STAGES = ('COLLSCAN', 'SORT')
+
+
+class Aggregation:
+    """Агрегация для check_query_plans: explain() как у курсора find()."""
+
+    def __init__(self, collection, pipeline):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    def explain(self):
+        return self.collection.database.command(
+            'aggregate', self.collection.name, pipeline=self.pipeline, explain=True
+        )
+
+
+def ensure_indexes(db):
+    """Создает индексы из INDEXES. Повторный вызов ничего не меняет.
+
+    Ошибка одного индекса (например, конфликт с существующим индексом с другими
+    параметрами) не мешает создать остальные. Возвращает (созданные индексы,
+    список (индекс, текст ошибки)).
+    """
+    created = []
+    failed = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        for keys, options in indexes:
+            name = f"{collection_name}.{options['name']}"
+            try:
+                collection.create_index(keys, **options)
+            except PyMongoError as e:
+                failed.append((name, str(e)))
+            else:
+                created.append(name)
+    return created, failed
+
+
+def query_shapes(db):
+    """Формы запросов, которые выполняют маршруты app.py и фоновые службы.
+
+    Каждый элемент - (название, функция, возвращающая курсор или Aggregation
+    для explain()) и, если нужно, стадии, которые для этой формы допустимы.
+    Значения параметров не важны, важна только форма запроса.
+    """
+    user_id = str(ObjectId())
+    entry_id = ObjectId()
+    now = datetime.utcnow()
+    entries = db['entries']
+    users = db['users']
+    habits = db['habits']
+    tombstones = db['tombstones']
+    imports = db['imports']
+    outbox = db['feedback_outbox']
+    return [
+        ('get_entries', lambda: entries.find({'user_id': user_id}).sort(
+            [('date', DESCENDING), ('_id', DESCENDING)])),
+        ('get_entries (after)', lambda: entries.find({
+            'user_id': user_id,
+            '$or': [
+                {'date': {'$lt': '2024-01-01'}},
+                {'date': '2024-01-01', '_id': {'$lt': entry_id}},
+            ],
+        }).sort([('date', DESCENDING), ('_id', DESCENDING)]).limit(51)),
+        ('get_calendar (entries)', lambda: Aggregation(entries, [
+            {'$match': {'user_id': user_id, 'date': {'$gte': '2024-01-01', '$lt': '2024-02-01'}}},
+            {'$sort': {'date': 1}},
+            {'$group': {'_id': {'$substrCP': ['$date', 0, 10]}, 'count': {'$sum': 1}}},
+        ])),
+        ('get_calendar (habits)', lambda: Aggregation(habits, [
+            {'$match': {'user_id': user_id}},
+            {'$project': {'dates': '$completed_dates'}},
+            {'$unwind': '$dates'},
+            {'$group': {'_id': '$dates', 'completed': {'$sum': 1}}},
+        ])),
+        # Сортировка по релевантности всегда выполняется в памяти, важно только,
+        # чтобы записи отбирал текстовый индекс, а не полный просмотр
+        ('search_entries (mongo)', lambda: Aggregation(entries, [
+            {'$match': {'user_id': user_id, '$text': {'$search': 'слово', '$language': 'russian'}}},
+            {'$addFields': {'score': {'$meta': 'textScore'}}},
+            {'$sort': {'score': -1, '_id': -1}},
+            {'$limit': 21},
+        ]), ('SORT',)),
+        ('update_entry / delete_entry', lambda: entries.find({'_id': entry_id, 'user_id': user_id})),
+        ('register / login', lambda: users.find({'username': 'user'})),
+        ('get_user_preferences', lambda: users.find({'_id': entry_id})),
+        ('get_habits', lambda: habits.find({'user_id': user_id})),
+        ('toggle_habit / delete_habit', lambda: habits.find({'_id': entry_id, 'user_id': user_id})),
+        ('sync (entries)', lambda: entries.find({'user_id': user_id, '_rev': {'$gt': 10}})),
+        ('sync (habits)', lambda: habits.find({'user_id': user_id, '_rev': {'$gt': 10}})),
+        ('sync (tombstones)', lambda: tombstones.find({'user_id': user_id, 'rev': {'$gt': 10}})),
+        ('import / get_import', lambda: imports.find({'_id': f'{user_id}:import', 'user_id': user_id})),
+        ('feedback dispatcher (claim)', lambda: outbox.find({'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'sending', 'lease_until': {'$lte': now}},
+        ]}).sort('next_attempt_at', ASCENDING).limit(1)),
+        ('get_feedback_status (counts)', lambda: outbox.find({'status': 'pending'})),
+        ('get_feedback_status (latency)', lambda: outbox.find(
+            {'status': 'sent'}, {'latency': 1}).sort('sent_at', DESCENDING).limit(100)),
+    ]
+
+
+def plan_stages(plan):
+    """Возвращает все стадии дерева плана."""
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages.extend(plan_stages(plan['inputStage']))
+    for child in plan.get('inputStages', []):
+        stages.extend(plan_stages(child))
+    return [stage for stage in stages if stage]
+
+
+def winning_plan(explain):
+    if 'stages' in explain:
+        # План агрегации, в которой к запросу перенесена только часть конвейера
+        explain = explain['stages'][0].get('$cursor', {})
+    planner = explain.get('queryPlanner', {})
+    plan = planner.get('winningPlan', {})
+    # В новых версиях MongoDB план движка SBE лежит внутри queryPlan
+    return plan.get('queryPlan', plan)
+
+
+def check_query_plans(db):
+    """Выполняет explain() для каждой формы запроса.
+
+    Возвращает список (название, стадии, ok).
+    """
+    results = []
+    for name, make_cursor, *allowed in query_shapes(db):
+        forbidden = set(FORBIDDEN_STAGES) - set(allowed[0] if allowed else ())
+        stages = plan_stages(winning_plan(make_cursor().explain()))
+        ok = not any(stage in forbidden for stage in stages)
+        results.append((name, stages, ok))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Индексы MongoDB для дневника')
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', DEFAULT_DB_NAME))
+    parser.add_argument('--check', action='store_true', help='проверить планы запросов')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client[args.db]
+
+    created, failed_indexes = ensure_indexes(db)
+    for name in created:
+        print(f"Индекс: {name}")
+    for name, error in failed_indexes:
+        print(f"[FAIL] Индекс {name}: {error}")
+
+    if not args.check:
+        return 1 if failed_indexes else 0
+
+    failed = len(failed_indexes)
+    for name, stages, ok in check_query_plans(db):
+        status = 'OK' if ok else 'FAIL'
+        print(f"[{status}] {name}: {' <- '.join(stages)}")
+        if not ok:
+            failed += 1
+
+    if failed:
+        print(f"Ошибок индексов и запросов без подходящего индекса: {failed}")
+        return 1
+    print("Все запросы используют индексы")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
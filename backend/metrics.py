@@ -0,0 +1,220 @@
+"""Простые метрики для наблюдения за сервером: гистограммы, счетчики и вывод в формате Prometheus."""
+import threading
+import time
+
+# Границы корзин в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, безопасная для потоков."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Возвращает (накопленные счетчики по корзинам, сумма, количество).
+
+        Последний счетчик соответствует корзине +Inf.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины."""
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for bound, value in zip(self.buckets, cumulative):
+            if value >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        _, total, count = self.snapshot()
+        return {
+            'count': count,
+            'avg': round(total / count, 4) if count else 0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class DecayingAverage:
+    """Скользящее среднее, которое без новых значений затухает к нулю.
+
+    Каждое значение сдвигает среднее на долю alpha, а за half_life секунд
+    среднее уменьшается вдвое. Так признак перегрузки сам сбрасывается,
+    когда новых измерений нет.
+    """
+
+    def __init__(self, half_life=5.0, alpha=0.2, clock=time.monotonic):
+        self.half_life = half_life
+        self.alpha = alpha
+        self.clock = clock
+        self._value = 0.0
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _decay(self):
+        now = self.clock()
+        self._value *= 0.5 ** ((now - self._updated) / self.half_life)
+        self._updated = now
+
+    def observe(self, value):
+        with self._lock:
+            self._decay()
+            self._value += self.alpha * (value - self._value)
+
+    def get(self):
+        with self._lock:
+            self._decay()
+            return self._value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    """Набор метрик одного имени с разными значениями меток."""
+
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _child(self, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = factory()
+            return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in sorted(self.items()):
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+
+class HistogramFamily(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def labels(self, **labels):
+        return self._child(labels, lambda: Histogram(self.buckets))
+
+    def _render_child(self, labels, histogram):
+        return render_histogram(self.name, labels, histogram)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class CounterFamily(_Family):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._child(labels, _Value).add(amount)
+
+    def _render_child(self, labels, counter):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(counter.value)}"]
+
+
+class GaugeFamily(CounterFamily):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self._child(labels, _Value).set(value)
+
+
+def render_histogram(name, labels, histogram):
+    """Строки формата Prometheus для одной гистограммы."""
+    labels = tuple(labels)
+    cumulative, total, count = histogram.snapshot()
+    bounds = list(histogram.buckets) + [float('inf')]
+    lines = [
+        f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {value}"
+        for bound, value in zip(bounds, cumulative)
+    ]
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return lines
+
+
+def render_value(name, kind, help_text, value, labels=()):
+    return [
+        f"# HELP {name} {help_text}",
+        f"# TYPE {name} {kind}",
+        f"{name}{_format_labels(tuple(labels))} {_format_value(value)}"
+    ]
+
+
+REGISTRY = []
+
+
+def render_all():
+    lines = []
+    for family in REGISTRY:
+        lines.extend(family.render())
+    return lines
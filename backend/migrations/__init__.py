@@ -0,0 +1,135 @@
+"""Версионированные миграции данных MongoDB.
+
+Каждая миграция - подкласс Migration в модуле mNNNN_*.py, зарегистрированный
+в MIGRATIONS. Состояние миграций хранится в коллекции migrations: после каждой
+пачки туда записывается _id последнего обработанного документа, поэтому
+прерванная миграция продолжается с того же места.
+
+Документы обрабатываются пачками по возрастанию _id. Если миграция умеет
+описать изменение pipeline-обновлением, пачка обновляется одним update_many
+на сервере, иначе - одним bulk_write с UpdateOne для каждого документа.
+
+    python -m migrations status
+    python -m migrations run [--dry-run] [--batch-size 1000] [--only 0001]
+"""
+import time
+from datetime import datetime
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+
+
+class Migration:
+    version = None
+    description = ''
+    collection = None
+
+    def query(self):
+        """Фильтр документов, которые нужно обработать."""
+        return {}
+
+    def pipeline(self):
+        """Pipeline-обновление для update_many или None, если его нет."""
+        return None
+
+    def update(self, doc):
+        """Операция UpdateOne для документа (если нет pipeline)."""
+        raise NotImplementedError
+
+
+class MigrationRunner:
+
+    def __init__(self, db, batch_size=1000, dry_run=False, server_side=True, log=print):
+        self.db = db
+        self.state = db['migrations']
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.server_side = server_side
+        self.log = log
+
+    def status(self, migration):
+        state = self.state.find_one({'_id': migration.version})
+        return state or {'_id': migration.version, 'status': PENDING, 'processed': 0}
+
+    def run(self, migration):
+        """Выполняет миграцию и возвращает число обработанных документов."""
+        state = self.status(migration)
+        if state['status'] == DONE:
+            self.log(f"{migration.version}: уже выполнена")
+            return 0
+
+        collection = self.db[migration.collection]
+        query = migration.query()
+
+        if self.dry_run:
+            count = collection.count_documents(query)
+            self.log(f"{migration.version}: будет обработано документов: {count} (dry-run)")
+            return count
+
+        checkpoint = state.get('checkpoint')
+        processed = state.get('processed', 0)
+        if checkpoint is not None:
+            self.log(f"{migration.version}: продолжаем после _id {checkpoint}, обработано {processed}")
+        self.state.update_one(
+            {'_id': migration.version},
+            {
+                '$set': {'status': RUNNING, 'description': migration.description},
+                '$setOnInsert': {'started_at': datetime.utcnow(), 'processed': 0}
+            },
+            upsert=True
+        )
+
+        pipeline = migration.pipeline() if self.server_side else None
+        started = time.perf_counter()
+        done_now = 0
+        while True:
+            batch_query = dict(query)
+            if checkpoint is not None:
+                batch_query['_id'] = {'$gt': checkpoint}
+
+            if pipeline is not None:
+                # Нужны только _id - сами документы обновляет сервер
+                ids = [doc['_id'] for doc in collection.find(batch_query, {'_id': 1})
+                       .sort('_id', 1).limit(self.batch_size)]
+                if not ids:
+                    break
+                collection.update_many({**query, '_id': {'$gte': ids[0], '$lte': ids[-1]}}, pipeline)
+                count, checkpoint = len(ids), ids[-1]
+            else:
+                docs = list(collection.find(batch_query).sort('_id', 1).limit(self.batch_size))
+                if not docs:
+                    break
+                operations = [op for op in (migration.update(doc) for doc in docs) if op is not None]
+                if operations:
+                    collection.bulk_write(operations, ordered=False)
+                count, checkpoint = len(docs), docs[-1]['_id']
+
+            done_now += count
+            processed += count
+            self.state.update_one(
+                {'_id': migration.version},
+                {'$set': {'checkpoint': checkpoint, 'updated_at': datetime.utcnow()},
+                 '$inc': {'processed': count}}
+            )
+            elapsed = time.perf_counter() - started
+            self.log(f"{migration.version}: обработано {processed} ({done_now / elapsed:.0f} док/с)")
+
+        elapsed = time.perf_counter() - started
+        self.state.update_one(
+            {'_id': migration.version},
+            {'$set': {
+                'status': DONE,
+                'finished_at': datetime.utcnow(),
+                'rate': round(done_now / elapsed, 1) if elapsed else None
+            }}
+        )
+        self.log(f"{migration.version}: готово, обработано {processed}")
+        return done_now
+
+
+def all_migrations():
+    from migrations.m0001_icon_backfill import IconBackfill
+    from migrations.m0002_entry_revisions import EntryRevisionBackfill
+    from migrations.m0003_habit_revisions import HabitRevisionBackfill
+    return [IconBackfill(), EntryRevisionBackfill(), HabitRevisionBackfill()]
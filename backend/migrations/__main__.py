@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from migrations import MigrationRunner, all_migrations
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog='python -m migrations', description='Миграции данных')
+    parser.add_argument('command', choices=['status', 'run'])
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', 'diary_db'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать документы')
+    parser.add_argument('--client-side', action='store_true',
+                        help='обновлять через bulk_write, даже если есть pipeline-обновление')
+    parser.add_argument('--only', help='выполнить только миграцию с этой версией')
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    runner = MigrationRunner(db, batch_size=args.batch_size, dry_run=args.dry_run,
+                             server_side=not args.client_side)
+
+    migrations = all_migrations()
+    if args.only:
+        migrations = [migration for migration in migrations if migration.version == args.only]
+        if not migrations:
+            print(f"Миграция {args.only} не найдена")
+            return 1
+
+    for migration in migrations:
+        if args.command == 'status':
+            state = runner.status(migration)
+            print(f"{migration.version} {state['status']:8} обработано {state.get('processed', 0):>8}  "
+                  f"{migration.description}")
+        else:
+            runner.run(migration)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Случайная иконка для записей, созданных до появления поля icon."""
+import random
+
+from pymongo import UpdateOne
+
+from icons import ICON_KEYS
+from migrations import Migration
+
+
+class IconBackfill(Migration):
+    version = '0001'
+    description = 'Добавить поле icon записям без него'
+    collection = 'entries'
+
+    def query(self):
+        return {'icon': {'$exists': False}}
+
+    def pipeline(self):
+        # Случайная иконка выбирается сервером ($rand, MongoDB 4.4.2+)
+        return [{'$set': {'icon': {'$arrayElemAt': [
+            ICON_KEYS,
+            {'$toInt': {'$floor': {'$multiply': [{'$rand': {}}, len(ICON_KEYS)]}}}
+        ]}}}]
+
+    def update(self, doc):
+        return UpdateOne({'_id': doc['_id']}, {'$set': {'icon': random.choice(ICON_KEYS)}})
@@ -0,0 +1,27 @@
+"""Ревизия 0 для записей, созданных до появления ревизий (/api/sync).
+
+Без поля _rev документ не отличить от ожидающего ревизии, поэтому всем
+старым документам проставляется _rev = 0: они старше любой ревизии и
+попадают только в полную синхронизацию.
+"""
+from pymongo import UpdateOne
+
+from migrations import Migration
+
+
+class RevisionBackfill(Migration):
+
+    def query(self):
+        return {'_rev': {'$exists': False}}
+
+    def pipeline(self):
+        return [{'$set': {'_rev': 0}}]
+
+    def update(self, doc):
+        return UpdateOne({'_id': doc['_id'], '_rev': {'$exists': False}}, {'$set': {'_rev': 0}})
+
+
+class EntryRevisionBackfill(RevisionBackfill):
+    version = '0002'
+    description = 'Проставить _rev = 0 записям без ревизии'
+    collection = 'entries'
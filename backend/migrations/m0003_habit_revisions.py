@@ -0,0 +1,8 @@
+"""Ревизия 0 для привычек, созданных до появления ревизий (см. 0002)."""
+from migrations.m0002_entry_revisions import RevisionBackfill
+
+
+class HabitRevisionBackfill(RevisionBackfill):
+    version = '0003'
+    description = 'Проставить _rev = 0 привычкам без ревизии'
+    collection = 'habits'
@@ -0,0 +1,166 @@
+"""Подключение к MongoDB: параметры клиента, чтение с реплик и write concern.
+
+Все настройки берутся из переменных окружения (см. env.example):
+
+    MONGO_URI, MONGO_DB                    - адрес (можно с replicaSet=...) и база
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS
+    MONGO_WAIT_QUEUE_TIMEOUT_MS            - сколько ждать свободное соединение пула
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS
+    MONGO_COMPRESSORS                      - сжатие протокола, например zstd,snappy,zlib
+    MONGO_READ_PREFERENCE                  - primary или secondaryPreferred
+    MONGO_MAX_STALENESS                    - допустимое отставание secondary, с (от 90)
+    MONGO_READ_ROUTES                      - маршруты, которые могут читать с secondary
+    MONGO_WRITE_CONCERN                    - w для записи по умолчанию: 1, majority, ...
+    MONGO_WRITE_CONCERN_<МАРШРУТ>          - w для маршрута, например MONGO_WRITE_CONCERN_IMPORT_ENTRIES=1
+    MONGO_WRITE_TIMEOUT_MS                 - wtimeout для w > 1 и majority
+
+Маршрут - имя обработчика Flask/Quart (request.endpoint). Router выдает
+репозиторий или коллекцию с нужными read preference и write concern через
+with_options; копии создаются один раз.
+
+Пользователь, который менял данные недавно (меньше MONGO_MAX_STALENESS плюс
+интервал опроса серверов назад), читает с primary: secondary мог еще не
+получить его изменения, а ETag ответа считается по ревизии с primary.
+"""
+import os
+from datetime import datetime, timedelta
+
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+DEFAULT_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB = 'diary_db'
+
+DEFAULT_READ_ROUTES = 'get_entries,get_habits,get_user_preferences'
+
+# Минимум MongoDB для maxStalenessSeconds
+MIN_MAX_STALENESS = 90
+
+# heartbeatFrequencyMS по умолчанию: с такой точностью драйвер оценивает отставание
+HEARTBEAT_SECONDS = 10
+
+CLIENT_OPTIONS = {
+    'minPoolSize': 'MONGO_MIN_POOL_SIZE',
+    'maxIdleTimeMS': 'MONGO_MAX_IDLE_TIME_MS',
+    'waitQueueTimeoutMS': 'MONGO_WAIT_QUEUE_TIMEOUT_MS',
+    'connectTimeoutMS': 'MONGO_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGO_SOCKET_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'MONGO_SERVER_SELECTION_TIMEOUT_MS'
+}
+
+
+def uri():
+    return os.getenv('MONGO_URI', DEFAULT_URI)
+
+
+def db_name():
+    return os.getenv('MONGO_DB', DEFAULT_DB)
+
+
+def available_compressors(names):
+    """Компрессоры из списка, для которых установлены библиотеки."""
+    installed = {'zstd': zstandard is not None, 'snappy': snappy is not None, 'zlib': True}
+    return [name for name in names if installed.get(name)]
+
+
+def client_options(default_pool_size):
+    """Именованные параметры MongoClient / AsyncIOMotorClient."""
+    options = {'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', str(default_pool_size)))}
+    for option, variable in CLIENT_OPTIONS.items():
+        value = os.getenv(variable)
+        if value:
+            options[option] = int(value)
+    names = [name.strip() for name in os.getenv('MONGO_COMPRESSORS', '').split(',') if name.strip()]
+    compressors = available_compressors(names)
+    if compressors:
+        options['compressors'] = ','.join(compressors)
+    return options
+
+
+def _w(value):
+    return int(value) if value.isdigit() else value
+
+
+def write_concern(route=None):
+    """WriteConcern маршрута или None, если используется настройка клиента."""
+    value = os.getenv(f'MONGO_WRITE_CONCERN_{route.upper()}') if route else None
+    value = value or os.getenv('MONGO_WRITE_CONCERN')
+    if not value:
+        return None
+    w = _w(value)
+    timeout = os.getenv('MONGO_WRITE_TIMEOUT_MS')
+    if timeout and w not in (0, 1):
+        return WriteConcern(w=w, wtimeout=int(timeout))
+    return WriteConcern(w=w)
+
+
+def read_preference():
+    mode = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+    if mode == 'primary':
+        return Primary()
+    if mode != 'secondaryPreferred':
+        raise ValueError(f"MONGO_READ_PREFERENCE: ожидается primary или secondaryPreferred, получено {mode}")
+    max_staleness = int(os.getenv('MONGO_MAX_STALENESS', str(MIN_MAX_STALENESS)))
+    if max_staleness < MIN_MAX_STALENESS:
+        raise ValueError(f"MONGO_MAX_STALENESS должно быть не меньше {MIN_MAX_STALENESS} секунд")
+    return SecondaryPreferred(max_staleness=max_staleness)
+
+
+class Router:
+    """Настройки чтения и записи для маршрутов."""
+
+    def __init__(self, read_preference=None, read_routes=(), write_concern=write_concern):
+        self.read_preference = read_preference or Primary()
+        self.read_routes = frozenset(read_routes)
+        self.write_concern = write_concern
+        staleness = getattr(self.read_preference, 'max_staleness', -1)
+        self.fresh_window = timedelta(seconds=max(staleness, 0) + HEARTBEAT_SECONDS)
+        self._copies = {}
+        self._concerns = {}
+
+    @property
+    def reads_secondary(self):
+        return self.read_preference.mode != Primary().mode
+
+    def _copy(self, target, key, **options):
+        # В значении хранится и сам target, чтобы его id не достался другому объекту
+        key = (id(target),) + key
+        if key not in self._copies:
+            self._copies[key] = (target, target.with_options(**options))
+        return self._copies[key][1]
+
+    def reader(self, target, route, changed_at=None):
+        """target для чтения в маршруте route.
+
+        changed_at - время последнего изменения данных пользователя: после
+        недавних изменений чтение остается на primary.
+        """
+        if not self.reads_secondary or route not in self.read_routes:
+            return target
+        if changed_at is not None and datetime.utcnow() - changed_at < self.fresh_window:
+            return target
+        return self._copy(target, ('read',), read_preference=self.read_preference)
+
+    def writer(self, target, route):
+        """target для записи в маршруте route."""
+        if route not in self._concerns:
+            self._concerns[route] = self.write_concern(route)
+        concern = self._concerns[route]
+        if concern is None:
+            return target
+        return self._copy(target, ('write', route), write_concern=concern)
+
+
+def create_router():
+    routes = os.getenv('MONGO_READ_ROUTES', DEFAULT_READ_ROUTES)
+    return Router(read_preference(), [route.strip() for route in routes.split(',') if route.strip()])
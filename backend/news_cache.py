@@ -0,0 +1,179 @@
+"""Кэш ответов внешних API с TTL, stale-while-revalidate и объединением запросов.
+
+Значение считается свежим ttl секунд. Еще stale_ttl секунд после этого оно
+отдается сразу, а обновление запускается в фоне. Если несколько потоков
+одновременно запрашивают отсутствующий ключ, загрузку выполняет только один,
+остальные ждут его результат.
+
+Хранилище подключается отдельно:
+    MemoryCacheBackend - LRU в памяти процесса (по умолчанию)
+    MongoCacheBackend  - коллекция MongoDB, общая для всех воркеров
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class MemoryCacheBackend:
+    """LRU-кэш в памяти процесса."""
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._items[key] = (value, stored_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class MongoCacheBackend:
+    """Кэш в коллекции MongoDB. Устаревшие документы удаляет TTL-индекс."""
+
+    def __init__(self, collection, max_age):
+        self.collection = collection
+        self.max_age = max_age
+        self.collection.create_index('expires_at', expireAfterSeconds=0, name='expires_at_ttl')
+
+    def get(self, key):
+        doc = self.collection.find_one({'_id': key})
+        if not doc:
+            return None
+        return doc['value'], doc['stored_at']
+
+    def set(self, key, value, stored_at):
+        self.collection.replace_one(
+            {'_id': key},
+            {
+                'value': value,
+                'stored_at': stored_at,
+                'expires_at': datetime.utcnow() + timedelta(seconds=self.max_age)
+            },
+            upsert=True
+        )
+
+    def delete(self, key):
+        self.collection.delete_one({'_id': key})
+
+
+class _Call:
+    """Загрузка ключа, которую ждут все пришедшие за ним потоки."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+
+    def __init__(self, backend, ttl=300, stale_ttl=600, wait_timeout=30, clock=time.time):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'loads': 0,
+            'load_errors': 0,
+            'load_time_total': 0.0,
+            'load_time_max': 0.0
+        }
+
+    def get(self, key, loader):
+        """Возвращает значение из кэша или загружает его через loader()."""
+        item = self.backend.get(key)
+        if item is not None:
+            value, stored_at = item
+            age = self.clock() - stored_at
+            if age < self.ttl:
+                self._count('hits')
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._count('stale_hits')
+                self._refresh_in_background(key, loader)
+                return value
+
+        self._count('misses')
+        return self._load(key, loader)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale_hits']) / lookups, 3) if lookups else 0
+        stats['load_time_avg'] = round(stats['load_time_total'] / stats['loads'], 4) if stats['loads'] else 0
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _begin(self, key):
+        # Возвращает (call, leader): leader=True у потока, который будет загружать
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def _run(self, key, call, loader):
+        started = self.clock()
+        try:
+            call.value = loader()
+            self.backend.set(key, call.value, self.clock())
+        except Exception as e:
+            call.error = e
+            self._count('load_errors')
+        finally:
+            elapsed = self.clock() - started
+            with self._stats_lock:
+                self._stats['loads'] += 1
+                self._stats['load_time_total'] += elapsed
+                self._stats['load_time_max'] = max(self._stats['load_time_max'], elapsed)
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _load(self, key, loader):
+        call, leader = self._begin(key)
+        if leader:
+            self._run(key, call, loader)
+        else:
+            self._count('coalesced')
+            if not call.done.wait(self.wait_timeout):
+                raise TimeoutError(f"Загрузка ключа {key} не завершилась за {self.wait_timeout} с")
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def _refresh_in_background(self, key, loader):
+        call, leader = self._begin(key)
+        if not leader:
+            return
+        thread = threading.Thread(target=self._run, args=(key, call, loader), daemon=True)
+        thread.start()
@@ -0,0 +1,71 @@
+"""Постраничная выдача записей: разбор параметров limit, fields и курсора."""
+import base64
+
+from bson import ObjectId
+
+import serialization
+
+# Поля записи, которые можно запросить через fields=
+ENTRY_FIELDS = ('title', 'content', 'date', 'icon')
+MAX_PAGE_SIZE = 500
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Параметр limit должен быть числом')
+    if limit < 1:
+        raise ValueError('Параметр limit должен быть больше нуля')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_entry_fields(value):
+    # None означает "все поля" - так запись отдается целиком
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in ENTRY_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    # date нужна всегда - по ней строится курсор следующей страницы
+    projection = {'date': 1}
+    for field in fields:
+        projection[field] = 1
+    return projection
+
+
+def encode_cursor(entry):
+    raw = f"{entry['date']}|{entry['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8')
+        date, entry_id = raw.rsplit('|', 1)
+        return date, ObjectId(entry_id)
+    except Exception:
+        raise ValueError('Некорректный курсор')
+
+
+def ndjson_page(entries, limit=None):
+    """Строки NDJSON страницы записей (format=ndjson в app.py и asgi.py).
+
+    entries - записи страницы и, если есть следующая, одна лишняя: вместо нее
+    последней строкой идет {"next_cursor": ...}. Записи читаются по одной,
+    поэтому курсор PyMongo отдается без загрузки всей истории в память.
+    """
+    sent = 0
+    last_entry = None
+    for entry in entries:
+        if limit and sent == limit:
+            yield serialization.dumps_line({'next_cursor': encode_cursor(last_entry)})
+            return
+        last_entry = {'date': entry['date'], '_id': entry['_id']}
+        yield serialization.dumps_line(entry)
+        sent += 1
@@ -0,0 +1,303 @@
+"""Допуск запросов: ограничение частоты по пользователю и сброс нагрузки.
+
+Перед обработчиком каждый запрос проходит две проверки (Admission):
+
+1. Сброс нагрузки (LoadShedder) - ответ 503 с Retry-After, если в процессе
+   уже SHED_MAX_IN_FLIGHT запросов или недавнее ожидание соединения из пула
+   MongoDB больше SHED_POOL_WAIT_MS. Лишние запросы получают быстрый отказ
+   вместо очереди, поэтому время ответа принятых запросов не растет.
+2. Ограничение частоты (RateLimiter) - token bucket на пару (клиент, маршрут),
+   ответ 429 с Retry-After. Клиент - пользователь из проверенного токена,
+   без него - IP-адрес.
+
+Лимит маршрута задается как RATE_LIMIT_<ИМЯ_ОБРАБОТЧИКА>=<в минуту>[/<запас>],
+например RATE_LIMIT_GET_ENTRIES=120/30; 0 отключает лимит. RATE_LIMIT_DEFAULT
+действует на остальные маршруты (по умолчанию выключен).
+
+Хранилище корзин (RATE_LIMIT_BACKEND):
+    memory - словарь в памяти процесса, лимит на каждый воркер
+    mongo  - коллекция rate_limits, общий лимит для всех воркеров
+             (одно атомарное обновление на запрос)
+
+Проверки не выполняются для /api/health и /api/metrics. Число принятых,
+ограниченных и сброшенных запросов видно в /api/metrics.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import g, jsonify, request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+import auth
+from metrics import CounterFamily, GaugeFamily
+
+DEFAULT_LIMITS = {
+    'get_entries': '120/30',
+    'toggle_habit': '120/30',
+    'get_news': '30/10',
+    'send_feedback': '5/3',
+    # Маршрут без авторизации: лимит считается по IP-адресу
+    'get_feedback_status': '30/10'
+}
+
+EXEMPT_ENDPOINTS = frozenset({'health_check', 'get_metrics', 'static'})
+
+LIMIT_PREFIX = 'RATE_LIMIT_'
+# Переменные с этим префиксом, которые не являются лимитами маршрутов
+SETTINGS = frozenset({'RATE_LIMIT_DEFAULT', 'RATE_LIMIT_BACKEND', 'RATE_LIMIT_MEMORY_KEYS'})
+
+rate_limit_requests = CounterFamily(
+    'diary_rate_limit_requests_total', 'Запросы, проверенные ограничением частоты, по результату')
+rate_limit_errors = CounterFamily(
+    'diary_rate_limit_errors_total', 'Ошибки хранилища ограничения частоты (запрос пропускается)')
+load_shed = CounterFamily(
+    'diary_load_shed_total', 'Запросы, отклоненные из-за перегрузки, по причине')
+in_flight_requests = GaugeFamily(
+    'diary_in_flight_requests', 'Запросы, которые обрабатываются в данный момент')
+pool_wait_recent = GaugeFamily(
+    'diary_mongo_pool_wait_recent_seconds', 'Недавнее среднее ожидание соединения MongoDB')
+
+
+class Limit:
+    """Token bucket: rate токенов в секунду, не больше burst в запасе."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60
+        self.burst = burst or max(1, math.ceil(per_minute / 60))
+
+    @classmethod
+    def parse(cls, value):
+        """'120/30' -> Limit(120, 30); '0' или пустая строка -> None."""
+        per_minute, _, burst = (value or '').partition('/')
+        per_minute = float(per_minute or 0)
+        if per_minute <= 0:
+            return None
+        return cls(per_minute, int(burst) if burst else None)
+
+    def retry_after(self, tokens):
+        """Секунды до появления целого токена."""
+        return (1 - tokens) / self.rate
+
+
+class MemoryBackend:
+    """Корзины в памяти процесса (LRU, не больше max_keys)."""
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, limit):
+        """(разрешено ли, секунд до следующей попытки)."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else limit.retry_after(tokens)
+
+
+class MongoBackend:
+    """Корзины в коллекции MongoDB, общие для всех воркеров.
+
+    Пополнение и списание токена выполняются одним pipeline-обновлением,
+    поэтому параллельные запросы не списывают один токен дважды. Полные
+    корзины не нужны - их удаляет TTL-индекс.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index('expires_at', expireAfterSeconds=0, name='expires_at_ttl')
+
+    @staticmethod
+    def consume_pipeline(limit, now):
+        elapsed = {'$max': [0, {'$divide': [{'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}, 1000]}]}
+        refilled = {'$add': [{'$ifNull': ['$tokens', limit.burst]}, {'$multiply': [elapsed, limit.rate]}]}
+        return [
+            {'$set': {'tokens': {'$min': [limit.burst, refilled]}, 'updated_at': now}},
+            {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+            {'$set': {
+                'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                'expires_at': now + timedelta(seconds=limit.burst / limit.rate + 60)
+            }}
+        ]
+
+    def consume(self, key, limit):
+        doc = self.collection.find_one_and_update(
+            {'_id': key},
+            self.consume_pipeline(limit, datetime.utcnow()),
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        allowed = doc['allowed']
+        return allowed, 0 if allowed else limit.retry_after(doc['tokens'])
+
+
+class RateLimiter:
+
+    def __init__(self, backend, limits, default=None):
+        self.backend = backend
+        self.limits = limits
+        self.default = default
+
+    def limit_for(self, endpoint):
+        return self.limits.get(endpoint, self.default)
+
+    def check(self, client, endpoint, labels):
+        """None, если запрос разрешен, иначе секунды до следующей попытки.
+
+        labels - метки маршрута для счетчиков (route, method).
+        """
+        limit = self.limit_for(endpoint)
+        if limit is None:
+            return None
+        try:
+            allowed, retry_after = self.backend.consume(f"{endpoint}|{client}", limit)
+        except PyMongoError:
+            # Недоступное хранилище лимитов не должно останавливать API
+            rate_limit_errors.inc(backend=type(self.backend).__name__)
+            return None
+        rate_limit_requests.inc(result='allowed' if allowed else 'limited', **labels)
+        return None if allowed else retry_after
+
+
+class LoadShedder:
+    """Отказ по числу запросов в обработке и по ожиданию пула MongoDB."""
+
+    def __init__(self, max_in_flight=0, pool_wait=None, max_pool_wait=0.0):
+        self.max_in_flight = max_in_flight
+        self.pool_wait = pool_wait
+        self.max_pool_wait = max_pool_wait
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Причина отказа или None, если запрос принят (тогда нужен leave())."""
+        if self.pool_wait is not None and self.max_pool_wait:
+            waited = self.pool_wait.get()
+            pool_wait_recent.set(round(waited, 4))
+            if waited > self.max_pool_wait:
+                return 'pool_wait'
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                return 'in_flight'
+            self.in_flight += 1
+            in_flight_requests.set(self.in_flight)
+        return None
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+            in_flight_requests.set(self.in_flight)
+
+
+class Admission:
+    """Сначала сброс нагрузки, затем лимит частоты.
+
+    check() не зависит от фреймворка: init_app подключает его к Flask (app.py),
+    asgi.py вызывает его из своих хуков Quart.
+    """
+
+    def __init__(self, limiter, shedder, client_key, exempt=EXEMPT_ENDPOINTS, shed_retry_after=1):
+        self.limiter = limiter
+        self.shedder = shedder
+        self.client_key = client_key
+        self.exempt = exempt
+        self.shed_retry_after = shed_retry_after
+
+    def check(self, endpoint, rule, method, client_key):
+        """(принят ли запрос в обработку, отказ или None).
+
+        client_key() возвращает ключ клиента для лимита частоты. Отказ -
+        (тело, код, заголовки). Принятый в обработку запрос по завершении
+        вызывает release(), даже если лимит частоты ему отказал.
+        """
+        if endpoint is None or endpoint in self.exempt or method == 'OPTIONS':
+            return False, None
+        labels = {'route': rule, 'method': method}
+
+        reason = self.shedder.enter()
+        if reason:
+            load_shed.inc(reason=reason, **labels)
+            return False, self._reject(503, 'Сервер перегружен, повторите запрос позже', self.shed_retry_after)
+
+        retry_after = self.limiter.check(client_key(), endpoint, labels)
+        if retry_after is not None:
+            return True, self._reject(429, 'Слишком много запросов, повторите позже', retry_after)
+        return True, None
+
+    def release(self):
+        self.shedder.leave()
+
+    def before_request(self):
+        rule = request.url_rule.rule if request.url_rule else None
+        admitted, rejection = self.check(request.endpoint, rule, request.method, self.client_key)
+        g.admitted = admitted
+        if rejection:
+            body, status, headers = rejection
+            return jsonify(body), status, headers
+        return None
+
+    def teardown_request(self, exc):
+        if g.pop('admitted', False):
+            self.release()
+
+    @staticmethod
+    def _reject(status, message, retry_after):
+        seconds = max(1, math.ceil(retry_after))
+        return {'error': message, 'retry_after': seconds}, status, {'Retry-After': str(seconds)}
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        return self
+
+
+def client_key(auth_service, authorization, remote_addr):
+    """Ключ клиента для лимита частоты.
+
+    Проверка идет до обработчика, поэтому пользователь берется только из подписи
+    токена, без обращения к базе. Без проверенного токена (в том числе с user_id
+    в режиме совместимости, который можно менять от запроса к запросу) лимит
+    считается по IP-адресу.
+    """
+    token = auth.bearer_token(authorization)
+    user_id = token and auth_service.decode_token(token)
+    return f"user:{user_id}" if user_id else f"ip:{remote_addr}"
+
+
+def load_limits():
+    """{имя обработчика: Limit} из DEFAULT_LIMITS и переменных RATE_LIMIT_<ИМЯ>."""
+    values = dict(DEFAULT_LIMITS)
+    for variable, value in os.environ.items():
+        if variable.startswith(LIMIT_PREFIX) and variable not in SETTINGS:
+            values[variable[len(LIMIT_PREFIX):].lower()] = value
+    limits = {endpoint: Limit.parse(value) for endpoint, value in values.items()}
+    return {endpoint: limit for endpoint, limit in limits.items() if limit}
+
+
+def create_admission(db, pool_wait, client_key):
+    """Admission по настройкам из окружения (см. env.example)."""
+    if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+        backend = MongoBackend(db['rate_limits'])
+    else:
+        backend = MemoryBackend(int(os.getenv('RATE_LIMIT_MEMORY_KEYS', '100000')))
+    limiter = RateLimiter(backend, load_limits(), Limit.parse(os.getenv('RATE_LIMIT_DEFAULT', '0')))
+    shedder = LoadShedder(
+        max_in_flight=int(os.getenv('SHED_MAX_IN_FLIGHT', '0')),
+        pool_wait=pool_wait,
+        max_pool_wait=float(os.getenv('SHED_POOL_WAIT_MS', '250')) / 1000
+    )
+    return Admission(limiter, shedder, client_key)
@@ -0,0 +1,517 @@
+"""Доступ к коллекциям MongoDB для маршрутов.
+
+Каждый репозиторий есть в двух вариантах с одинаковыми методами:
+    EntryRepository, HabitRepository, UserRepository                - PyMongo (app.py)
+    AsyncEntryRepository, AsyncHabitRepository, AsyncUserRepository - Motor (asgi.py)
+
+Запросы собираются в общих базовых классах, поэтому оба варианта читают и
+пишут документы одинаково. Изменение и чтение результата выполняются одним
+find_one_and_update вместо update_one + find_one.
+
+with_options(read_preference=..., write_concern=...) возвращает копию
+репозитория с теми же настройками у всех коллекций, в которые он пишет, в том
+числе через вложенные репозитории ревизий и статистики (см. mongo_config.Router).
+
+Каждое изменение записей и привычек увеличивает номер ревизии пользователя
+(RevisionRepository) и сохраняет его в поле _rev документа, а удаление
+оставляет надгробие в коллекции tombstones. По ним строятся ETag и выдача
+изменений с заданной ревизии (/api/sync).
+
+Ревизия увеличивается только после записи документа или надгробия: до этого
+у них _rev (rev) равно null, и выдача изменений отдает такие документы при
+любом since. Документы, записанные до появления ревизий, получают _rev = 0
+миграцией 0002 и в выдачу изменений попадают только при полной синхронизации. Поэтому параллельный запрос может увидеть новые данные со
+старой ревизией (клиент лишний раз перезапросит их), но не новую ревизию
+со старыми данными.
+
+Создание, изменение и удаление записи меняют статистику пользователя
+(UserStatsRepository, коллекция user_stats) одним $inc с разницей счетчиков
+старой и новой версии записи (user_stats.diff).
+"""
+import copy
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING, ReturnDocument
+
+import habit_storage
+import user_stats
+
+ENTRY_SORT = [('date', DESCENDING), ('_id', DESCENDING)]
+
+ENTRIES = 'entries'
+HABITS = 'habits'
+
+
+def object_id(value):
+    """ObjectId из строки или None, если строка некорректна."""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+class _Configurable:
+
+    COLLECTIONS = ('collection',)
+    # Вложенные репозитории, которые пишут в свои коллекции: их копии
+    # получают те же настройки, иначе, например, ревизия записывалась бы
+    # с write concern по умолчанию
+    REPOSITORIES = ()
+
+    def with_options(self, **options):
+        clone = copy.copy(self)
+        for name in self.COLLECTIONS + self.REPOSITORIES:
+            setattr(clone, name, getattr(self, name).with_options(**options))
+        return clone
+
+
+class _RevisionQueries(_Configurable):
+
+    COLLECTIONS = ('revisions', 'tombstones')
+    EMPTY_STATE = {'rev': 0, 'changed_at': None}
+    # Явный null, который пишется до ревизии. Документы без поля (созданные до
+    # появления ревизий, см. миграцию 0002) под условие не попадают. Значит то же,
+    # что {'$type': 'null'}, но так условие понимает и mongomock в тестах
+    PENDING = {'$exists': True, '$eq': None}
+
+    def __init__(self, revisions_collection, tombstones_collection, tombstone_ttl=90 * 24 * 3600):
+        self.revisions = revisions_collection
+        self.tombstones = tombstones_collection
+        self.tombstone_ttl = tombstone_ttl
+
+    @staticmethod
+    def stamp_filter(rev, field='_rev'):
+        # При параллельных изменениях документ остается с большей ревизией
+        return {'$or': [{field: _RevisionQueries.PENDING}, {field: {'$lt': rev}}]}
+
+    @staticmethod
+    def changed_filter(since, field='_rev'):
+        """Условие на ревизию: изменены после since или еще без ревизии."""
+        return {'$or': [{field: {'$gt': since}}, {field: _RevisionQueries.PENDING}]}
+
+    @staticmethod
+    def bump_update():
+        # changed_at - время приложения, с ним сравнивает mongo_config.Router
+        return {'$inc': {'rev': 1}, '$set': {'changed_at': datetime.utcnow()}}
+
+    @classmethod
+    def state_of(cls, doc):
+        return {**cls.EMPTY_STATE, **doc} if doc else dict(cls.EMPTY_STATE)
+
+    def tombstone_doc(self, user_id, kind, doc_id):
+        now = datetime.utcnow()
+        return {
+            'user_id': user_id,
+            'kind': kind,
+            'doc_id': str(doc_id),
+            'rev': None,
+            'deleted_at': now,
+            'expires_at': now + timedelta(seconds=self.tombstone_ttl)
+        }
+
+
+class RevisionRepository(_RevisionQueries):
+    """Счетчик изменений пользователя и журнал удалений."""
+
+    def bump(self, user_id):
+        doc = self.revisions.find_one_and_update(
+            {'_id': user_id}, self.bump_update(), upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc['rev']
+
+    def state(self, user_id):
+        """{'rev': ревизия, 'changed_at': время последнего изменения или None}."""
+        return self.state_of(self.revisions.find_one({'_id': user_id}))
+
+    def current(self, user_id):
+        return self.state(user_id)['rev']
+
+    def stamp(self, user_id, collection, ids):
+        """Новая ревизия для уже записанных документов, возвращает ее."""
+        rev = self.bump(user_id)
+        collection.update_many(
+            {'_id': {'$in': list(ids)}, 'user_id': user_id, **self.stamp_filter(rev)},
+            {'$set': {'_rev': rev}}
+        )
+        return rev
+
+    def tombstone(self, user_id, kind, doc_id):
+        tombstone_id = self.tombstones.insert_one(self.tombstone_doc(user_id, kind, doc_id)).inserted_id
+        self.tombstones.update_one({'_id': tombstone_id}, {'$set': {'rev': self.bump(user_id)}})
+
+    def deleted_since(self, user_id, since):
+        return self.tombstones.find(
+            {'user_id': user_id, **self.changed_filter(since, 'rev')},
+            {'_id': 0, 'kind': 1, 'doc_id': 1}
+        )
+
+
+class AsyncRevisionRepository(_RevisionQueries):
+
+    async def bump(self, user_id):
+        doc = await self.revisions.find_one_and_update(
+            {'_id': user_id}, self.bump_update(), upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc['rev']
+
+    async def state(self, user_id):
+        return self.state_of(await self.revisions.find_one({'_id': user_id}))
+
+    async def current(self, user_id):
+        return (await self.state(user_id))['rev']
+
+    async def stamp(self, user_id, collection, ids):
+        rev = await self.bump(user_id)
+        await collection.update_many(
+            {'_id': {'$in': list(ids)}, 'user_id': user_id, **self.stamp_filter(rev)},
+            {'$set': {'_rev': rev}}
+        )
+        return rev
+
+    async def tombstone(self, user_id, kind, doc_id):
+        tombstone_id = (await self.tombstones.insert_one(self.tombstone_doc(user_id, kind, doc_id))).inserted_id
+        await self.tombstones.update_one({'_id': tombstone_id}, {'$set': {'rev': await self.bump(user_id)}})
+
+
+class _StatsQueries(_Configurable):
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def inc_update(inc):
+        return {'$inc': inc, '$set': {'updated_at': datetime.utcnow()}}
+
+
+class UserStatsRepository(_StatsQueries):
+    """Материализованная статистика записей пользователя (один документ)."""
+
+    def apply(self, user_id, inc):
+        if inc:
+            self.collection.update_one({'_id': user_id}, self.inc_update(inc), upsert=True)
+
+    def get(self, user_id):
+        return self.collection.find_one({'_id': user_id})
+
+
+class AsyncUserStatsRepository(_StatsQueries):
+
+    async def apply(self, user_id, inc):
+        if inc:
+            await self.collection.update_one({'_id': user_id}, self.inc_update(inc), upsert=True)
+
+    async def get(self, user_id):
+        return await self.collection.find_one({'_id': user_id})
+
+
+def without_revision(doc):
+    """Документ для ответа API: _rev - служебное поле, клиенту его не отдаем."""
+    return {key: value for key, value in doc.items() if key != '_rev'}
+
+
+class _Revisioned(_Configurable):
+
+    # Проекция чтения для ответов API, если поля не выбраны явно
+    PUBLIC_PROJECTION = {'_rev': 0}
+    REPOSITORIES = ('revisions',)
+
+    def __init__(self, collection, revisions):
+        self.collection = collection
+        self.revisions = revisions
+
+    def changed_query(self, user_id, since=None):
+        """Документы пользователя, измененные после ревизии since (все, если since не задан)."""
+        query = {'user_id': user_id}
+        if since:
+            query.update(_RevisionQueries.changed_filter(since))
+        return query
+
+
+class _EntryQueries(_Revisioned):
+
+    REPOSITORIES = ('revisions', 'stats')
+
+    def __init__(self, collection, revisions, stats):
+        super().__init__(collection, revisions)
+        self.stats = stats
+
+    @staticmethod
+    def page_query(user_id, after=None):
+        """Условие страницы: записи пользователя после курсора (date, _id)."""
+        query = {'user_id': user_id}
+        if after:
+            after_date, after_id = after
+            query['$or'] = [
+                {'date': {'$lt': after_date}},
+                {'date': after_date, '_id': {'$lt': after_id}}
+            ]
+        return query
+
+    def page_cursor(self, user_id, after=None, projection=None, limit=None):
+        # Ключ сортировки (date, _id) однозначен, поэтому курсор не теряет
+        # и не повторяет записи с одинаковой датой
+        cursor = self.collection.find(
+            self.page_query(user_id, after), projection or self.PUBLIC_PROJECTION
+        ).sort(ENTRY_SORT)
+        if limit:
+            # Одна лишняя запись показывает, есть ли следующая страница
+            cursor = cursor.limit(limit + 1)
+        return cursor
+
+
+class EntryRepository(_EntryQueries):
+
+    def page(self, user_id, after=None, projection=None, limit=None):
+        return self.page_cursor(user_id, after, projection, limit)
+
+    def changed_since(self, user_id, since=None):
+        return self.collection.find(self.changed_query(user_id, since), self.PUBLIC_PROJECTION)
+
+    def create(self, entry):
+        entry['_rev'] = None
+        entry['_id'] = self.collection.insert_one(entry).inserted_id
+        entry['_rev'] = self.revisions.stamp(entry['user_id'], self.collection, [entry['_id']])
+        self.stats.apply(entry['user_id'], user_stats.diff(None, entry))
+        return entry
+
+    def update(self, user_id, entry_id, fields):
+        """Обновленная запись или None, если записи нет у пользователя."""
+        entry_id = object_id(entry_id)
+        if entry_id is None:
+            return None
+        # Старая версия нужна для разницы статистики, новая собирается из нее
+        before = self.collection.find_one_and_update(
+            {'_id': entry_id, 'user_id': user_id},
+            {'$set': {**fields, '_rev': None}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        after = {**before, **fields, '_rev': self.revisions.stamp(user_id, self.collection, [entry_id])}
+        self.stats.apply(user_id, user_stats.diff(before, after))
+        return after
+
+    def delete(self, user_id, entry_id):
+        entry_id = object_id(entry_id)
+        if entry_id is None:
+            return False
+        before = self.collection.find_one_and_delete({'_id': entry_id, 'user_id': user_id})
+        if before is None:
+            return False
+        self.revisions.tombstone(user_id, ENTRIES, entry_id)
+        self.stats.apply(user_id, user_stats.diff(before, None))
+        return True
+
+
+class AsyncEntryRepository(_EntryQueries):
+
+    async def page(self, user_id, after=None, projection=None, limit=None):
+        cursor = self.page_cursor(user_id, after, projection, limit)
+        return await cursor.to_list(length=None)
+
+    async def changed_since(self, user_id, since=None):
+        return await self.collection.find(self.changed_query(user_id, since), self.PUBLIC_PROJECTION).to_list(length=None)
+
+    async def create(self, entry):
+        entry['_rev'] = None
+        entry['_id'] = (await self.collection.insert_one(entry)).inserted_id
+        entry['_rev'] = await self.revisions.stamp(entry['user_id'], self.collection, [entry['_id']])
+        await self.stats.apply(entry['user_id'], user_stats.diff(None, entry))
+        return entry
+
+    async def update(self, user_id, entry_id, fields):
+        entry_id = object_id(entry_id)
+        if entry_id is None:
+            return None
+        before = await self.collection.find_one_and_update(
+            {'_id': entry_id, 'user_id': user_id},
+            {'$set': {**fields, '_rev': None}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        after = {**before, **fields, '_rev': await self.revisions.stamp(user_id, self.collection, [entry_id])}
+        await self.stats.apply(user_id, user_stats.diff(before, after))
+        return after
+
+    async def delete(self, user_id, entry_id):
+        entry_id = object_id(entry_id)
+        if entry_id is None:
+            return False
+        before = await self.collection.find_one_and_delete({'_id': entry_id, 'user_id': user_id})
+        if before is None:
+            return False
+        await self.revisions.tombstone(user_id, ENTRIES, entry_id)
+        await self.stats.apply(user_id, user_stats.diff(before, None))
+        return True
+
+
+class _HabitQueries(_Revisioned):
+
+    @staticmethod
+    def completions_query(user_id, habit_ids):
+        return (
+            {'_id': {'$in': list(habit_ids)}, 'user_id': user_id},
+            {'completed_dates': 1, 'completed_days': 1, '_rev': 1}
+        )
+
+    @staticmethod
+    def toggle_update(date):
+        return habit_storage.toggle_pipeline(date) + [{'$set': {'_rev': None}}]
+
+
+class HabitRepository(_HabitQueries):
+
+    def list(self, user_id, projection=None):
+        return self.collection.find({'user_id': user_id}, projection or self.PUBLIC_PROJECTION)
+
+    def changed_since(self, user_id, since=None):
+        return self.collection.find(self.changed_query(user_id, since), self.PUBLIC_PROJECTION)
+
+    def count(self, user_id):
+        return self.collection.count_documents({'user_id': user_id})
+
+    def completions(self, user_id, habit_ids):
+        """Отметки выбранных привычек пользователя вместе с их _rev."""
+        return self.collection.find(*self.completions_query(user_id, habit_ids))
+
+    def create(self, habit):
+        habit['_rev'] = None
+        habit['_id'] = self.collection.insert_one(habit).inserted_id
+        habit['_rev'] = self.revisions.stamp(habit['user_id'], self.collection, [habit['_id']])
+        return habit
+
+    def toggle(self, user_id, habit_id, date):
+        """Переключает отметку за дату одним запросом, возвращает привычку или None."""
+        habit_id = object_id(habit_id)
+        if habit_id is None:
+            return None
+        habit = self.collection.find_one_and_update(
+            {'_id': habit_id, 'user_id': user_id},
+            self.toggle_update(date),
+            return_document=ReturnDocument.AFTER
+        )
+        if habit is not None:
+            habit['_rev'] = self.revisions.stamp(user_id, self.collection, [habit_id])
+        return habit
+
+    def delete(self, user_id, habit_id):
+        habit_id = object_id(habit_id)
+        if habit_id is None:
+            return False
+        if not self.collection.delete_one({'_id': habit_id, 'user_id': user_id}).deleted_count:
+            return False
+        self.revisions.tombstone(user_id, HABITS, habit_id)
+        return True
+
+
+class AsyncHabitRepository(_HabitQueries):
+
+    async def list(self, user_id, projection=None):
+        return await self.collection.find({'user_id': user_id}, projection or self.PUBLIC_PROJECTION).to_list(length=None)
+
+    async def changed_since(self, user_id, since=None):
+        return await self.collection.find(self.changed_query(user_id, since), self.PUBLIC_PROJECTION).to_list(length=None)
+
+    async def count(self, user_id):
+        return await self.collection.count_documents({'user_id': user_id})
+
+    async def completions(self, user_id, habit_ids):
+        return await self.collection.find(*self.completions_query(user_id, habit_ids)).to_list(length=None)
+
+    async def create(self, habit):
+        habit['_rev'] = None
+        habit['_id'] = (await self.collection.insert_one(habit)).inserted_id
+        habit['_rev'] = await self.revisions.stamp(habit['user_id'], self.collection, [habit['_id']])
+        return habit
+
+    async def toggle(self, user_id, habit_id, date):
+        habit_id = object_id(habit_id)
+        if habit_id is None:
+            return None
+        habit = await self.collection.find_one_and_update(
+            {'_id': habit_id, 'user_id': user_id},
+            self.toggle_update(date),
+            return_document=ReturnDocument.AFTER
+        )
+        if habit is not None:
+            habit['_rev'] = await self.revisions.stamp(user_id, self.collection, [habit_id])
+        return habit
+
+    async def delete(self, user_id, habit_id):
+        habit_id = object_id(habit_id)
+        if habit_id is None:
+            return False
+        result = await self.collection.delete_one({'_id': habit_id, 'user_id': user_id})
+        if not result.deleted_count:
+            return False
+        await self.revisions.tombstone(user_id, HABITS, habit_id)
+        return True
+
+
+class _UserQueries(_Configurable):
+
+    PREFERENCES = {'news_category': 'technology'}
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @classmethod
+    def preferences_of(cls, user):
+        return {key: user.get(key, default) for key, default in cls.PREFERENCES.items()}
+
+
+class UserRepository(_UserQueries):
+
+    def find_by_username(self, username, projection=None):
+        return self.collection.find_one({'username': username}, projection)
+
+    def exists(self, user_id):
+        user_id = object_id(user_id)
+        return user_id is not None and self.collection.find_one({'_id': user_id}, {'_id': 1}) is not None
+
+    def create(self, user):
+        """Возвращает строковый id; DuplicateKeyError, если имя занято."""
+        return str(self.collection.insert_one(user).inserted_id)
+
+    def set_password(self, user_id, password_hash):
+        self.collection.update_one({'_id': object_id(user_id)}, {'$set': {'password': password_hash}})
+
+    def get_preferences(self, user_id):
+        """Настройки пользователя или None, если пользователя нет."""
+        user_id = object_id(user_id)
+        if user_id is None:
+            return None
+        user = self.collection.find_one({'_id': user_id}, dict.fromkeys(self.PREFERENCES, 1))
+        return self.preferences_of(user) if user else None
+
+    def set_preferences(self, user_id, preferences):
+        self.collection.update_one({'_id': object_id(user_id)}, {'$set': preferences})
+
+
+class AsyncUserRepository(_UserQueries):
+
+    async def find_by_username(self, username, projection=None):
+        return await self.collection.find_one({'username': username}, projection)
+
+    async def exists(self, user_id):
+        user_id = object_id(user_id)
+        return user_id is not None and await self.collection.find_one({'_id': user_id}, {'_id': 1}) is not None
+
+    async def create(self, user):
+        return str((await self.collection.insert_one(user)).inserted_id)
+
+    async def set_password(self, user_id, password_hash):
+        await self.collection.update_one({'_id': object_id(user_id)}, {'$set': {'password': password_hash}})
+
+    async def get_preferences(self, user_id):
+        user_id = object_id(user_id)
+        if user_id is None:
+            return None
+        user = await self.collection.find_one({'_id': user_id}, dict.fromkeys(self.PREFERENCES, 1))
+        return self.preferences_of(user) if user else None
+
+    async def set_preferences(self, user_id, preferences):
+        await self.collection.update_one({'_id': object_id(user_id)}, {'$set': preferences})
@@ -0,0 +1,232 @@
+"""Метрики запросов к API и к MongoDB.
+
+init_app(app) добавляет хуки before_request/after_request, которые замеряют
+время ответа, код и размер ответа по каждому маршруту. Слушатели PyMongo
+(mongo_listeners) считают время и число обращений к базе и относят их
+к маршруту, который их выполнил, а также следят за пулом соединений.
+Все метрики отдаются в формате Prometheus функцией render().
+"""
+import threading
+import time
+
+from flask import g, request
+from pymongo import monitoring
+from pymongo.common import MAX_POOL_SIZE
+
+import http_client
+from metrics import CounterFamily, DecayingAverage, GaugeFamily, HistogramFamily, render_all, render_histogram
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+request_duration = HistogramFamily(
+    'diary_http_request_duration_seconds', 'Время обработки запроса по маршруту')
+request_total = CounterFamily(
+    'diary_http_requests_total', 'Число запросов по маршруту и коду ответа')
+response_size = HistogramFamily(
+    'diary_http_response_size_bytes', 'Размер ответа по маршруту', buckets=SIZE_BUCKETS)
+request_db_duration = HistogramFamily(
+    'diary_http_request_db_seconds', 'Время обращений к MongoDB за один запрос по маршруту')
+request_db_round_trips = HistogramFamily(
+    'diary_http_request_db_round_trips', 'Число обращений к MongoDB за один запрос по маршруту',
+    buckets=ROUND_TRIP_BUCKETS)
+mongo_command_duration = HistogramFamily(
+    'diary_mongo_command_duration_seconds', 'Время команд MongoDB по маршруту и команде')
+mongo_command_failures = CounterFamily(
+    'diary_mongo_command_failures_total', 'Неудачные команды MongoDB')
+pool_checked_out = GaugeFamily(
+    'diary_mongo_pool_checked_out', 'Соединения MongoDB, занятые в данный момент')
+pool_wait = HistogramFamily(
+    'diary_mongo_pool_wait_seconds', 'Ожидание свободного соединения в пуле MongoDB')
+upstream_duration = 'diary_upstream_request_duration_seconds'
+
+_local = threading.local()
+
+
+def _current_route():
+    return getattr(_local, 'route', None) or 'background'
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Относит время команд MongoDB к текущему маршруту.
+
+    Синхронный PyMongo вызывает слушателя в том же потоке, который выполняет
+    запрос, поэтому текущий маршрут берется из threading.local.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        mongo_command_failures.inc(route=_current_route(), command=event.command_name)
+        self._record(event)
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.labels(route=_current_route(), command=event.command_name).observe(seconds)
+        if getattr(_local, 'route', None):
+            _local.db_time += seconds
+            _local.db_round_trips += 1
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Следит за занятостью пула и временем ожидания соединения."""
+
+    def __init__(self):
+        self.checked_out = {}
+        self.max_pool_size = {}
+        # Недавнее ожидание соединения, по нему сбрасывается нагрузка (rate_limit.py)
+        self.recent_wait = DecayingAverage()
+        self._lock = threading.Lock()
+
+    def _set_checked_out(self, address, delta):
+        with self._lock:
+            value = self.checked_out.get(address, 0) + delta
+            self.checked_out[address] = value
+        pool_checked_out.set(value, address=f"{address[0]}:{address[1]}")
+
+    def connection_check_out_started(self, event):
+        _local.checkout_started = time.perf_counter()
+
+    def _checkout_finished(self):
+        started = getattr(_local, 'checkout_started', None)
+        if started is not None:
+            waited = time.perf_counter() - started
+            pool_wait.labels(route=_current_route()).observe(waited)
+            self.recent_wait.observe(waited)
+            _local.checkout_started = None
+
+    def connection_checked_out(self, event):
+        self._checkout_finished()
+        self._set_checked_out(event.address, 1)
+
+    def connection_check_out_failed(self, event):
+        self._checkout_finished()
+
+    def connection_checked_in(self, event):
+        self._set_checked_out(event.address, -1)
+
+    def pool_created(self, event):
+        with self._lock:
+            self.max_pool_size[event.address] = event.options.get('maxPoolSize', MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def saturation(self):
+        """Наибольшая доля занятых соединений среди серверов."""
+        with self._lock:
+            ratios = [
+                self.checked_out.get(address, 0) / size
+                for address, size in self.max_pool_size.items() if size
+            ]
+        return max(ratios) if ratios else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{address[0]}:{address[1]}": {
+                    'checked_out': self.checked_out.get(address, 0),
+                    'max_pool_size': size
+                }
+                for address, size in self.max_pool_size.items()
+            }
+
+
+pool_listener = PoolListener()
+
+
+def mongo_listeners():
+    """Слушатели для параметра event_listeners у MongoClient."""
+    return [MongoCommandListener(), pool_listener]
+
+
+def _route_label():
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    _local.route = _route_label()
+    _local.db_time = 0.0
+    _local.db_round_trips = 0
+
+
+def observe_request(route, method, status, seconds, size=None, db_time=None, db_round_trips=None):
+    """Записывает метрики одного запроса; size - None для потоковых ответов.
+
+    db_time и db_round_trips известны только для PyMongo: asgi.py их не передает,
+    потому что Motor выполняет команды в своих потоках и слушатель не знает маршрут.
+    """
+    request_duration.labels(route=route, method=method).observe(seconds)
+    request_total.inc(route=route, method=method, status=status)
+    if size is not None:
+        response_size.labels(route=route, method=method).observe(size)
+    if db_time is not None:
+        request_db_duration.labels(route=route, method=method).observe(db_time)
+        request_db_round_trips.labels(route=route, method=method).observe(db_round_trips)
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    observe_request(
+        _route_label(), request.method, response.status_code, time.perf_counter() - started,
+        size=None if response.is_streamed else response.content_length,
+        db_time=_local.db_time, db_round_trips=_local.db_round_trips
+    )
+    return response
+
+
+def _teardown_request(exc):
+    _local.route = None
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def render(extra=()):
+    """Все метрики в текстовом формате Prometheus."""
+    lines = render_all()
+
+    upstreams = http_client.all_clients()
+    if upstreams:
+        lines.append(f"# HELP {upstream_duration} Время запросов к внешним API")
+        lines.append(f"# TYPE {upstream_duration} histogram")
+        for client in upstreams:
+            lines.extend(render_histogram(upstream_duration, (('upstream', client.name),), client.latency))
+        for name, key, help_text in (
+            ('diary_upstream_errors_total', 'errors', 'Ошибки запросов к внешним API'),
+            ('diary_upstream_rejected_total', 'rejected', 'Запросы, отклоненные предохранителем'),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for client in upstreams:
+                lines.append(f'{name}{{upstream="{client.name}"}} {client.stats()[key]}')
+
+    lines.extend(extra)
+    return '\n'.join(lines) + '\n'
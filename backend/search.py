@@ -0,0 +1,335 @@
+"""Полнотекстовый поиск по записям дневника.
+
+Два движка с одинаковым интерфейсом search(user_id, query, limit, after):
+    MongoTextSearchEngine - текстовый индекс MongoDB с русской морфологией
+    MemorySearchEngine    - инвертированный индекс в памяти процесса для
+                            баз без текстового индекса
+
+Движок выбирается переменной SEARCH_ENGINE (mongo или memory). Результаты
+отсортированы по релевантности, постранично отдаются по курсору
+(score, _id) и содержат подсветку найденных слов тегом <mark>.
+"""
+import base64
+import html
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from bson import ObjectId
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Окончания русских слов, от длинных к коротким
+RUSSIAN_SUFFIXES = sorted((
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ость', 'ости', 'остью',
+    'ыми', 'ими', 'его', 'ого', 'ему', 'ому', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ым', 'им', 'ом', 'ем', 'ах', 'ях',
+    'ам', 'ям', 'ов', 'ев', 'ия', 'ию', 'ии', 'ать', 'ять', 'ить', 'еть', 'уть',
+    'ешь', 'ишь', 'ете', 'ите', 'ала', 'ила', 'ыла', 'ела', 'али', 'или', 'ыли',
+    'ели', 'ал', 'ил', 'ыл', 'ел', 'ут', 'ют', 'ат', 'ят', 'ет', 'ит', 'ся', 'сь',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+), key=len, reverse=True)
+SUFFIXES_BY_LENGTH = [
+    (length, frozenset(suffix for suffix in RUSSIAN_SUFFIXES if len(suffix) == length))
+    for length in sorted({len(suffix) for suffix in RUSSIAN_SUFFIXES}, reverse=True)
+]
+MIN_STEM = 3
+
+SNIPPET_LENGTH = 200
+
+
+@lru_cache(maxsize=200000)
+def stem(word):
+    """Упрощенный русский стеммер: отрезает самое длинное подходящее окончание."""
+    word = word.lower().replace('ё', 'е')
+    for length, suffixes in SUFFIXES_BY_LENGTH:
+        if len(word) - length >= MIN_STEM and word[-length:] in suffixes:
+            return word[:-length]
+    return word
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall(text or '')]
+
+
+def highlight(text, stems, length=None):
+    """Экранирует текст и оборачивает слова с нужными основами в <mark>.
+
+    Если задана длина, возвращает фрагмент вокруг первого совпадения.
+    """
+    text = text or ''
+    matches = [m for m in TOKEN_RE.finditer(text) if stem(m.group()) in stems]
+
+    start, end = 0, len(text)
+    if length and len(text) > length:
+        first = matches[0].start() if matches else 0
+        start = max(0, first - length // 4)
+        end = min(len(text), start + length)
+
+    parts = []
+    position = start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+
+    snippet = ''.join(parts)
+    if start > 0:
+        snippet = '…' + snippet
+    if end < len(text):
+        snippet += '…'
+    return snippet
+
+
+def encode_cursor(score, entry_id):
+    raw = f"{score!r}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8')
+        score, entry_id = raw.split('|', 1)
+        return float(score), ObjectId(entry_id)
+    except Exception:
+        raise ValueError('Некорректный курсор')
+
+
+def _result(entry, score, stems):
+    return {
+        '_id': str(entry['_id']),
+        'title': entry.get('title'),
+        'date': entry.get('date'),
+        'icon': entry.get('icon'),
+        'score': round(score, 4),
+        'title_highlight': highlight(entry.get('title'), stems),
+        'snippet': highlight(entry.get('content'), stems, SNIPPET_LENGTH)
+    }
+
+
+def _page(scored, limit, stems):
+    """scored - список (score, entry) после курсора, отсортированный по убыванию."""
+    page = scored[:limit]
+    next_cursor = None
+    if len(scored) > limit:
+        score, entry = page[-1]
+        next_cursor = encode_cursor(score, entry['_id'])
+    return [_result(entry, score, stems) for score, entry in page], next_cursor
+
+
+class MongoTextSearchEngine:
+    """Поиск через текстовый индекс MongoDB (см. indexes.py)."""
+
+    name = 'mongo'
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def search(self, user_id, query, limit=20, after=None):
+        pipeline = [
+            {'$match': {'user_id': user_id, '$text': {'$search': query, '$language': 'russian'}}},
+            {'$addFields': {'score': {'$meta': 'textScore'}}}
+        ]
+        if after:
+            after_score, after_id = after
+            pipeline.append({'$match': {'$or': [
+                {'score': {'$lt': after_score}},
+                {'score': after_score, '_id': {'$lt': after_id}}
+            ]}})
+        pipeline += [
+            {'$sort': {'score': -1, '_id': -1}},
+            {'$limit': limit + 1}
+        ]
+        scored = [(entry['score'], entry) for entry in self.collection.aggregate(pipeline)]
+        return _page(scored, limit, set(tokenize(query)))
+
+    # Текстовый индекс MongoDB обновляется сам
+    def index_entry(self, entry):
+        pass
+
+    def remove_entry(self, user_id, entry_id):
+        pass
+
+    def invalidate(self, user_id):
+        pass
+
+
+class _UserIndex:
+    """Инвертированный индекс записей одного пользователя."""
+
+    TITLE_WEIGHT = 3
+
+    def __init__(self):
+        self.postings = {}
+        self.entries = {}
+        self.lengths = {}
+        self.total_length = 0
+        self.built_at = time.monotonic()
+        # Ревизия пользователя (repositories.RevisionRepository), которой соответствует индекс
+        self.revision = None
+
+    def add(self, entry):
+        entry_id = str(entry['_id'])
+        self.remove(entry_id)
+        terms = Counter(tokenize(entry.get('content')))
+        for term in tokenize(entry.get('title')):
+            terms[term] += self.TITLE_WEIGHT
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[entry_id] = frequency
+        length = sum(terms.values())
+        # Текст записи в памяти не храним - для фрагментов он читается
+        # из базы только для записей текущей страницы
+        self.entries[entry_id] = {
+            '_id': entry['_id'],
+            'title': entry.get('title'),
+            'date': entry.get('date'),
+            'icon': entry.get('icon'),
+            'terms': list(terms)
+        }
+        self.lengths[entry_id] = length
+        self.total_length += length
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for term in entry['terms']:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(entry_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(entry_id, 0)
+
+    def score(self, stems, k1=1.2, b=0.75):
+        """BM25 по всем записям, где встречается хотя бы одна основа."""
+        count = len(self.entries)
+        if not count:
+            return {}
+        average_length = self.total_length / count or 1
+        scores = {}
+        for term in stems:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for entry_id, frequency in postings.items():
+                norm = k1 * (1 - b + b * self.lengths[entry_id] / average_length)
+                scores[entry_id] = scores.get(entry_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+        return scores
+
+
+class MemorySearchEngine:
+    """Поиск по инвертированному индексу в памяти процесса.
+
+    Индекс пользователя строится при первом поиске и затем обновляется
+    хуками index_entry/remove_entry. В памяти держится не больше max_users
+    индексов; индекс старше max_age секунд перестраивается.
+
+    С revisions индекс помнит ревизию пользователя и перестраивается, если
+    она изменилась не через хуки этого процесса: записи меняют другие воркеры
+    и асинхронный сервер asgi.py.
+    """
+
+    name = 'memory'
+
+    def __init__(self, collection, max_users=1000, max_age=300, revisions=None):
+        self.collection = collection
+        self.max_users = max_users
+        self.max_age = max_age
+        self.revisions = revisions
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id):
+        # Ревизия читается до записей: изменение между ними вызовет лишнюю
+        # перестройку, но не потеряется
+        revision = self.revisions.current(user_id) if self.revisions else None
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if (index is not None and index.revision == revision
+                    and time.monotonic() - index.built_at < self.max_age):
+                self._indexes.move_to_end(user_id)
+                return index
+
+        index = _UserIndex()
+        index.revision = revision
+        cursor = self.collection.find(
+            {'user_id': user_id},
+            {'title': 1, 'content': 1, 'date': 1, 'icon': 1}
+        )
+        for entry in cursor:
+            index.add(entry)
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def search(self, user_id, query, limit=20, after=None):
+        stems = set(tokenize(query))
+        index = self._load(user_id)
+        with self._lock:
+            scores = index.score(stems)
+            scored = [(score, index.entries[entry_id]) for entry_id, score in scores.items()]
+
+        scored.sort(key=lambda item: (item[0], item[1]['_id']), reverse=True)
+        if after:
+            after_score, after_id = after
+            scored = [
+                item for item in scored
+                if item[0] < after_score or (item[0] == after_score and item[1]['_id'] < after_id)
+            ]
+
+        scored = scored[:limit + 1]
+        page_ids = [entry['_id'] for _, entry in scored[:limit]]
+        contents = {
+            entry['_id']: entry.get('content')
+            for entry in self.collection.find({'_id': {'$in': page_ids}}, {'content': 1})
+        }
+        scored = [(score, dict(entry, content=contents.get(entry['_id']))) for score, entry in scored]
+        return _page(scored, limit, stems)
+
+    def index_entry(self, entry):
+        with self._lock:
+            index = self._indexes.get(entry['user_id'])
+            if index is not None:
+                index.add(entry)
+                # Индекс остается актуальным, только если между его ревизией
+                # и ревизией записи не было других изменений
+                revision = entry.get('_rev')
+                if index.revision is not None and revision == index.revision + 1:
+                    index.revision = revision
+
+    def remove_entry(self, user_id, entry_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.remove(str(entry_id))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+
+def create_engine(collection, name=None, revisions=None):
+    name = name or os.getenv('SEARCH_ENGINE', 'mongo')
+    if name == 'memory':
+        return MemorySearchEngine(
+            collection,
+            max_users=int(os.getenv('SEARCH_MEMORY_USERS', '1000')),
+            max_age=int(os.getenv('SEARCH_MEMORY_MAX_AGE', '300')),
+            revisions=revisions
+        )
+    return MongoTextSearchEngine(collection)
@@ -0,0 +1,74 @@
+"""JSON для ответов API: ObjectId и datetime сериализуются без подготовки документов.
+
+Если установлен orjson, кодирование выполняет он (в несколько раз быстрее
+стандартного json и сразу возвращает байты), иначе - стандартный модуль json.
+Маршруты отдают документы MongoDB как есть, без цикла str(doc['_id']).
+
+    serialization.init_app(app)   - подключает провайдер к app.json (Flask и Quart)
+"""
+import json
+from datetime import date, datetime
+
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    ENCODER = 'orjson'
+
+    def dumps_bytes(obj):
+        # orjson сам пишет datetime в ISO 8601, default нужен только для ObjectId
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(obj):
+        return dumps_bytes(obj).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    ENCODER = 'json'
+
+    def dumps(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps_bytes(obj):
+        return dumps(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+def dumps_line(obj):
+    """Строка NDJSON."""
+    return dumps(obj) + '\n'
+
+
+class FastJSONProvider(JSONProvider):
+    """Провайдер app.json: jsonify() собирает тело ответа сразу в байтах."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,33 @@
+"""Продакшен-сервер на waitress (работает и в Windows).
+
+    python serve.py
+
+Число потоков задается WAITRESS_THREADS, порт - PORT.
+"""
+import os
+
+from waitress import serve
+
+from app import create_app, shutdown
+
+
+def main():
+    threads = int(os.getenv('WAITRESS_THREADS', '16'))
+    # По числу потоков auth ограничивает очередь хеширования паролей
+    os.environ['SERVER_THREADS'] = str(threads)
+    app = create_app()
+    try:
+        serve(
+            app,
+            host=os.getenv('HOST', '0.0.0.0'),
+            port=int(os.getenv('PORT', '5000')),
+            threads=threads,
+            connection_limit=int(os.getenv('WAITRESS_CONNECTION_LIMIT', '1000')),
+            channel_timeout=int(os.getenv('WAITRESS_CHANNEL_TIMEOUT', '60'))
+        )
+    finally:
+        shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Общие фикстуры: приложение app.py на mongomock."""
+import os
+from itertools import count
+
+import mongomock
+import pytest
+
+_usernames = count(1)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    # Без отправки в Telegram, с быстрым хешированием паролей и без лимитов частоты
+    os.environ['FEEDBACK_DISPATCHER'] = 'off'
+    os.environ['AUTH_PBKDF2_ITERATIONS'] = '1000'
+    os.environ.pop('AUTH_ALLOW_USER_ID', None)
+    import rate_limit
+    for endpoint in rate_limit.DEFAULT_LIMITS:
+        os.environ.setdefault(f'RATE_LIMIT_{endpoint.upper()}', '0')
+
+    import app
+    app.create_app(mongomock.MongoClient())
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    """Новый пользователь: (user_id, заголовки с токеном)."""
+    response = client.post('/api/auth/register',
+                           json={'username': f'user{next(_usernames)}', 'password': 'secret'})
+    assert response.status_code == 201, response.get_json()
+    data = response.get_json()
+    return data['user_id'], {'Authorization': f"Bearer {data['token']}"}
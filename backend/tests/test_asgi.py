@@ -0,0 +1,188 @@
+"""Асинхронный сервер asgi.py (Quart + Motor) на mongomock."""
+import asyncio
+import json
+import re
+from itertools import count
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import rate_limit
+import request_metrics
+
+
+@pytest.fixture
+def asgi(monkeypatch):
+    monkeypatch.setenv('AUTH_PBKDF2_ITERATIONS', '1000')
+    monkeypatch.delenv('AUTH_ALLOW_USER_ID', raising=False)
+    monkeypatch.delenv('RATE_LIMIT_BACKEND', raising=False)
+    for endpoint in rate_limit.DEFAULT_LIMITS:
+        monkeypatch.setenv(f'RATE_LIMIT_{endpoint.upper()}', '0')
+    import asgi
+    loop = asyncio.new_event_loop()
+    try:
+        yield AsgiClient(asgi, loop)
+    finally:
+        loop.close()
+
+
+class AsgiClient:
+    """Test client Quart, запросы выполняются в цикле событий фикстуры."""
+
+    def __init__(self, module, loop):
+        self.module = module
+        self.loop = loop
+
+    def start(self):
+        self.module.init_db(AsyncMongoMockClient())
+        self.client = self.module.app.test_client()
+        return self
+
+    def request(self, method, path, **kwargs):
+        async def send():
+            response = await self.client.open(path, method=method, **kwargs)
+            if response.headers.get('Content-Encoding'):
+                return response.status_code, response.headers, await response.get_data()
+            if response.is_json:
+                return response.status_code, response.headers, await response.get_json()
+            return response.status_code, response.headers, await response.get_data(as_text=True)
+        return self.loop.run_until_complete(send())
+
+    def register(self, username='asgi_user'):
+        _, _, data = self.request('POST', '/api/auth/register',
+                                  json={'username': username, 'password': 'secret'})
+        return {'Authorization': f"Bearer {data['token']}"}
+
+
+def test_rate_limit_applies_to_asgi_routes(asgi, monkeypatch):
+    monkeypatch.setenv('RATE_LIMIT_GET_ENTRIES', '60/2')
+    asgi.start()
+    headers = asgi.register()
+
+    statuses = [asgi.request('GET', '/api/entries', headers=headers)[0] for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    _, response_headers, body = asgi.request('GET', '/api/entries', headers=headers)
+    assert response_headers['Retry-After'] == str(body['retry_after'])
+    # Лимит считается по пользователю: другой пользователь его не исчерпал
+    assert asgi.request('GET', '/api/entries', headers=asgi.register('asgi_other'))[0] == 200
+    assert asgi.module.admission.shedder.in_flight == 0
+
+
+def test_load_shedding_applies_to_asgi_routes(asgi, monkeypatch):
+    monkeypatch.setenv('SHED_MAX_IN_FLIGHT', '1')
+    asgi.start()
+    headers = asgi.register()
+    asgi.module.admission.shedder.in_flight = 1
+
+    status, response_headers, _ = asgi.request('GET', '/api/entries', headers=headers)
+
+    assert status == 503
+    assert response_headers['Retry-After'] == '1'
+    # /api/health не ограничивается
+    asgi.module.admission.shedder.in_flight = 1
+    assert asgi.request('GET', '/api/health')[0] == 200
+
+
+# ===== СОВПАДЕНИЕ С app.py =====
+
+# Значения, которые у двух серверов различаются всегда (идентификаторы, время,
+# подписи, случайная иконка)
+VOLATILE = {'_id', 'user_id', 'username', 'token', 'date', 'created_at', 'icon',
+            'icons', 'updated_at', 'next_cursor'}
+OBJECT_ID = re.compile(r'[0-9a-f]{24}')
+CHECKED_HEADERS = ('Content-Type', 'Retry-After', 'Access-Control-Expose-Headers')
+
+
+def normalized(value):
+    if isinstance(value, dict):
+        return {key: f'<{key}>' if key in VOLATILE else normalized(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalized(item) for item in value]
+    if isinstance(value, str) and value.startswith('{'):
+        # Строки NDJSON
+        return [normalized(json.loads(line)) for line in value.splitlines()]
+    return value
+
+
+def flask_sender(client):
+    def send(method, path, json=None, headers=None):
+        response = client.open(path, method=method, json=json, headers=headers)
+        body = response.get_json() if response.is_json else response.get_data(as_text=True)
+        return response.status_code, response.headers, body
+    return send
+
+
+def parity_scenario(send):
+    """Одинаковые запросы к серверу; ответы без изменчивых значений."""
+    results = []
+
+    def call(method, path, json=None, headers=None):
+        status, response_headers, body = send(method, path, json, headers)
+        checked = {name: response_headers.get(name) for name in CHECKED_HEADERS}
+        if status == 304:
+            # Ответ 304 приходит без Content-Type, а test client Quart подставляет тип по умолчанию
+            checked.pop('Content-Type')
+        results.append((method, OBJECT_ID.sub('<id>', path), status, normalized(body), checked))
+        return body, response_headers
+
+    data, _ = call('POST', '/api/auth/register', {'username': f'parity{next(_parity_users)}', 'password': 'secret'})
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    call('GET', '/api/entries')
+    first, _ = call('POST', '/api/entries', {'title': 'первая', 'content': 'один два'}, headers)
+    second, _ = call('POST', '/api/entries', {'title': 'вторая', 'content': 'три'}, headers)
+    call('POST', '/api/entries', {'title': 'третья', 'content': ''}, headers)
+    call('PUT', f"/api/entries/{first['_id']}", {'title': 'первая*', 'content': 'один'}, headers)
+    call('PUT', '/api/entries/000000000000000000000000', {'title': 'x', 'content': ''}, headers)
+    for query in ('', '?limit=2', '?limit=2&fields=title,icon', '?format=ndjson', '?format=ndjson&limit=2',
+                  '?limit=x', '?fields=password'):
+        call('GET', f'/api/entries{query}', headers=headers)
+    _, response_headers = call('GET', '/api/entries', headers=headers)
+    call('GET', '/api/entries', headers={**headers, 'If-None-Match': response_headers['ETag']})
+    call('DELETE', f"/api/entries/{second['_id']}", headers=headers)
+    call('DELETE', f"/api/entries/{second['_id']}", headers=headers)
+    call('GET', '/api/stats', headers=headers)
+    call('GET', '/api/stats?weeks=0', headers=headers)
+
+    call('POST', '/api/habits', {'name': ''}, headers)
+    habit, _ = call('POST', '/api/habits', {'name': 'Зарядка'}, headers)
+    call('POST', f"/api/habits/{habit['_id']}/toggle", {'date': '2024-01-05'}, headers)
+    call('POST', f"/api/habits/{habit['_id']}/toggle", {'date': '05.01.2024'}, headers)
+    call('GET', '/api/habits', headers=headers)
+    call('DELETE', f"/api/habits/{habit['_id']}", headers=headers)
+    call('GET', '/api/habits', headers=headers)
+
+    call('POST', '/api/user/preferences', {'news_category': 'science'}, headers)
+    call('GET', '/api/user/preferences', headers=headers)
+    return results
+
+
+_parity_users = count(1)
+
+
+def test_shared_routes_match_app(asgi, client):
+    asgi.start()
+
+    expected = parity_scenario(flask_sender(client))
+    actual = parity_scenario(lambda method, path, json, headers: asgi.request(
+        method, path, json=json, headers=headers))
+
+    assert len(actual) == len(expected)
+    for served, reference in zip(actual, expected):
+        assert served == reference
+
+
+def test_asgi_records_request_metrics(asgi):
+    asgi.start()
+    headers = asgi.register()
+    asgi.request('POST', '/api/entries', json={'title': 'запись', 'content': 'текст ' * 500}, headers=headers)
+    size = request_metrics.response_size.labels(route='/api/entries', method='GET')
+    sent_before = size.snapshot()[1]
+
+    _, response_headers, body = asgi.request('GET', '/api/entries', headers={**headers, 'Accept-Encoding': 'gzip'})
+
+    assert response_headers['Content-Encoding'] == 'gzip'
+    # В метрику попадает размер сжатого ответа, как и в app.py
+    assert size.snapshot()[1] - sent_before == len(body)
+    _, _, metrics = asgi.request('GET', '/api/metrics')
+    assert 'diary_http_requests_total{method="GET",route="/api/entries",status="200"}' in metrics
@@ -0,0 +1,33 @@
+"""Очередь обратной связи: хранение доставленных сообщений и /api/feedback/status."""
+import mongomock
+
+import feedback_outbox
+import indexes
+
+
+def test_sent_messages_expire_and_stats_count_by_status():
+    db = mongomock.MongoClient()['diary_test']
+    indexes.ensure_indexes(db)
+    outbox = feedback_outbox.create_outbox(db)
+    outbox.enqueue('первое')
+    outbox.enqueue('второе')
+    [message, _] = outbox.claim(2)
+    outbox.mark_sent(message)
+
+    ttl = db['feedback_outbox'].index_information()['sent_at_ttl']
+    assert ttl['expireAfterSeconds'] == indexes.FEEDBACK_SENT_TTL
+    # Ожидающие отправки сообщения TTL-индекс не удаляет
+    assert ttl['partialFilterExpression'] == {'status': feedback_outbox.SENT}
+    stats = outbox.stats()
+    assert stats['counts'] == {'pending': 0, 'sending': 1, 'sent': 1, 'failed': 0}
+    assert stats['queue_depth'] == 1
+
+
+def test_feedback_status_is_rate_limited(app_module, client, monkeypatch):
+    limiter = app_module.admission.limiter
+    monkeypatch.setitem(limiter.limits, 'get_feedback_status', app_module.rate_limit.Limit(60, 2))
+
+    statuses = [client.get('/api/feedback/status', environ_base={'REMOTE_ADDR': '10.0.0.9'}).status_code
+                for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
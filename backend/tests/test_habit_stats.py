@@ -0,0 +1,56 @@
+"""Статистика привычек (habit_stats.py) и ее кэш."""
+from datetime import date, timedelta
+
+import habit_stats
+
+TODAY = date(2024, 3, 15)
+
+
+def habit_doc(rev, days):
+    return {'_id': 'h1', '_rev': rev, 'completed_dates': [(TODAY + timedelta(days=offset)).isoformat()
+                                                          for offset in days]}
+
+
+def test_cache_returns_stats_for_same_revision():
+    cache = habit_stats.HabitStatsCache()
+    stats = cache.compute(habit_doc(1, [-1, 0]), TODAY, 2024)
+
+    assert cache.get('h1', 1, TODAY, 2024) is stats
+    assert cache.get('h1', 1, TODAY + timedelta(days=1), 2024) is None
+    assert cache.get('h1', 1, TODAY, 2023) is None
+
+
+def test_cache_misses_after_change_with_same_count_and_sum():
+    # [-2, +1] и [-1, 0]: одинаковые число и сумма номеров дней
+    cache = habit_stats.HabitStatsCache()
+    before = cache.compute(habit_doc(1, [-1, 0]), TODAY, 2024)
+    assert before['current_streak'] == 2
+
+    assert cache.get('h1', 2, TODAY, 2024) is None
+    after = cache.compute(habit_doc(2, [-2, 1]), TODAY, 2024)
+    assert after['current_streak'] == 0
+    assert cache.get('h1', 2, TODAY, 2024) is after
+
+
+def test_documents_without_revision_are_not_cached():
+    cache = habit_stats.HabitStatsCache()
+    cache.compute(habit_doc(None, [0]), TODAY, 2024)
+
+    assert cache.get('h1', None, TODAY, 2024) is None
+
+
+def test_stats_route_reflects_toggles(client, user):
+    _, headers = user
+    habit = client.post('/api/habits', json={'name': 'h'}, headers=headers).get_json()
+    today = date.today().isoformat()
+
+    def total():
+        stats = client.get('/api/habits/stats', headers=headers).get_json()['habits']
+        return [item['total'] for item in stats]
+
+    assert total() == [0]
+    client.post(f"/api/habits/{habit['_id']}/toggle", json={'date': today}, headers=headers)
+    assert total() == [1]
+    assert total() == [1]
+    client.post(f"/api/habits/{habit['_id']}/toggle", json={'date': today}, headers=headers)
+    assert total() == [0]
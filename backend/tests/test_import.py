@@ -0,0 +1,68 @@
+"""Импорт NDJSON: import_id задает клиент, поэтому он действует только у своего пользователя."""
+import json
+
+
+def ndjson(*records):
+    return '\n'.join(json.dumps(record) for record in records)
+
+
+def import_entries(client, headers, import_id, *titles):
+    return client.post(f'/api/entries/import?import_id={import_id}',
+                       data=ndjson(*({'title': title, 'content': ''} for title in titles)),
+                       headers=headers)
+
+
+def test_same_import_id_for_different_users(client, user, app_module):
+    _, first_headers = user
+    second = client.post('/api/auth/register', json={'username': 'importer2', 'password': 'secret'})
+    second_headers = {'Authorization': f"Bearer {second.get_json()['token']}"}
+
+    first = import_entries(client, first_headers, 'shared', 'a', 'b')
+    response = import_entries(client, second_headers, 'shared', 'c')
+
+    assert first.status_code == 200
+    assert response.status_code == 200
+    assert response.get_json()['import_id'] == 'shared'
+    assert response.get_json()['inserted'] == 1
+    assert client.get('/api/imports/shared', headers=first_headers).get_json()['inserted'] == 2
+    assert [entry['title'] for entry in client.get('/api/entries', headers=second_headers).get_json()] == ['c']
+
+
+def test_repeated_import_id_resumes_finished_job(client, user):
+    _, headers = user
+    import_entries(client, headers, 'again', 'a')
+
+    response = import_entries(client, headers, 'again', 'a')
+
+    assert response.status_code == 200
+    assert response.get_json()['inserted'] == 1
+    assert len(client.get('/api/entries', headers=headers).get_json()) == 1
+
+
+def test_concurrent_start_of_same_import_is_conflict(client, user, app_module, monkeypatch):
+    _, headers = user
+    import_entries(client, headers, 'busy', 'a')
+    # Другой запрос создал задачу между поиском и вставкой
+    monkeypatch.setattr(app_module.imports_collection, 'find_one', lambda *args, **kwargs: None)
+
+    response = import_entries(client, headers, 'busy', 'b')
+
+    assert response.status_code == 409
+    assert 'error' in response.get_json()
+
+
+def test_export_and_import_do_not_carry_revision(client, user, app_module):
+    user_id, headers = user
+    client.post('/api/entries', json={'title': 'a', 'content': ''}, headers=headers)
+    client.post('/api/habits', json={'name': 'h'}, headers=headers)
+
+    for kind in ('entries', 'habits'):
+        lines = client.get(f'/api/{kind}/export', headers=headers).get_data(as_text=True).splitlines()
+        assert lines and all('_rev' not in json.loads(line) for line in lines)
+
+    # _rev из файла не записывается: документ получает новую ревизию пользователя
+    response = client.post('/api/entries/import?import_id=rev',
+                           data=ndjson({'title': 'b', 'content': '', '_rev': 1000}), headers=headers)
+    assert response.status_code == 200
+    imported = app_module.entries_collection.find_one({'user_id': user_id, 'title': 'b'})
+    assert imported['_rev'] == app_module.revision_repo.current(user_id)
@@ -0,0 +1,14 @@
+"""Метрики запросов app.py (request_metrics.py)."""
+import request_metrics
+
+
+def test_app_records_compressed_response_size(client, user):
+    _, headers = user
+    client.post('/api/entries', json={'title': 'запись', 'content': 'текст ' * 500}, headers=headers)
+    size = request_metrics.response_size.labels(route='/api/entries', method='GET')
+    sent_before = size.snapshot()[1]
+
+    response = client.get('/api/entries', headers={**headers, 'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert size.snapshot()[1] - sent_before == len(response.get_data())
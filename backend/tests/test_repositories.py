@@ -0,0 +1,217 @@
+"""Репозитории (repositories.py) на mongomock: PyMongo- и Motor-варианты.
+
+Каждый тест выполняется для обоих вариантов: asyncio-методы запускаются
+через цикл событий фикстуры, синхронные возвращают результат сразу.
+"""
+import asyncio
+import inspect
+
+import mongomock
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import WriteConcern
+
+import repositories
+
+OWNER = 'owner'
+STRANGER = 'stranger'
+
+
+class Repos:
+    """Репозитории одного варианта и функция, которая дожидается их результата."""
+
+    def __init__(self, db, asynchronous, loop=None):
+        self.db = db
+        self.loop = loop
+        prefix = 'Async' if asynchronous else ''
+
+        def repository(name):
+            return getattr(repositories, prefix + name)
+
+        self.revisions = repository('RevisionRepository')(db['revisions'], db['tombstones'])
+        self.stats = repository('UserStatsRepository')(db['user_stats'])
+        self.entries = repository('EntryRepository')(db['entries'], self.revisions, self.stats)
+        self.habits = repository('HabitRepository')(db['habits'], self.revisions)
+
+    def run(self, result):
+        if inspect.isawaitable(result):
+            return self.loop.run_until_complete(result)
+        return result
+
+
+@pytest.fixture(params=['sync', 'async'])
+def repos(request, monkeypatch):
+    monkeypatch.delenv('HABIT_STORAGE', raising=False)
+    if request.param == 'sync':
+        yield Repos(mongomock.MongoClient()['diary_test'], asynchronous=False)
+        return
+    loop = asyncio.new_event_loop()
+    try:
+        yield Repos(AsyncMongoMockClient()['diary_test'], asynchronous=True, loop=loop)
+    finally:
+        loop.close()
+
+
+def new_entry(user_id=OWNER, title='Заголовок', content='один два три'):
+    return {'user_id': user_id, 'title': title, 'content': content,
+            'date': '2024-01-05T10:00:00', 'icon': 'star'}
+
+
+def new_habit(user_id=OWNER, name='Зарядка'):
+    return {'user_id': user_id, 'name': name, 'completed_dates': [], 'created_at': '2024-01-01T00:00:00'}
+
+
+def stored(repos, collection, doc_id):
+    return repos.run(repos.db[collection].find_one({'_id': doc_id}))
+
+
+def current(repos, user_id=OWNER):
+    return repos.run(repos.revisions.current(user_id))
+
+
+def stats(repos, user_id=OWNER):
+    return repos.run(repos.stats.get(user_id)) or {}
+
+
+# ===== ЗАПИСИ =====
+
+def test_create_entry_stamps_revision_and_counts_stats(repos):
+    entry = repos.run(repos.entries.create(new_entry()))
+
+    assert entry['_id'] is not None
+    assert entry['_rev'] == 1
+    assert stored(repos, 'entries', entry['_id'])['_rev'] == 1
+    assert current(repos) == 1
+    assert stats(repos)['entries'] == 1
+    assert stats(repos)['words'] == 4
+
+
+def test_update_entry_of_owner(repos):
+    entry = repos.run(repos.entries.create(new_entry()))
+
+    updated = repos.run(repos.entries.update(OWNER, str(entry['_id']), {'content': 'один'}))
+
+    assert updated['content'] == 'один'
+    assert updated['_rev'] == 2
+    assert stored(repos, 'entries', entry['_id'])['_rev'] == 2
+    assert stats(repos)['words'] == 2
+
+
+def test_update_entry_of_other_user_changes_nothing(repos):
+    entry = repos.run(repos.entries.create(new_entry()))
+
+    assert repos.run(repos.entries.update(STRANGER, str(entry['_id']), {'title': 'чужой'})) is None
+    assert repos.run(repos.entries.update(OWNER, 'not-an-id', {'title': 'x'})) is None
+
+    doc = stored(repos, 'entries', entry['_id'])
+    assert doc['title'] == 'Заголовок'
+    assert doc['_rev'] == 1
+    # Ревизии не меняются, поэтому ETag и кэши клиентов остаются действительными
+    assert current(repos) == 1
+    assert current(repos, STRANGER) == 0
+
+
+def test_delete_entry_of_owner_leaves_tombstone(repos):
+    entry = repos.run(repos.entries.create(new_entry()))
+
+    assert repos.run(repos.entries.delete(OWNER, str(entry['_id']))) is True
+
+    assert stored(repos, 'entries', entry['_id']) is None
+    assert current(repos) == 2
+    deleted = repos.run(repos.db['tombstones'].find_one({'doc_id': str(entry['_id'])}))
+    assert deleted['rev'] == 2
+    assert deleted['kind'] == repositories.ENTRIES
+    assert stats(repos)['entries'] == 0
+
+
+def test_delete_entry_of_other_user_changes_nothing(repos):
+    entry = repos.run(repos.entries.create(new_entry()))
+
+    assert repos.run(repos.entries.delete(STRANGER, str(entry['_id']))) is False
+    assert repos.run(repos.entries.delete(OWNER, 'not-an-id')) is False
+
+    assert stored(repos, 'entries', entry['_id']) is not None
+    assert repos.run(repos.db['tombstones'].count_documents({})) == 0
+    assert current(repos) == 1
+    assert stats(repos)['entries'] == 1
+
+
+def test_changed_since_includes_documents_without_revision(repos):
+    first = repos.run(repos.entries.create(new_entry(title='первая')))
+    repos.run(repos.entries.create(new_entry(title='вторая')))
+    # Документ записан, но ревизия еще не проставлена
+    repos.run(repos.db['entries'].update_one({'_id': first['_id']}, {'$set': {'_rev': None}}))
+
+    changed = repos.run(repos.entries.changed_since(OWNER, 2))
+
+    assert [doc['title'] for doc in changed] == ['первая']
+
+
+# ===== ПРИВЫЧКИ =====
+
+def test_toggle_habit_of_owner(repos):
+    habit = repos.run(repos.habits.create(new_habit()))
+    assert habit['_rev'] == 1
+
+    checked = repos.run(repos.habits.toggle(OWNER, str(habit['_id']), '2024-01-05'))
+    assert checked['completed_dates'] == ['2024-01-05']
+    assert checked['_rev'] == 2
+
+    unchecked = repos.run(repos.habits.toggle(OWNER, str(habit['_id']), '2024-01-05'))
+    assert unchecked['completed_dates'] == []
+    assert stored(repos, 'habits', habit['_id'])['_rev'] == 3
+
+
+def test_toggle_habit_of_other_user_changes_nothing(repos):
+    habit = repos.run(repos.habits.create(new_habit()))
+
+    assert repos.run(repos.habits.toggle(STRANGER, str(habit['_id']), '2024-01-05')) is None
+    assert repos.run(repos.habits.toggle(OWNER, 'not-an-id', '2024-01-05')) is None
+
+    doc = stored(repos, 'habits', habit['_id'])
+    assert doc['completed_dates'] == []
+    assert doc['_rev'] == 1
+    assert current(repos) == 1
+    assert current(repos, STRANGER) == 0
+
+
+def test_delete_habit_ownership(repos):
+    habit = repos.run(repos.habits.create(new_habit()))
+
+    assert repos.run(repos.habits.delete(STRANGER, str(habit['_id']))) is False
+    assert stored(repos, 'habits', habit['_id']) is not None
+    assert current(repos) == 1
+
+    assert repos.run(repos.habits.delete(OWNER, str(habit['_id']))) is True
+    assert stored(repos, 'habits', habit['_id']) is None
+    deleted = repos.run(repos.db['tombstones'].find_one({'doc_id': str(habit['_id'])}))
+    assert deleted['kind'] == repositories.HABITS
+    assert deleted['rev'] == current(repos) == 2
+
+
+def test_list_and_count_habits_of_user(repos):
+    repos.run(repos.habits.create(new_habit(name='первая')))
+    repos.run(repos.habits.create(new_habit(name='вторая')))
+    repos.run(repos.habits.create(new_habit(user_id=STRANGER, name='чужая')))
+
+    habits = list(repos.run(repos.habits.list(OWNER)))
+
+    assert sorted(habit['name'] for habit in habits) == ['вторая', 'первая']
+    assert repos.run(repos.habits.count(OWNER)) == 2
+
+
+# ===== НАСТРОЙКИ =====
+
+def test_with_options_applies_to_nested_repositories(repos):
+    concern = WriteConcern(w='majority')
+
+    entries = repos.entries.with_options(write_concern=concern)
+    habits = repos.habits.with_options(write_concern=concern)
+
+    touched = [entries.collection, entries.revisions.revisions, entries.revisions.tombstones,
+               entries.stats.collection, habits.collection, habits.revisions.revisions,
+               habits.revisions.tombstones]
+    assert [collection.write_concern.document for collection in touched] == [{'w': 'majority'}] * 7
+    # Исходные репозитории не меняются
+    assert repos.entries.revisions.revisions.write_concern.document == {}
+    assert repos.entries.stats.collection.write_concern.document == {}
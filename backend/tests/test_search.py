@@ -0,0 +1,48 @@
+"""Индекс поиска в памяти (search.MemorySearchEngine) и изменения из других процессов."""
+import mongomock
+
+import repositories
+import search
+
+USER = 'user'
+
+
+def make_engine():
+    db = mongomock.MongoClient()['diary_test']
+    revisions = repositories.RevisionRepository(db['revisions'], db['tombstones'])
+    entries = repositories.EntryRepository(db['entries'], revisions,
+                                           repositories.UserStatsRepository(db['user_stats']))
+    return search.MemorySearchEngine(db['entries'], revisions=revisions), entries, db
+
+
+def titles(engine, query):
+    results, _ = engine.search(USER, query)
+    return sorted(result['title'] for result in results)
+
+
+def entry(title):
+    return {'user_id': USER, 'title': title, 'content': '', 'date': '2024-01-05T10:00:00', 'icon': 'star'}
+
+
+def test_index_follows_changes_made_elsewhere():
+    engine, entries, _ = make_engine()
+    entries.create(entry('яблоко'))
+    assert titles(engine, 'яблоко') == ['яблоко']
+
+    # Запись изменена другим процессом (воркером gunicorn или asgi.py) без хуков
+    entries.create(entry('яблоко зеленое'))
+
+    assert titles(engine, 'яблоко') == ['яблоко', 'яблоко зеленое']
+
+
+def test_local_changes_keep_index(monkeypatch):
+    engine, entries, db = make_engine()
+    entries.create(entry('груша'))
+    engine.search(USER, 'груша')
+
+    engine.index_entry(entries.create(entry('груша спелая')))
+    # Индекс актуален, поэтому записи из базы заново не читаются
+    monkeypatch.setattr(engine, 'collection', db['missing'])
+
+    results, _ = engine.search(USER, 'груша')
+    assert sorted(result['title'] for result in results) == ['груша', 'груша спелая']
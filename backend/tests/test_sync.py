@@ -0,0 +1,78 @@
+"""/api/sync и выдача изменений для данных, созданных до появления ревизий."""
+from migrations import MigrationRunner
+from migrations.m0002_entry_revisions import EntryRevisionBackfill
+
+
+def insert_legacy_entry(app_module, user_id, title):
+    # Запись старой версии сервера: без _rev и без документа в revisions
+    return app_module.entries_collection.insert_one({
+        'user_id': user_id, 'title': title, 'content': '', 'date': '2024-01-05T10:00:00', 'icon': 'star'
+    }).inserted_id
+
+
+def titles(response):
+    return sorted(entry['title'] for entry in response.get_json()['entries'])
+
+
+def test_full_sync_of_user_without_revisions(app_module, client, user):
+    user_id, headers = user
+    insert_legacy_entry(app_module, user_id, 'old')
+
+    response = client.get('/api/sync?since=0', headers=headers)
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['revision'] == 0
+    assert data['full'] is True
+    assert titles(response) == ['old']
+    assert [entry['title'] for entry in client.get('/api/entries', headers=headers).get_json()] == ['old']
+
+
+def test_delta_sync_skips_documents_written_before_revisions(app_module, client, user):
+    user_id, headers = user
+    insert_legacy_entry(app_module, user_id, 'old')
+    client.post('/api/entries', json={'title': 'new1', 'content': ''}, headers=headers)
+    client.post('/api/entries', json={'title': 'new2', 'content': ''}, headers=headers)
+
+    response = client.get('/api/sync?since=1', headers=headers)
+
+    assert response.get_json()['full'] is False
+    assert titles(response) == ['new2']
+    assert titles(client.get('/api/sync?since=0', headers=headers)) == ['new1', 'new2', 'old']
+
+
+def test_sync_without_changes_returns_nothing(client, user):
+    _, headers = user
+    client.post('/api/entries', json={'title': 'new', 'content': ''}, headers=headers)
+
+    data = client.get('/api/sync?since=1', headers=headers).get_json()
+
+    assert data == {'revision': 1, 'full': False, 'entries': [], 'habits': [],
+                    'deleted': {'entries': [], 'habits': []}}
+
+
+def test_revision_backfill_migration(app_module, user):
+    user_id, _ = user
+    entry_id = insert_legacy_entry(app_module, user_id, 'old')
+    runner = MigrationRunner(app_module.db, log=lambda message: None)
+
+    runner.run(EntryRevisionBackfill())
+
+    assert app_module.entries_collection.find_one({'_id': entry_id})['_rev'] == 0
+
+
+def test_api_responses_do_not_expose_revision(client, user):
+    _, headers = user
+    entry = client.post('/api/entries', json={'title': 'a', 'content': ''}, headers=headers).get_json()
+    habit = client.post('/api/habits', json={'name': 'h'}, headers=headers).get_json()
+    updated = client.put(f"/api/entries/{entry['_id']}", json={'title': 'b', 'content': ''},
+                         headers=headers).get_json()
+    toggled = client.post(f"/api/habits/{habit['_id']}/toggle", json={'date': '2024-01-05'},
+                          headers=headers).get_json()
+    sync = client.get('/api/sync?since=0', headers=headers).get_json()
+
+    docs = [entry, habit, updated, toggled, *sync['entries'], *sync['habits'],
+            *client.get('/api/entries', headers=headers).get_json(),
+            *client.get('/api/habits', headers=headers).get_json()]
+    assert len(docs) == 8
+    assert all('_rev' not in doc for doc in docs)
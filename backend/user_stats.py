@@ -0,0 +1,265 @@
+"""Статистика дневника пользователя, которая поддерживается инкрементально.
+
+Для каждого пользователя в коллекции user_stats хранится один документ:
+
+    entries, words, chars           - записи, слова и символы всего
+    weeks.<YYYY-Www>.entries/words  - записи и слова по ISO-неделям
+    hours.<HH>                      - записи по часу создания
+    weekdays.<1..7>                 - записи по дню недели (1 - понедельник)
+    icons.<icon>                    - записи по иконкам
+
+Создание, изменение и удаление записи (repositories.py) и пачки импорта
+меняют документ одним $inc с разницей счетчиков, поэтому /api/stats читает
+ровно один документ. Словом считается последовательность символов без
+пробелов, дата записи - строка ISO, неделя и час берутся из нее как есть.
+
+Пересчет по всем записям агрегацией и проверка расхождений:
+    python user_stats.py rebuild [--user USER_ID] [--client-side]
+    python user_stats.py check [--user USER_ID]
+"""
+import argparse
+import os
+import re
+import sys
+from collections import Counter
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB_NAME = 'diary_db'
+
+# Пробельные символы перечислены явно: так Python и $regexFindAll в MongoDB
+# делят текст на слова одинаково
+WORD_PATTERN = r'[^ \t\n\r\f\v]+'
+WORD_RE = re.compile(WORD_PATTERN)
+
+
+def _week(day):
+    try:
+        iso_year, iso_week, weekday = date.fromisoformat(day).isocalendar()
+    except (TypeError, ValueError):
+        return None, None
+    return f"{iso_year}-W{iso_week:02d}", weekday
+
+
+def bucket_counters(day, hour, icon, entries, words, chars):
+    """Плоские счетчики ($inc-пути) для записей с одинаковыми днем, часом и иконкой."""
+    counters = Counter({'entries': entries, 'words': words, 'chars': chars})
+    week, weekday = _week(day)
+    if week:
+        counters[f'weeks.{week}.entries'] += entries
+        counters[f'weeks.{week}.words'] += words
+        counters[f'weekdays.{weekday}'] += entries
+    if hour and len(hour) == 2 and hour.isdigit():
+        counters[f'hours.{hour}'] += entries
+    if icon:
+        counters[f'icons.{icon}'] += entries
+    return counters
+
+
+def entry_counters(entry):
+    """Вклад одной записи в статистику."""
+    title = entry.get('title') or ''
+    content = entry.get('content') or ''
+    value = entry.get('date') if isinstance(entry.get('date'), str) else ''
+    return bucket_counters(
+        value[:10],
+        value[11:13],
+        entry.get('icon'),
+        1,
+        len(WORD_RE.findall(title)) + len(WORD_RE.findall(content)),
+        len(title) + len(content)
+    )
+
+
+def diff(before=None, after=None):
+    """$inc для перехода записи из before в after (None - записи нет)."""
+    delta = Counter()
+    if after:
+        delta.update(entry_counters(after))
+    if before:
+        delta.subtract(entry_counters(before))
+    return {key: value for key, value in delta.items() if value}
+
+
+def total(entries):
+    """Суммарный $inc для пачки новых записей (импорт)."""
+    counters = Counter()
+    for entry in entries:
+        counters.update(entry_counters(entry))
+    return dict(counters)
+
+
+def to_document(counters):
+    """Плоские счетчики -> вложенный документ без нулевых значений."""
+    doc = {'entries': 0, 'words': 0, 'chars': 0, 'weeks': {}, 'hours': {}, 'weekdays': {}, 'icons': {}}
+    for path, value in counters.items():
+        if not value:
+            continue
+        *parents, key = path.split('.')
+        node = doc
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return doc
+
+
+def _prune(node):
+    # Нулевые счетчики остаются в документе после удалений - при выдаче
+    # и сравнении они не нужны
+    if isinstance(node, dict):
+        pruned = {key: _prune(value) for key, value in node.items()}
+        return {key: value for key, value in pruned.items() if value not in (0, {}, None)}
+    return node
+
+
+def public(doc, weeks=None):
+    """Документ user_stats -> ответ /api/stats."""
+    doc = doc or {}
+    entries = doc.get('entries', 0)
+    words = doc.get('words', 0)
+    hours = {f'{hour:02d}': doc.get('hours', {}).get(f'{hour:02d}', 0) for hour in range(24)}
+    weekdays = {str(day): doc.get('weekdays', {}).get(str(day), 0) for day in range(1, 8)}
+    week_items = [
+        {'week': week, 'entries': value.get('entries', 0), 'words': value.get('words', 0)}
+        for week, value in sorted(_prune(doc.get('weeks', {})).items())
+    ]
+    if weeks:
+        week_items = week_items[-weeks:]
+    return {
+        'entries': entries,
+        'words': words,
+        'chars': doc.get('chars', 0),
+        'avg_words': round(words / entries, 1) if entries else 0,
+        'weeks': week_items,
+        'hours': hours,
+        'most_active_hour': max(hours, key=hours.get) if entries else None,
+        'weekdays': weekdays,
+        'icons': _prune(doc.get('icons', {})),
+        'updated_at': doc.get('updated_at')
+    }
+
+
+def _text(field):
+    return {'$ifNull': [f'${field}', '']}
+
+
+def rebuild_pipeline(user_id=None):
+    """Агрегация, которая считает слова и символы на сервере.
+
+    Записи группируются по (пользователь, день, час, иконка), дальше группы
+    раскладываются по неделям функцией bucket_counters - той же, что и при
+    инкрементальном обновлении.
+    """
+    date_string = {'$cond': [{'$eq': [{'$type': '$date'}, 'string']}, '$date', '']}
+    pipeline = [
+        {'$project': {
+            'user_id': 1,
+            'icon': 1,
+            'day': {'$substrCP': [date_string, 0, 10]},
+            'hour': {'$substrCP': [date_string, 11, 2]},
+            'words': {'$add': [
+                {'$size': {'$regexFindAll': {'input': _text('title'), 'regex': WORD_PATTERN}}},
+                {'$size': {'$regexFindAll': {'input': _text('content'), 'regex': WORD_PATTERN}}}
+            ]},
+            'chars': {'$add': [{'$strLenCP': _text('title')}, {'$strLenCP': _text('content')}]}
+        }},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'day': '$day', 'hour': '$hour', 'icon': '$icon'},
+            'entries': {'$sum': 1},
+            'words': {'$sum': '$words'},
+            'chars': {'$sum': '$chars'}
+        }},
+        {'$sort': {'_id.user_id': 1}}
+    ]
+    if user_id:
+        pipeline.insert(0, {'$match': {'user_id': user_id}})
+    return pipeline
+
+
+def recompute(entries_collection, user_id=None, server_side=True):
+    """Статистика по записям: {user_id: плоские счетчики}."""
+    result = {}
+    if server_side:
+        for group in entries_collection.aggregate(rebuild_pipeline(user_id), allowDiskUse=True):
+            key = group['_id']
+            counters = result.setdefault(key['user_id'], Counter())
+            counters.update(bucket_counters(
+                key['day'], key['hour'], key.get('icon'), group['entries'], group['words'], group['chars']
+            ))
+    else:
+        query = {'user_id': user_id} if user_id else {}
+        projection = {'user_id': 1, 'title': 1, 'content': 1, 'date': 1, 'icon': 1}
+        for entry in entries_collection.find(query, projection).batch_size(1000):
+            result.setdefault(entry['user_id'], Counter()).update(entry_counters(entry))
+    return result
+
+
+def rebuild(db, user_id=None, server_side=True):
+    """Пересчитывает документы user_stats. Возвращает число пользователей."""
+    stats = db['user_stats']
+    computed = recompute(db['entries'], user_id, server_side)
+    now = datetime.utcnow()
+    for uid, counters in computed.items():
+        stats.replace_one({'_id': uid}, {**to_document(counters), 'updated_at': now}, upsert=True)
+    # Статистика пользователей, у которых не осталось записей
+    if not user_id:
+        stats.delete_many({'_id': {'$nin': list(computed)}})
+    elif user_id not in computed:
+        stats.delete_one({'_id': user_id})
+    return len(computed)
+
+
+def check(db, user_id=None, server_side=True):
+    """Сравнивает сохраненную статистику с пересчитанной.
+
+    Возвращает список (user_id, ожидаемое, сохраненное) для расхождений.
+    """
+    computed = recompute(db['entries'], user_id, server_side)
+    query = {'_id': user_id} if user_id else {}
+    stored = {doc['_id']: doc for doc in db['user_stats'].find(query)}
+    drift = []
+    for uid in sorted(set(computed) | set(stored)):
+        expected = _prune(to_document(computed.get(uid, {})))
+        actual = _prune({key: value for key, value in stored.get(uid, {}).items()
+                         if key not in ('_id', 'updated_at')})
+        if expected != actual:
+            drift.append((uid, expected, actual))
+    return drift
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Статистика записей пользователей')
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', DEFAULT_DB_NAME))
+    parser.add_argument('--user', help='только этот user_id')
+    parser.add_argument('--client-side', action='store_true',
+                        help='считать слова в Python, а не агрегацией (MongoDB до 4.4)')
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    server_side = not args.client_side
+
+    if args.command == 'rebuild':
+        started = datetime.now()
+        count = rebuild(db, args.user, server_side)
+        print(f"Пересчитано пользователей: {count} за {(datetime.now() - started).total_seconds():.1f} с")
+        return 0
+
+    drift = check(db, args.user, server_side)
+    for uid, expected, actual in drift:
+        print(f"{uid}: ожидалось entries={expected.get('entries', 0)} words={expected.get('words', 0)}, "
+              f"сохранено entries={actual.get('entries', 0)} words={actual.get('words', 0)}")
+    if drift:
+        print(f"Расхождений: {len(drift)}. Исправить: python user_stats.py rebuild")
+        return 1
+    print("Статистика совпадает с записями")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
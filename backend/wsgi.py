@@ -0,0 +1,7 @@
+"""Точка входа WSGI для продакшен-сервера.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()
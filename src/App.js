@@ -7,6 +7,7 @@ import Calendar from './components/Calendar';
 import Habits from './components/Habits';
 import Feedback from './components/Feedback';
 import News from './components/News';
+import { getToken, saveSession, clearSession, authHeaders } from './utils/auth';
 import { FaSignOutAlt, FaList, FaCalendarAlt, FaCheckSquare, FaCommentDots, FaNewspaper } from 'react-icons/fa';
 
 const API_URL = 'http://localhost:5000/api';
@@ -17,7 +18,7 @@ function App() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [editingEntry, setEditingEntry] = useState(null);
-  const [token, setToken] = useState(localStorage.getItem('user_id'));
+  const [token, setToken] = useState(getToken());
   const [username, setUsername] = useState(localStorage.getItem('username'));
   const [viewMode, setViewMode] = useState('list'); // 'list', 'calendar', 'habits', или 'news'
   const [showFeedback, setShowFeedback] = useState(false);
@@ -35,8 +36,12 @@ function App() {
   const fetchEntries = async () => {
     try {
       setLoading(true);
-      const userId = localStorage.getItem('user_id');
-      const response = await fetch(`${API_URL}/entries?user_id=${userId}`);
+      const response = await fetch(`${API_URL}/entries`, { headers: authHeaders() });
+      if (response.status === 401) {
+        // Токен истек или подписан другим ключом - нужен новый вход
+        handleLogout();
+        return;
+      }
       if (!response.ok) {
         throw new Error('Ошибка загрузки записей');
       }
@@ -53,16 +58,14 @@ function App() {
 
   const addEntry = async (title, content) => {
     try {
-      const userId = localStorage.getItem('user_id');
       const response = await fetch(`${API_URL}/entries`, {
         method: 'POST',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({ 
           title, 
-          content,
-          user_id: userId
+          content
         }),
       });
 
@@ -82,16 +85,14 @@ function App() {
 
   const updateEntry = async (id, title, content) => {
     try {
-      const userId = localStorage.getItem('user_id');
       const response = await fetch(`${API_URL}/entries/${id}`, {
         method: 'PUT',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({ 
           title, 
-          content,
-          user_id: userId
+          content
         }),
       });
 
@@ -138,9 +139,9 @@ function App() {
 
   const deleteEntry = async (id) => {
     try {
-      const userId = localStorage.getItem('user_id');
-      const response = await fetch(`${API_URL}/entries/${id}?user_id=${userId}`, {
-        method: 'DELETE'
+      const response = await fetch(`${API_URL}/entries/${id}`, {
+        method: 'DELETE',
+        headers: authHeaders()
       });
 
       if (!response.ok) {
@@ -155,16 +156,14 @@ function App() {
     }
   };
 
-  const handleLogin = (userId, newUsername) => {
-    localStorage.setItem('user_id', userId);
-    localStorage.setItem('username', newUsername);
-    setToken(userId);  // используем как флаг авторизации
+  const handleLogin = (newToken, newUsername) => {
+    saveSession(newToken, newUsername);
+    setToken(newToken);
     setUsername(newUsername);
   };
 
   const handleLogout = () => {
-    localStorage.removeItem('user_id');
-    localStorage.removeItem('username');
+    clearSession();
     setToken(null);
     setUsername(null);
     setEntries([]);
@@ -30,8 +30,8 @@ function Auth({ onLogin }) {
         throw new Error(data.error || 'Ошибка авторизации');
       }
 
-      // Сохраняем user_id и имя пользователя
-      onLogin(data.user_id, data.username);
+      // Сохраняем токен и имя пользователя
+      onLogin(data.token, data.username);
     } catch (err) {
       setError(err.message);
     } finally {
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import './Calendar.css';
 import { getIconByKey } from '../utils/icons';
+import { authHeaders } from '../utils/auth';
 import { FaPlus, FaCheckCircle } from 'react-icons/fa';
 
 const API_URL = 'http://localhost:5000/api';
@@ -74,8 +75,7 @@ function Calendar({ entries, onEdit, onCreateForDate, onViewList }) {
 
   const fetchHabits = async () => {
     try {
-      const userId = localStorage.getItem('user_id');
-      const response = await fetch(`${API_URL}/habits?user_id=${userId}`);
+      const response = await fetch(`${API_URL}/habits`, { headers: authHeaders() });
       if (response.ok) {
         const data = await response.json();
         setHabits(data);
@@ -116,14 +116,12 @@ function Calendar({ entries, onEdit, onCreateForDate, onViewList }) {
   // Переключить выполнение привычки
   const toggleHabit = async (habitId, dateStr) => {
     try {
-      const userId = localStorage.getItem('user_id');
       const response = await fetch(`${API_URL}/habits/${habitId}/toggle`, {
         method: 'POST',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
-          user_id: userId,
           date: dateStr
         }),
       });
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import './Habits.css';
 import { FaPlus, FaTrash, FaCheck, FaTimes } from 'react-icons/fa';
+import { authHeaders } from '../utils/auth';
 
 function Habits() {
   const [habits, setHabits] = useState([]);
@@ -15,8 +16,7 @@ function Habits() {
 
   const fetchHabits = async () => {
     try {
-      const userId = localStorage.getItem('user_id');
-      const response = await fetch(`${API_URL}/habits?user_id=${userId}`);
+      const response = await fetch(`${API_URL}/habits`, { headers: authHeaders() });
       const data = await response.json();
       setHabits(data);
       setLoading(false);
@@ -30,12 +30,10 @@ function Habits() {
     if (!newHabitName.trim()) return;
 
     try {
-      const userId = localStorage.getItem('user_id');
       const response = await fetch(`${API_URL}/habits`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
-          user_id: userId,
           name: newHabitName
         })
       });
@@ -50,9 +48,9 @@ function Habits() {
 
   const deleteHabit = async (habitId) => {
     try {
-      const userId = localStorage.getItem('user_id');
-      await fetch(`${API_URL}/habits/${habitId}?user_id=${userId}`, {
-        method: 'DELETE'
+      await fetch(`${API_URL}/habits/${habitId}`, {
+        method: 'DELETE',
+        headers: authHeaders()
       });
       setHabits(habits.filter(h => h._id !== habitId));
     } catch (error) {
@@ -62,14 +60,12 @@ function Habits() {
 
   const toggleHabitToday = async (habitId) => {
     try {
-      const userId = localStorage.getItem('user_id');
       const today = new Date().toISOString().split('T')[0];
       
       const response = await fetch(`${API_URL}/habits/${habitId}/toggle`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
-          user_id: userId,
           date: today
         })
       });
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import './News.css';
 import { FaNewspaper, FaSync, FaCog, FaExternalLinkAlt } from 'react-icons/fa';
+import { authHeaders } from '../utils/auth';
 
 const API_URL = 'http://localhost:5000/api';
 
@@ -33,8 +34,7 @@ function News() {
 
   const loadUserPreferences = async () => {
     try {
-      const userId = localStorage.getItem('user_id');
-      const response = await fetch(`${API_URL}/user/preferences?user_id=${userId}`);
+      const response = await fetch(`${API_URL}/user/preferences`, { headers: authHeaders() });
       
       if (response.ok) {
         const data = await response.json();
@@ -49,14 +49,12 @@ function News() {
 
   const saveUserPreferences = async (category) => {
     try {
-      const userId = localStorage.getItem('user_id');
       await fetch(`${API_URL}/user/preferences`, {
         method: 'POST',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
-          user_id: userId,
           news_category: category
         }),
       });
@@ -0,0 +1,23 @@
+// Токен выдают /api/auth/login и /api/auth/register, сервер проверяет его подпись
+const TOKEN_KEY = 'token';
+
+export const getToken = () => localStorage.getItem(TOKEN_KEY);
+
+export const saveSession = (token, username) => {
+  localStorage.setItem(TOKEN_KEY, token);
+  localStorage.setItem('username', username);
+  // user_id без токена больше не нужен
+  localStorage.removeItem('user_id');
+};
+
+export const clearSession = () => {
+  localStorage.removeItem(TOKEN_KEY);
+  localStorage.removeItem('username');
+  localStorage.removeItem('user_id');
+};
+
+// Заголовки запроса с Authorization: Bearer <токен>
+export const authHeaders = (headers = {}) => {
+  const token = getToken();
+  return token ? { ...headers, Authorization: `Bearer ${token}` } : headers;
+};